@@ -0,0 +1,47 @@
+"""
+Compares building a new pyproj Transformer for every call, as the projection helpers used to, with the
+shared transformer cache: cold (first call for a CRS pair; the first pair also opens the PROJ database)
+and warm cost per call, for the CRS pairs the app uses.
+
+Usage:
+    python -m benchmarks.crs_cache [calls]
+
+calls is the number of single-point transformations timed per CRS pair (default 200).
+"""
+import sys
+import time
+from pyproj import Transformer
+from utils.crs_cache import get_transformer, clear_crs_cache
+
+CRS_PAIRS = (
+    ('EPSG:4326', 'EPSG:3857', True),   # KML and drawn AOIs, 3DEP boundaries
+    ('EPSG:3857', 'EPSG:4326', True),   # Center of a DSM, for its UTM zone
+    ('EPSG:4326', 'EPSG:32618', False),  # KML boundaries onto a clipped DEM
+)
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def main(calls=200):
+    for source, target, always_xy in CRS_PAIRS:
+        point = (-74.0, 40.7) if source == 'EPSG:4326' else (-8238000.0, 4970000.0)
+        if source == 'EPSG:4326' and not always_xy:
+            point = point[::-1]
+
+        clear_crs_cache()
+        cold = per_call(lambda: get_transformer(source, target, always_xy).transform(*point), 1)
+        uncached = per_call(lambda: Transformer.from_crs(source, target, always_xy=always_xy).transform(*point), calls)
+        warm = per_call(lambda: get_transformer(source, target, always_xy).transform(*point), calls)
+        print(f"{source} -> {target} (always_xy={always_xy}): uncached {uncached * 1e3:7.3f} ms, "
+              f"cached cold {cold * 1e3:7.3f} ms, warm {warm * 1e3:7.3f} ms ({uncached / warm:.0f}x faster)")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        sys.exit(__doc__)
+    main(*(int(arg) for arg in sys.argv[1:2]))
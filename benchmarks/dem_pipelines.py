@@ -0,0 +1,68 @@
+"""
+Compares two ways of writing the DSM and DTM of an AOI from a local EPT dataset:
+
+    three-pass  build_pdal_pipeline, then make_DEM_pipeline for the DSM and for the DTM, each reading
+                the source again
+    streamed    what generate_DSM_DTM runs: one streamed read into a LAZ file (build_pdal_pipeline),
+                then the DSM and DTM streamed from it (make_DSM_DTM_pipelines_from_file)
+
+Each flow runs in a fresh process, so its peak RSS is reported along with its wall time.
+
+Usage:
+    python -m benchmarks.dem_pipelines <ept_root> <dataset_name> <aoi_wkt_epsg3857> [resolution]
+
+ept_root is a directory (or URL) holding <dataset_name>/ept.json, standing in for the USGS bucket.
+"""
+import os
+import sys
+import time
+import resource
+import tempfile
+from pvsyst_canopy.pvsyst_canopy import (build_pdal_pipeline, make_DEM_pipeline, make_DSM_DTM_pipelines_from_file,
+                                         execute_pipeline)
+from utils.process_pool import spawn_pool
+
+
+def flow_pipelines(flow, ept_root, dataset_name, aoi_wkt, resolution, out_dir):
+    common = dict(filterNoise=True, reclassify=False, outCRS=3857, ept_root=ept_root,
+                  pc_outName=os.path.join(out_dir, f'{flow}_pointcloud'), pc_outType='laz')
+    if flow == 'three-pass':
+        return [
+            build_pdal_pipeline(aoi_wkt, [dataset_name], resolution, savePointCloud=False, **common),
+            make_DEM_pipeline(aoi_wkt, [dataset_name], resolution, resolution, savePointCloud=True, demType='dsm',
+                              dem_outName=os.path.join(out_dir, 'three_pass_dsm'), **common),
+            make_DEM_pipeline(aoi_wkt, [dataset_name], resolution, resolution, savePointCloud=True, demType='dtm',
+                              dem_outName=os.path.join(out_dir, 'three_pass_dtm'), **common),
+        ]
+    return [
+        build_pdal_pipeline(aoi_wkt, [dataset_name], resolution, savePointCloud=True, **common),
+        *make_DSM_DTM_pipelines_from_file(f"{common['pc_outName']}.laz", resolution,
+                                          dsm_outName=os.path.join(out_dir, 'streamed_dsm'),
+                                          dtm_outName=os.path.join(out_dir, 'streamed_dtm')),
+    ]
+
+
+def time_flow(*args):
+    """Runs one flow's pipelines in order; returns wall time, points processed and peak RSS in MB."""
+    start = time.perf_counter()
+    points = 0
+    for pipeline in flow_pipelines(*args):
+        points += execute_pipeline(pipeline) or 0
+    return time.perf_counter() - start, points, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(ept_root, dataset_name, aoi_wkt, resolution=2.0):
+    with tempfile.TemporaryDirectory() as out_dir:
+        for flow in ('three-pass', 'streamed'):
+            with spawn_pool(1) as pool:
+                seconds, points, peak_mb = pool.submit(time_flow, flow, ept_root, dataset_name, aoi_wkt,
+                                                       resolution, out_dir).result()
+            rate = points / seconds if seconds else 0
+            print(f"{flow:>10}: {seconds:8.2f} s, {points} points processed, {rate:,.0f} points/s, "
+                  f"peak RSS {peak_mb:,.0f} MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2], sys.argv[3], *(float(arg) for arg in sys.argv[4:5]))
@@ -0,0 +1,59 @@
+"""
+Compares ASCII and binary DXF output of the mesh and points writers on a synthetic terrain grid:
+write time, file size and the time ezdxf takes to read the file back.
+
+Usage:
+    python -m benchmarks.dxf_formats [grid_size] [mesh_format]
+
+grid_size is the number of points per side (default 500, i.e. 250,000 points and about 500,000
+faces); mesh_format is one of 3dface, polyface or mesh (default 3dface).
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import numpy as np
+import ezdxf
+from terrain_processing.terrain_processing import create_dxf, create_dxf_mesh, create_grid_mesh
+
+
+def synthetic_grid(grid_size):
+    """Points of a 1 m grid over a smooth synthetic surface, and its valid-pixel mask."""
+    rows, cols = np.mgrid[0:grid_size, 0:grid_size].astype(np.float64)
+    z = 100 + 10 * np.sin(cols / 37.0) * np.cos(rows / 23.0) + 0.05 * cols
+    points = np.column_stack([500000 + cols.ravel(), 4000000 - rows.ravel(), z.ravel()])
+    return points, np.ones((grid_size, grid_size), dtype=bool)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main(grid_size=500, mesh_format='3dface'):
+    logging.disable(logging.INFO)  # ezdxf logs every header variable it reads
+    points, valid_mask = synthetic_grid(grid_size)
+    simplices = create_grid_mesh(valid_mask)
+    print(f"{len(points)} points, {len(simplices)} faces, mesh format {mesh_format}")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for output in ('mesh', 'points'):
+            for dxf_format in ('ascii', 'binary'):
+                path = os.path.join(out_dir, f'{output}_{dxf_format}.dxf')
+                binary = dxf_format == 'binary'
+                if output == 'mesh':
+                    write_seconds = timed(create_dxf_mesh, points, simplices, path, mesh_format=mesh_format,
+                                          binary=binary)
+                else:
+                    write_seconds = timed(create_dxf, points, path, binary=binary)
+                read_seconds = timed(ezdxf.readfile, path)
+                print(f"{output:>6} {dxf_format:>6}: write {write_seconds:7.2f} s, "
+                      f"{os.path.getsize(path) / 1024 ** 2:8.1f} MB, ezdxf read {read_seconds:7.2f} s")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        sys.exit(__doc__)
+    main(*(int(arg) for arg in sys.argv[1:2]), *sys.argv[2:3])
@@ -0,0 +1,59 @@
+"""
+Measures how tiled contouring scales with the number of worker processes on a synthetic DEM: wall
+time and speed-up over a single process for each worker count, next to one ContourGenerate pass
+over the whole raster.
+
+Usage:
+    python -m benchmarks.tiled_contours [raster_size] [tile_pixels] [interval]
+
+raster_size is the number of cells per side (default 8000), tile_pixels the tile side (default
+2048) and interval the contour interval in metres (default 0.5). Worker counts double from 1 up
+to the number of CPUs.
+"""
+import os
+import sys
+import time
+import numpy as np
+from osgeo import gdal
+from terrain_processing.terrain_processing import contour_dataset
+from terrain_processing.tiled_contours import tiled_contour_dataset
+
+
+def synthetic_dem(raster_size):
+    """In-memory DEM of a smooth synthetic surface on a 1 m grid."""
+    rows, cols = np.mgrid[0:raster_size, 0:raster_size].astype(np.float64)
+    z = 100 + 10 * np.sin(cols / 137.0) * np.cos(rows / 93.0) + 0.002 * cols
+    ds = gdal.GetDriverByName('MEM').Create('', raster_size, raster_size, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform((500000, 1, 0, 4000000, 0, -1))
+    ds.GetRasterBand(1).WriteArray(z)
+    return ds
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(raster_size=8000, tile_pixels=2048, interval=0.5):
+    ds = synthetic_dem(raster_size)
+    print(f"{raster_size}x{raster_size} cells, {tile_pixels} px tiles, {interval} m interval, {os.cpu_count()} CPUs")
+
+    seconds, contour_ds = timed(contour_dataset, ds, interval)
+    print(f"{'single pass':>12}: {seconds:8.2f} s, {contour_ds.GetLayer(0).GetFeatureCount()} lines")
+
+    baseline = None
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        seconds, contour_ds = timed(tiled_contour_dataset, ds, interval=interval, tile_pixels=tile_pixels,
+                                    workers=workers)
+        baseline = baseline or seconds
+        print(f"{workers:>4} workers: {seconds:8.2f} s, {contour_ds.GetLayer(0).GetFeatureCount()} lines, "
+              f"speed-up {baseline / seconds:5.2f}x")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        sys.exit(__doc__)
+    main(*(int(arg) for arg in sys.argv[1:3]), *(float(arg) for arg in sys.argv[3:4]))
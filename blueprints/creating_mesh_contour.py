@@ -1,12 +1,13 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify, url_for
 import os
-import io
-import zipfile
+import time
 import uuid
-from utils.temp_file_handler import create_temp_dir, create_output_dir, clean_up_temp_dir, clean_up_output_dir, clean_up_all_temp_contents, get_first_word
-from terrain_processing.terrain_processing import (clip_raster, generate_contours, convert_shapefile_to_dxf, raster_to_points, read_csv, 
-                                create_dxf, create_mesh, create_dxf_mesh, data_to_dxf, merge_dxf_files)
-from utils.kml_utils import get_kml_data, transform_kml_data
+from terrain_processing.mesh_contour_job import run_mesh_contour_job
+from terrain_processing.terrain_processing import is_multiple
+from terrain_processing.dxf_writer import DXF_FORMATS
+from utils.point_formats import BINARY_POINT_FORMATS
+from utils.job_manager import JobManager, QueueFullError, JOBS_FOLDER
+from utils.zip_stream import zip_response, directory_files
 from utils.manual_logger import write_log  # Import the write_log function
 
 # Create a Blueprint for mesh and contour creation
@@ -15,6 +16,9 @@ mesh_contour_bp = Blueprint('mesh_contour', __name__, template_folder='templates
 UPLOAD_FOLDER = 'uploads/mesh_contour'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Processing runs in background jobs; worker count and queue depth come from the TERRAINXACT_JOB_* settings
+job_manager = JobManager(os.path.join(JOBS_FOLDER, 'mesh_contour'))
+
 @mesh_contour_bp.route('/data-processing')
 def index():
     return render_template('creating_mesh_contour.html')
@@ -40,6 +44,13 @@ def upload():
     dem_file_path = os.path.join(UPLOAD_FOLDER, dem_file_id)
     kml_file_path = os.path.join(UPLOAD_FOLDER, kml_file_id)
 
+    def reject(message, status=400):
+        # A request that is not queued never reaches the job's clean-up, so its uploads are removed here
+        for file_path in [dem_file_path, kml_file_path]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return message, status
+
     # Ensure files are available
     for file_path in [dem_file_path, kml_file_path]:
         if not os.path.exists(file_path):
@@ -50,165 +61,63 @@ def upload():
                 retry_count += 1
             if not os.path.exists(file_path):
                 write_log(f"File {file_path} still not found after waiting. Aborting operation.")
-                return f"File {file_path} not found.", 400
-
-    temp_dir = create_temp_dir()
-    output_dir = create_output_dir(temp_dir)
-    write_log(f"Temporary directory created at: {temp_dir}")
-    write_log(f"Output directory created at: {output_dir}")
-
-    base_filename = get_first_word(os.path.basename(kml_file_path))
-    
+                return reject(f"File {file_path} not found.")
+
+    output_options = request.form.getlist('output_options')
+    mesh_tolerance = request.form.get('mesh_tolerance', type=float)
+    contour_interval = request.form.get('contour_interval', type=float)
+    if contour_interval is None:
+        contour_interval = 1
+    elif contour_interval <= 0:
+        return reject("The contour interval must be greater than zero.")
+    major_interval = request.form.get('major_interval', type=float)
+    contour_tolerance = request.form.get('contour_tolerance', type=float)
+    if major_interval and not is_multiple(major_interval, contour_interval):
+        return reject("The major contour interval must be a multiple of the contour interval.")
+    contour_vertex_budget = request.form.get('contour_vertex_budget', type=int)
+    dxf_format = request.form.get('dxf_format', 'ascii')
+    if dxf_format not in DXF_FORMATS:
+        return reject(f"DXF format must be one of {', '.join(DXF_FORMATS)}.")
+    points_format = request.form.get('points_format', 'npy')
+    if points_format not in BINARY_POINT_FORMATS:
+        return reject(f"Point export format must be one of {', '.join(BINARY_POINT_FORMATS)}.")
     try:
-        clipped_dem_data = None
-        contour_shp_data = None
-        dxf_data = None
-        points_data = None
-        dxf_meters_path = None
-        dxf_mesh_path = None
-
-        if 'clipped_dem' in request.form.getlist('output_options'):
-            try:
-                write_log(f"Clipping the raster with dem_path: {dem_file_path} and kml_path: {kml_file_path}")
-                clipped_dem_data, tmp_dir = clip_raster(dem_file_path, kml_file_path)
-                write_log(f"Clipped DEM data created at: {tmp_dir}")
-            except Exception as e:
-                write_log(f"Error clipping raster: {str(e)}")
-        
-        if 'contours_shp' in request.form.getlist('output_options') and clipped_dem_data:
-            try:
-                contour_shp_data, tmp_dir = generate_contours(clipped_dem_data, tmp_dir, kml_file_path)
-                write_log(f"Contour shapefile data created at: {tmp_dir}")
-            except Exception as e:
-                write_log(f"Error generating contours: {str(e)}")
-        
-        if 'contours_dxf' in request.form.getlist('output_options') and contour_shp_data:
-            try:
-                dxf_data, tmp_dir = convert_shapefile_to_dxf(contour_shp_data, tmp_dir, kml_file_path)
-                write_log(f"DXF data created at: {tmp_dir}")
-            except Exception as e:
-                write_log(f"Error converting shapefile to DXF: {str(e)}")
-        
-        if 'pvsyst_csv' in request.form.getlist('output_options'):
-            try:
-                points_data, csv_path, tmp_dir = raster_to_points(clipped_dem_data, tmp_dir, kml_file_path)
-                write_log(f"PVSyst input CSV created at: {csv_path}")
-            except Exception as e:
-                write_log(f"Error generating PVSyst input CSV: {str(e)}")
-        
-        if 'points_dxf_meters' in request.form.getlist('output_options') and points_data:
-            try:
-                points_meters = read_csv(csv_path)
-                dxf_meters_path = os.path.join(output_dir, f"{base_filename}_3D_points.dxf")
-                create_dxf(points_meters, dxf_meters_path)
-                write_log(f"3D points DXF created at: {dxf_meters_path}")
-            except Exception as e:
-                write_log(f"Error creating 3D points DXF: {str(e)}")
-        
-        if 'mesh_dxf' in request.form.getlist('output_options') and points_data:
-            try:
-                dxf_mesh_path = os.path.join(output_dir, f"{base_filename}_Generated_Mesh.dxf")
-                simplices = create_mesh(points_meters)
-                create_dxf_mesh(points_meters, simplices, dxf_mesh_path)
-                write_log(f"Mesh DXF created at: {dxf_mesh_path}")
-            except Exception as e:
-                write_log(f"Error creating mesh DXF: {str(e)}")
-
-        try:
-            kml_data = get_kml_data(kml_file_path)
-            transformed_data = transform_kml_data(kml_data, dem_file_path)
-            boundary_dxf_path = os.path.join(output_dir, 'boundary.dxf')
-            data_to_dxf(transformed_data, boundary_dxf_path)
-            write_log(f"Boundary DXF created at: {boundary_dxf_path}")
-        except Exception as e:
-            write_log(f"Error processing KML data: {str(e)}")
-            boundary_dxf_path = None
-
-        merged_dxf_paths = []
-        if dxf_meters_path and boundary_dxf_path:
-            try:
-                merged_dxf_path = os.path.join(output_dir, f"{base_filename}_3D_points_merged.dxf")
-                merge_dxf_files(dxf_meters_path, boundary_dxf_path, merged_dxf_path)
-                merged_dxf_paths.append(merged_dxf_path)
-                write_log(f"Merged 3D points DXF created at: {merged_dxf_path}")
-            except Exception as e:
-                write_log(f"Error merging 3D points DXF with boundary DXF: {str(e)}")
-        
-        if dxf_data and boundary_dxf_path:
-            try:
-                merged_contours_dxf_path = os.path.join(output_dir, f"{base_filename}_contours_merged.dxf")
-                write_log("Merging contours DXF file with boundary DXF.")
-                write_log(f"Contour DXF file path: {dxf_data}")
-                write_log(f"Boundary DXF file path: {boundary_dxf_path}")
-                write_log(f"Merged contours DXF file path: {merged_contours_dxf_path}")
-
-                # Save the contour DXF data to a temporary file
-                contour_dxf_temp_path = os.path.join(output_dir, f"{base_filename}_contours_temp.dxf")
-                with open(contour_dxf_temp_path, 'wb') as contour_dxf_file:
-                    contour_dxf_file.write(dxf_data)
-                write_log(f"Contour DXF file saved temporarily at: {contour_dxf_temp_path}")
-
-                merge_dxf_files(contour_dxf_temp_path, boundary_dxf_path, merged_contours_dxf_path)
-                write_log(f"Merged contours DXF file saved at: {merged_contours_dxf_path}")
-
-                merged_dxf_paths.append(merged_contours_dxf_path)
-            except Exception as e:
-                write_log(f"Error merging contours DXF with boundary DXF: {str(e)}")
-
-        if dxf_mesh_path and boundary_dxf_path:
-            try:
-                merged_mesh_dxf_path = os.path.join(output_dir, f"{base_filename}_Generated_Mesh_merged.dxf")
-                merge_dxf_files(dxf_mesh_path, boundary_dxf_path, merged_mesh_dxf_path)
-                merged_dxf_paths.append(merged_mesh_dxf_path)
-                write_log(f"Merged mesh DXF created at: {merged_mesh_dxf_path}")
-            except Exception as e:
-                write_log(f"Error merging mesh DXF with boundary DXF: {str(e)}")
-
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w') as zipf:
-            if clipped_dem_data:
-                write_log("Adding clipped_dem.tif to zip")
-                zipf.writestr(f"{base_filename}_clipped_dem.tif", clipped_dem_data)
-            if contour_shp_data:
-                write_log("Adding contours-shape-file.shp to zip")
-                zipf.writestr(f"{base_filename}_shapefile.shp", contour_shp_data)
-            if points_data:
-                write_log("Adding pvsyst_shading_file.csv to zip")
-                zipf.writestr(f"{base_filename}_pvsyst_input.csv", points_data)
-            if boundary_dxf_path:
-                try:
-                    with open(boundary_dxf_path, 'rb') as f:
-                        boundary_dxf_data = f.read()
-                    zipf.writestr("boundary.dxf", boundary_dxf_data)
-                except Exception as e:
-                    write_log(f"Error adding boundary.dxf to zip: {str(e)}")
-            for merged_path in merged_dxf_paths:
-                try:
-                    write_log(f"Adding {merged_path} to zip")
-                    with open(merged_path, 'rb') as f:
-                        merged_data = f.read()
-                    zipf.writestr(os.path.basename(merged_path), merged_data)
-                except Exception as e:
-                    write_log(f"Error adding merged DXF to zip: {str(e)}")
-        zip_buffer.seek(0)
-
-        write_log("Returning the generated zip file")
-        kml_file_name = os.path.splitext(os.path.basename(kml_file_path))[0]
-        return send_file(zip_buffer, mimetype='application/zip', as_attachment=True, download_name=f'{kml_file_name}.zip')
-
-    except Exception as e:
-        write_log(f"Error in upload route: {str(e)}")
-        return "An error occurred during processing", 500
-
-    finally:
-        # Clean up the temporary directories
-        clean_up_output_dir(output_dir)
-        clean_up_temp_dir(temp_dir)
-        clean_up_all_temp_contents()
-        write_log("Cleaned up all temporary directories and files.")
-        # Remove uploaded files
-        os.remove(dem_file_path)
-        os.remove(kml_file_path)
+        job_id = job_manager.submit(run_mesh_contour_job, dem_file_path, kml_file_path, output_options,
+                                    mesh_tolerance=mesh_tolerance, contour_interval=contour_interval,
+                                    major_interval=major_interval, contour_tolerance=contour_tolerance,
+                                    contour_vertex_budget=contour_vertex_budget, dxf_format=dxf_format,
+                                    points_format=points_format)
+    except QueueFullError as e:
+        write_log(f"Rejected processing request: {str(e)}")
+        return reject(str(e), 503)
+
+    write_log(f"Queued mesh/contour job {job_id}")
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('mesh_contour.job_status', job_id=job_id),
+        'download_url': url_for('mesh_contour.job_download', job_id=job_id),
+    }), 202
+
+@mesh_contour_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    try:
+        status = job_manager.status(job_id)
+    except ValueError:
+        status = None
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job_id': job_id, **status})
+
+@mesh_contour_bp.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    try:
+        result_dir = job_manager.result_dir(job_id)
+    except ValueError:
+        result_dir = None
+    if result_dir is None:
+        return 'Job result not available', 404
+    # Zipped while it is sent, reading each output from disk in chunks
+    return zip_response(directory_files(result_dir), f'{job_id}.zip')
 
 
 if __name__ == "__main__":
@@ -1,22 +1,18 @@
-from flask import Blueprint, render_template, request, send_file, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, send_file, redirect, url_for, jsonify, Response, abort, stream_with_context
 import os
-import zipfile
+from concurrent.futures import as_completed
 from werkzeug.utils import secure_filename
-from pvsyst_canopy.pvsyst_canopy import (
-    import_shapefile_to_shapely,
-    get_3DEP_geojson,
-    get_utm_zone,
-    reproject_and_extract_xyz,
-    generate_canopy_model,
-    build_pdal_pipeline,
-    make_DEM_pipeline
-)
+from pvsyst_canopy.pvsyst_canopy import import_shapefile_to_shapely
+from pvsyst_canopy.catalog import get_catalog
+from pvsyst_canopy.shading_job import run_shading_aoi
 import json
-import pdal
 import geojson
 from shapely.ops import transform
 from shapely.geometry import shape
-from pyproj import Transformer
+from utils.zip_stream import zip_response, directory_files
+from utils.point_formats import POINT_FORMATS
+from utils.crs_cache import get_transformer
+from utils.process_pool import SpawnPool
 from utils.temp_file_handler import create_temp_dir, create_output_dir, clean_up_temp_dir, clean_up_output_dir, clean_up_all_temp_contents
 
 shading_bp = Blueprint('shading', __name__, template_folder='templates', url_prefix='/shading')
@@ -24,12 +20,15 @@ shading_bp = Blueprint('shading', __name__, template_folder='templates', url_pre
 UPLOAD_FOLDER = 'uploads/shading/'
 OUTPUT_FOLDER = 'outputs/shading/'
 ALLOWED_EXTENSIONS = {'kml'}
+ZIP_SUFFIX = '_output_files.zip'
+SHADING_WORKERS = int(os.environ.get('TERRAINXACT_SHADING_WORKERS', os.cpu_count() or 1))  # AOIs processed at the same time
 
 shading_bp.config = {}
 shading_bp.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 shading_bp.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 
 drawn_polygons = []  # Global list to store drawn polygons
+aoi_pool = SpawnPool(SHADING_WORKERS)  # Runs one AOI per task
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -71,8 +70,19 @@ def serve_kml_file(filename):
 
 @shading_bp.route('/outputs/<filename>')
 def uploaded_file(filename):
+    filename = secure_filename(filename)
     return send_file(os.path.join(shading_bp.config['OUTPUT_FOLDER'], filename))
 
+@shading_bp.route('/outputs/<run_id>/<filename>')
+def result_zip(run_id, filename):
+    # An AOI's <prefix>_output_files.zip is zipped on the fly from the result directory of its run
+    filename = secure_filename(filename)
+    if filename.endswith(ZIP_SUFFIX) and all(ch in '0123456789abcdef' for ch in run_id):
+        result_dir = os.path.join(shading_bp.config['OUTPUT_FOLDER'], filename[:-len(ZIP_SUFFIX)], run_id)
+        if os.path.isdir(result_dir):
+            return zip_response(directory_files(result_dir), filename)
+    abort(404)
+
 user_drawn_polygon = None
 
 @shading_bp.route('/add_polygon', methods=['POST'])
@@ -110,321 +120,87 @@ def add_polygon():
         print(f"Error in /add_polygon: {e}")
         return "Error adding polygon", 400
 
+def submit_aoi(*args, **kwargs):
+    return aoi_pool.submit(run_shading_aoi, *args, **kwargs)
+
+def collect_aois(filenames, polygons):
+    """
+    Returns (file_prefix, AOI_EPSG3857) for every uploaded KML, then every drawn polygon,
+    and a list of (file_prefix, error) for the AOIs that could not be read.
+    """
+    aois = []
+    errors = []
+    for filename in filenames:
+        # Extract the name without the extension to use as a prefix
+        file_prefix = os.path.splitext(filename)[0]
+        try:
+            print(f"Importing and projecting user's AOI for {filename}...")
+            user_AOI = import_shapefile_to_shapely(os.path.join(shading_bp.config['UPLOAD_FOLDER'], filename))
+            aois.append((file_prefix, user_AOI[-1][1]))
+        except Exception as e:
+            print(f"Error reading {filename}: {e}")
+            errors.append((file_prefix, str(e)))
+
+    # Create a transformer to convert the drawn polygons from EPSG:4326 to EPSG:3857
+    transformer = get_transformer("EPSG:4326", "EPSG:3857", always_xy=True)
+    for i, polygon in enumerate(polygons):
+        file_prefix = f"drawn_polygon_{i+1}"
+        user_AOI = shape(polygon['geometry'])  # Directly convert the GeoJSON to Shapely
+        aois.append((file_prefix, transform(transformer.transform, user_AOI)))
+    return aois, errors
+
 @shading_bp.route('/process', methods=['POST'])
 def process_files():
+    """
+    Runs every uploaded KML and drawn polygon as its own job in the AOI process pool and streams
+    one JSON line per AOI ({"name", "zip_file"} or {"name", "error"}) as soon as that AOI finishes.
+    AOIs no 3DEP dataset intersects get {"name", "error", "no_coverage": true} without being queued.
+    """
     global drawn_polygons  # Access the global list
-    try:
-        filenames = request.json.get('filenames', [])
-        zip_files = []
-
-        # First process KML files as before
-        for filename in filenames:
-            # Extract the name without the extension to use as a prefix
-            file_prefix = os.path.splitext(filename)[0]
-            filepath = os.path.join(shading_bp.config['UPLOAD_FOLDER'], filename)
-
-            # Step 1: Get the 3DEP GeoJSON data
-            print(f"Fetching 3DEP GeoJSON data for {filename}...")
-            geojsons_3DEP, names, urls, num_points, geometries_GCS, geometries_EPSG3857 = get_3DEP_geojson()
-
-            # Step 2: Import User's AOI and Project It
-            print(f"Importing and projecting user's AOI for {filename}...")
-            user_AOI = import_shapefile_to_shapely(filepath)
-            AOI_GCS = user_AOI[-1][0]
-            AOI_EPSG3857 = user_AOI[-1][1]
-
-            # Step 3: Identify Intersecting 3DEP Polygons
-            print(f"Identifying intersecting 3DEP polygons for {filename}...")
-            intersecting_polys = [
-                {
-                    'name': names[i],
-                    'geometry_gcs': geometries_GCS[i],
-                    'geometry_epsg3857': geom,
-                    'url': urls[i],
-                    'num_points': num_points[i]
-                }
-                for i, geom in enumerate(geometries_EPSG3857) if geom.intersects(AOI_EPSG3857)
-            ]
-
-            if not intersecting_polys:
-                print(f"No intersecting polygons found for {filename}. Skipping.")
-                continue
-
-            usgs_3dep_datasets = [poly['name'] for poly in intersecting_polys]
-            number_pts_est = [
-                int((AOI_EPSG3857.area / poly['geometry_epsg3857'].area) * poly['num_points']) for poly in intersecting_polys
-            ]
-
-            AOI_EPSG3857_wkt = AOI_EPSG3857.wkt
-            num_pts_est = sum(number_pts_est)
-
-            # Step 4: Set default resolution
-            pointcloud_resolution = 2.0
-
-            # Step 5: Build the PDAL pipeline
-            print(f"Building PDAL pipeline for LIDAR data for {filename}...")
-            pc_pipeline = build_pdal_pipeline(
-                AOI_EPSG3857_wkt,
-                usgs_3dep_datasets,
-                pointcloud_resolution,
-                filterNoise=True,
-                reclassify=False,
-                savePointCloud=False,
-                outCRS=3857,
-                pc_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_pointcloud_test'),
-                pc_outType='laz'
-            )
-
-            # Step 6: Execute the pipeline
-            print(f"Executing the PDAL pipeline for {filename}...")
-            pc_pipeline = pdal.Pipeline(json.dumps(pc_pipeline))
-            pc_pipeline.execute_streaming(chunk_size=1000000)
-
-            # Step 7: Generate DSM and DTM using the PDAL pipeline
-            print(f"Generating DSM and DTM for {filename}...")
-            dsm_pipeline = make_DEM_pipeline(
-                AOI_EPSG3857_wkt,
-                usgs_3dep_datasets,
-                pointcloud_resolution,
-                2.0,
-                filterNoise=True,
-                reclassify=False,
-                savePointCloud=True,
-                outCRS=3857,
-                pc_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_pointcloud_test'),
-                pc_outType='laz',
-                demType='dsm',
-                gridMethod='idw',
-                dem_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dsm'),
-                dem_outExt='tif',
-                driver="GTiff"
-            )
-            dsm_pipeline = pdal.Pipeline(json.dumps(dsm_pipeline))
-            dsm_pipeline.execute_streaming(chunk_size=1000000)
-
-            dtm_pipeline = make_DEM_pipeline(
-                AOI_EPSG3857_wkt,
-                usgs_3dep_datasets,
-                pointcloud_resolution,
-                2.0,
-                filterNoise=True,
-                reclassify=False,
-                savePointCloud=True,
-                outCRS=3857,
-                pc_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_pointcloud_test'),
-                pc_outType='laz',
-                demType='dtm',
-                gridMethod='idw',
-                dem_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dtm'),
-                dem_outExt='tif',
-                driver="GTiff"
-            )
-            dtm_pipeline = pdal.Pipeline(json.dumps(dtm_pipeline))
-            dtm_pipeline.execute_streaming(chunk_size=1000000)
-
-            # Step 8: Reproject DSM and DTM to UTM and extract X, Y, Z points
-            print(f"Reprojecting DSM and DTM to UTM and extracting XYZ points for {filename}...")
-            input_dsm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dsm.tif')
-            output_dsm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_reprojected_dsm_utm.tif')
-            output_csv_dsm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_points_dsm_utm.csv')
-
-            input_dtm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dtm.tif')
-            output_dtm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_reprojected_dtm_utm.tif')
-            output_csv_dtm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_points_dtm_utm.csv')
-
-            reproject_and_extract_xyz(input_dsm, output_dsm, output_csv_dsm)
-            reproject_and_extract_xyz(input_dtm, output_dtm, output_csv_dtm)
-
-            # Generate Canopy Model
-            print(f"Generating Canopy Model for {filename}...")
-            generate_canopy_model(
-                dsm_path=output_dsm,
-                dtm_path=output_dtm,
-                output_raster_path=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_canopy_height_elevated_only.tif'),
-                output_csv_path=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_canopy_heights_for_pvsyst.csv')
-            )
-
-            # Step 9: Zip the output files
-            print(f"Zipping output files for {filename}...")
-            zip_filename = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_output_files.zip')
-            with zipfile.ZipFile(zip_filename, 'w') as zipf:
-                for root, _, files in os.walk(shading_bp.config['OUTPUT_FOLDER']):
-                    for file in files:
-                        # Only include files with the prefixed KML name
-                        if (
-                            file.startswith(file_prefix) and
-                            file != f'{file_prefix}_output_files.zip' and
-                            'test_dtm' not in file and 'test_dsm' not in file and
-                            not file.endswith('.laz')
-                        ):
-                            zipf.write(os.path.join(root, file), arcname=file)
-
-            print(f"Process for {filename} completed successfully.")
-            zip_files.append(url_for('shading.uploaded_file', filename=f'{file_prefix}_output_files.zip'))
-
-        # Now process the drawn polygons separately
-        if drawn_polygons:
-            for i, polygon in enumerate(drawn_polygons):
-                file_prefix = f"drawn_polygon_{i+1}"
-        
-                # Convert the drawn polygon GeoJSON to a Shapely geometry
-                print(f"Processing drawn polygon {i+1}...")
-                print(f"File prefix for polygon {i+1}: {file_prefix}")
-                user_AOI = shape(polygon['geometry'])  # Directly convert the GeoJSON to Shapely
-                print(f"Shapely Object for drawn polygon {i+1}: {user_AOI}")
-
-                # Create a transformer to convert from EPSG:4326 to EPSG:3857
-                transformer = Transformer.from_crs("epsg:4326", "epsg:3857", always_xy=True)
-
-                # Apply the transformation to the Shapely geometry
-                AOI_EPSG3857 = transform(transformer.transform, user_AOI)
-                print(f"Transformed Shapely Object to EPSG:3857 for drawn polygon {i+1}: {AOI_EPSG3857}")
-        
-                # Perform the same processing steps as for the KML files
-                print(f"Fetching 3DEP GeoJSON data for drawn_polygon_{i+1}...")
-                geojsons_3DEP, names, urls, num_points, geometries_GCS, geometries_EPSG3857 = get_3DEP_geojson()
-        
-                print(f"Identifying intersecting 3DEP polygons for drawn_polygon_{i+1}...")
-                intersecting_polys = [
-                    {
-                        'name': names[j],
-                        'geometry_gcs': geometries_GCS[j],
-                        'geometry_epsg3857': geom,
-                        'url': urls[j],
-                        'num_points': num_points[j]
-                    }
-                    for j, geom in enumerate(geometries_EPSG3857) if geom.intersects(AOI_EPSG3857)
-                ]
-        
-                if not intersecting_polys:
-                    print(f"No intersecting polygons found for drawn_polygon_{i+1}. Skipping.")
-                    continue
-                
-                usgs_3dep_datasets = [poly['name'] for poly in intersecting_polys]
-                number_pts_est = [
-                    int((AOI_EPSG3857.area / poly['geometry_epsg3857'].area) * poly['num_points']) for poly in intersecting_polys
-                ]
-        
-                AOI_EPSG3857_wkt = AOI_EPSG3857.wkt
-                num_pts_est = sum(number_pts_est)
-        
-                # Repeat all processing steps for the drawn polygon
-                pointcloud_resolution = 2.0
-        
-                print(f"Building PDAL pipeline for LIDAR data for drawn_polygon_{i+1}...")
-                pc_pipeline = build_pdal_pipeline(
-                    AOI_EPSG3857_wkt,
-                    usgs_3dep_datasets,
-                    pointcloud_resolution,
-                    filterNoise=True,
-                    reclassify=False,
-                    savePointCloud=False,
-                    outCRS=3857,
-                    pc_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_pointcloud_test'),
-                    pc_outType='laz'
-                )
-        
-                print(f"Executing the PDAL pipeline for drawn_polygon_{i+1}...")
-                pc_pipeline = pdal.Pipeline(json.dumps(pc_pipeline))
-                pc_pipeline.execute_streaming(chunk_size=1000000)
-        
-                print(f"Generating DSM and DTM for drawn_polygon_{i+1}...")
-                dsm_pipeline = make_DEM_pipeline(
-                    AOI_EPSG3857_wkt,
-                    usgs_3dep_datasets,
-                    pointcloud_resolution,
-                    2.0,
-                    filterNoise=True,
-                    reclassify=False,
-                    savePointCloud=True,
-                    outCRS=3857,
-                    pc_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_pointcloud_test'),
-                    pc_outType='laz',
-                    demType='dsm',
-                    gridMethod='idw',
-                    dem_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dsm'),
-                    dem_outExt='tif',
-                    driver="GTiff"
-                )
-                dsm_pipeline = pdal.Pipeline(json.dumps(dsm_pipeline))
-                dsm_pipeline.execute_streaming(chunk_size=1000000)
-        
-                dtm_pipeline = make_DEM_pipeline(
-                    AOI_EPSG3857_wkt,
-                    usgs_3dep_datasets,
-                    pointcloud_resolution,
-                    2.0,
-                    filterNoise=True,
-                    reclassify=False,
-                    savePointCloud=True,
-                    outCRS=3857,
-                    pc_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_pointcloud_test'),
-                    pc_outType='laz',
-                    demType='dtm',
-                    gridMethod='idw',
-                    dem_outName=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dtm'),
-                    dem_outExt='tif',
-                    driver="GTiff"
-                )
-                dtm_pipeline = pdal.Pipeline(json.dumps(dtm_pipeline))
-                dtm_pipeline.execute_streaming(chunk_size=1000000)
-        
-                print(f"Reprojecting DSM and DTM to UTM and extracting XYZ points for drawn_polygon_{i+1}...")
-                input_dsm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dsm.tif')
-                output_dsm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_reprojected_dsm_utm.tif')
-                output_csv_dsm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_points_dsm_utm.csv')
-        
-                input_dtm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_test_dtm.tif')
-                output_dtm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_reprojected_dtm_utm.tif')
-                output_csv_dtm = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_points_dtm_utm.csv')
-        
-                reproject_and_extract_xyz(input_dsm, output_dsm, output_csv_dsm)
-                reproject_and_extract_xyz(input_dtm, output_dtm, output_csv_dtm)
-        
-                print(f"Generating Canopy Model for drawn_polygon_{i+1}...")
-                generate_canopy_model(
-                    dsm_path=output_dsm,
-                    dtm_path=output_dtm,
-                    output_raster_path=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_canopy_height_elevated_only.tif'),
-                    output_csv_path=os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_canopy_heights_for_pvsyst.csv')
-                )
-        
-                print(f"Zipping output files for drawn_polygon_{i+1}...")
-                zip_filename = os.path.join(shading_bp.config['OUTPUT_FOLDER'], f'{file_prefix}_output_files.zip')
-                with zipfile.ZipFile(zip_filename, 'w') as zipf:
-                    for root, _, files in os.walk(shading_bp.config['OUTPUT_FOLDER']):
-                        for file in files:
-                            if (
-                                file.startswith(file_prefix) and
-                                file != f'{file_prefix}_output_files.zip' and
-                                'test_dtm' not in file and 'test_dsm' not in file and
-                                not file.endswith('.laz')
-                            ):
-                                zipf.write(os.path.join(root, file), arcname=file)
-
-                print(f"Process for drawn_polygon_{i+1} completed successfully.")
-                zip_files.append(url_for('shading.uploaded_file', filename=f'{file_prefix}_output_files.zip'))
-
-        # Clear the drawn polygons after processing
-        drawn_polygons = []
-
-        # Return the URLs for the zip files
-        return jsonify({"zip_files": zip_files})
+    filenames = request.json.get('filenames', [])
+    points_format = request.json.get('points_format', 'csv')
+    if points_format not in POINT_FORMATS:
+        return f"Point export format must be one of {', '.join(POINT_FORMATS)}.", 400
+    # Take the drawn polygons for this request and clear the list for the next one
+    polygons, drawn_polygons = drawn_polygons, []
 
+    try:
+        aois, errors = collect_aois(filenames, polygons)
+        # Loaded once per process from the local cache and revalidated against USGS when it expires
+        catalog = get_catalog()
     except Exception as e:
         print(f"Error occurred: {e}")
         return f"An error occurred: {str(e)}"
-    
-    # finally:
-    #     # Clean up the temporary directories
-    #     clean_up_output_dir(shading_bp.config['OUTPUT_FOLDER'])
-    #     clean_up_temp_dir(shading_bp.config['UPLOAD_FOLDER'])
-    #     clean_up_all_temp_contents()
-    #     print("Cleaned up all temporary directories and files.")
-    
-    #     # Remove uploaded files
-    #     for filename in filenames:
-    #         file_path = os.path.join(shading_bp.config['UPLOAD_FOLDER'], filename)
-    #         if os.path.exists(file_path):
-    #             os.remove(file_path)
 
+    futures = {}
+    no_coverage = []
+    for file_prefix, AOI_EPSG3857 in aois:
+        print(f"Identifying intersecting 3DEP polygons for {file_prefix}...")
+        usgs_3dep_datasets, num_pts_est = catalog.find_datasets(AOI_EPSG3857)
+        if not usgs_3dep_datasets:
+            print(f"No intersecting polygons found for {file_prefix}. Skipping.")
+            no_coverage.append(file_prefix)
+            continue
+        print(f"Queueing {file_prefix} (about {num_pts_est} points from {', '.join(usgs_3dep_datasets)})...")
+        future = submit_aoi(AOI_EPSG3857.wkt, usgs_3dep_datasets, file_prefix, shading_bp.config['OUTPUT_FOLDER'],
+                            points_format=points_format)
+        futures[future] = file_prefix
+
+    def stream_results():
+        for file_prefix, error in errors:
+            yield json.dumps({"name": file_prefix, "error": error}) + '\n'
+        for file_prefix in no_coverage:
+            yield json.dumps({"name": file_prefix, "error": "No 3DEP LiDAR data covers this AOI.",
+                              "no_coverage": True}) + '\n'
+        for future in as_completed(futures):
+            file_prefix = futures[future]
+            try:
+                run_id = os.path.basename(future.result())
+                zip_url = url_for('shading.result_zip', run_id=run_id, filename=f'{file_prefix}{ZIP_SUFFIX}')
+                result = {"name": file_prefix, "zip_file": zip_url}
+            except Exception as e:
+                print(f"Error processing {file_prefix}: {e}")
+                result = {"name": file_prefix, "error": str(e)}
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(stream_results()), mimetype='application/x-ndjson')
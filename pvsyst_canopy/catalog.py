@@ -0,0 +1,178 @@
+import os
+import io
+import json
+import time
+import threading
+import numpy as np
+import requests
+import shapely
+from shapely.geometry import shape
+from utils.crs_cache import get_transformer
+
+# The USGS 3DEP boundary index; TERRAINXACT_3DEP_BOUNDARIES may point to a URL or to a local copy of the file
+BOUNDARIES_SOURCE = os.environ.get(
+    'TERRAINXACT_3DEP_BOUNDARIES',
+    'https://raw.githubusercontent.com/hobuinc/usgs-lidar/master/boundaries/resources.geojson')
+CATALOG_FOLDER = os.environ.get('TERRAINXACT_3DEP_CACHE', os.path.join('cache', '3dep'))
+CATALOG_TTL_SECONDS = int(os.environ.get('TERRAINXACT_3DEP_TTL_SECONDS', 24 * 3600))  # Age at which the source is revalidated
+
+CATALOG_FILE = 'boundaries.npz'
+META_FILE = 'boundaries.json'
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+class BoundaryCatalog:
+    """
+    The 3DEP dataset boundaries in EPSG:3857 with an STRtree over them.
+
+    Built once per process by get_catalog() from the on-disk cache, so finding the datasets under
+    an AOI is a tree query instead of downloading and reprojecting every boundary per request.
+    """
+
+    def __init__(self, names, urls, counts, geometries, checked):
+        self.names = names
+        self.urls = urls
+        self.counts = counts
+        self.geometries = geometries  # EPSG:3857
+        self.areas = shapely.area(geometries)
+        self.checked = checked  # Time the source was last fetched or revalidated
+        self.tree = shapely.STRtree(geometries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def intersecting(self, AOI_EPSG3857):
+        """Returns the indices, in catalog order, of the boundaries that intersect the AOI."""
+        return np.sort(self.tree.query(AOI_EPSG3857, predicate='intersects'))
+
+    def find_datasets(self, AOI_EPSG3857):
+        """
+        Finds the 3DEP datasets whose boundaries intersect the AOI.
+
+        Returns:
+            usgs_3dep_datasets (list): Names of the intersecting datasets
+            num_pts_est (int): Estimated number of points inside the AOI
+        """
+        indices = self.intersecting(AOI_EPSG3857)
+        num_pts_est = sum(int((AOI_EPSG3857.area / self.areas[i]) * self.counts[i]) for i in indices.tolist())
+        return self.names[indices].tolist(), num_pts_est
+
+
+def get_catalog(source=BOUNDARIES_SOURCE, catalog_folder=CATALOG_FOLDER, ttl_seconds=CATALOG_TTL_SECONDS):
+    """
+    Returns the process-wide boundary catalog, loading it on first use.
+
+    The catalog is kept in catalog_folder in a compact binary form. Once it is older than ttl_seconds the
+    source is revalidated (ETag for URLs, modification time for local files) and only re-parsed if it changed.
+    If the source cannot be reached, the cached copy keeps being used.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None or time.time() - _catalog.checked > ttl_seconds:
+            _catalog = load_catalog(source, catalog_folder, ttl_seconds)
+        return _catalog
+
+
+def load_catalog(source, catalog_folder, ttl_seconds):
+    catalog_path = os.path.join(catalog_folder, CATALOG_FILE)
+    meta = _read_meta(catalog_folder)
+    cached = os.path.exists(catalog_path) and meta.get('source') == source
+
+    if cached and time.time() - meta.get('checked', 0) <= ttl_seconds:
+        return _read_catalog(catalog_path, meta['checked'])
+
+    try:
+        content, tag = fetch_source(source, meta.get('tag') if cached else None)
+    except (OSError, requests.RequestException) as e:
+        if not cached:
+            raise
+        print(f"Could not revalidate the 3DEP boundaries ({e}); using the cached copy.")
+        return _read_catalog(catalog_path, time.time())
+
+    checked = time.time()
+    if content is None:
+        _write_meta(catalog_folder, source=source, tag=tag, checked=checked)
+        return _read_catalog(catalog_path, checked)
+
+    names, urls, counts, geometries = parse_boundaries(content)
+    _write_catalog(catalog_path, names, urls, counts, geometries)
+    _write_meta(catalog_folder, source=source, tag=tag, checked=checked)
+    return BoundaryCatalog(names, urls, counts, geometries, checked)
+
+
+def fetch_source(source, tag=None):
+    """
+    Fetches the boundary GeoJSON unless it still matches tag.
+
+    Returns:
+        content (bytes or None): The file contents, or None if it has not changed
+        tag (str): ETag of the URL, or modification time and size of a local file
+    """
+    if not source.startswith(('http://', 'https://')):
+        stat = os.stat(source)
+        new_tag = f'{stat.st_mtime_ns}-{stat.st_size}'
+        if new_tag == tag:
+            return None, tag
+        with open(source, 'rb') as f:
+            return f.read(), new_tag
+
+    headers = {'If-None-Match': tag} if tag else {}
+    r = requests.get(source, headers=headers, timeout=60)
+    if r.status_code == 304:
+        return None, tag
+    r.raise_for_status()
+    return r.content, r.headers.get('ETag')
+
+
+def parse_boundaries(content):
+    """Parses the boundary GeoJSON once and projects every boundary to EPSG:3857 with a single transformer."""
+    features = json.loads(content)['features']
+    names = np.array([feature['properties']['name'] for feature in features])
+    urls = np.array([feature['properties']['url'] for feature in features])
+    counts = np.array([feature['properties']['count'] for feature in features], dtype=np.int64)
+    geometries = np.array([shape(feature['geometry']) for feature in features], dtype=object)
+
+    transformer = get_transformer("EPSG:4326", "EPSG:3857", always_xy=True)
+    geometries = shapely.transform(geometries, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+    return names, urls, counts, geometries
+
+
+def _read_catalog(catalog_path, checked):
+    with np.load(catalog_path) as data:
+        wkb = data['wkb'].tobytes()
+        offsets = data['wkb_offsets']
+        geometries = shapely.from_wkb([wkb[start:end] for start, end in zip(offsets[:-1], offsets[1:])])
+        return BoundaryCatalog(data['names'], data['urls'], data['counts'], geometries, checked)
+
+
+def _write_catalog(catalog_path, names, urls, counts, geometries):
+    wkb = shapely.to_wkb(geometries)
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in wkb], out=offsets[1:])
+    buffer = io.BytesIO()
+    np.savez(buffer, names=names, urls=urls, counts=counts,
+             wkb=np.frombuffer(b''.join(wkb), dtype=np.uint8), wkb_offsets=offsets)
+    _replace_file(catalog_path, buffer.getvalue())
+
+
+def _read_meta(catalog_folder):
+    try:
+        with open(os.path.join(catalog_folder, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(catalog_folder, **meta):
+    _replace_file(os.path.join(catalog_folder, META_FILE), json.dumps(meta).encode('utf-8'))
+
+
+def _replace_file(path, content):
+    # Written to a temporary file and renamed so other processes never read a partial catalog
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import threading
+import shapely
+from pvsyst_canopy.pvsyst_canopy import (
+    EPT_ROOT,
+    build_pdal_pipeline,
+    make_DSM_DTM_pipelines_from_file,
+    execute_pipeline
+)
+from utils.disk_cache import DiskCache, cache_key, link_file
+
+POINTCLOUD_CACHE_FOLDER = os.environ.get('TERRAINXACT_POINTCLOUD_CACHE', os.path.join('cache', 'pointclouds'))
+POINTCLOUD_CACHE_BYTES = int(os.environ.get('TERRAINXACT_POINTCLOUD_CACHE_BYTES', 20 * 1024 ** 3))  # Size at which the least recently used point clouds are evicted
+
+POINTCLOUD_FILE = 'points'  # Saved as points.laz
+META_FILE = 'meta.json'
+
+_pointcloud_cache = None
+_aoi_index = {}  # Cache key -> (bounds, AOI) of the cached point clouds whose meta.json this process has read
+_aoi_index_lock = threading.Lock()
+
+
+def get_pointcloud_cache():
+    """Returns the process-wide point cloud cache, creating it on first use."""
+    global _pointcloud_cache
+    if _pointcloud_cache is None:
+        _pointcloud_cache = DiskCache(POINTCLOUD_CACHE_FOLDER, POINTCLOUD_CACHE_BYTES)
+    return _pointcloud_cache
+
+
+def pointcloud_params(usgs_3dep_datasets, pc_resolution, filterNoise, reclassify, outCRS, ept_root):
+    """Everything besides the AOI that decides which points a pipeline reads."""
+    return {
+        'datasets': sorted(usgs_3dep_datasets),
+        'resolution': float(pc_resolution),
+        'filterNoise': bool(filterNoise),
+        'reclassify': bool(reclassify),
+        'outCRS': int(outCRS),
+        'ept_root': ept_root,
+    }
+
+
+def pointcloud_key(params, AOI_EPSG3857):
+    """
+    Cache key of a point cloud: a hash of the parameters followed by a hash of the normalized AOI,
+    so all point clouds read with the same parameters share a key prefix.
+    """
+    aoi_hash = hashlib.sha256(shapely.to_wkb(shapely.normalize(AOI_EPSG3857))).hexdigest()
+    return f"{cache_key(params)[:32]}_{aoi_hash[:32]}"
+
+
+def _cached_aoi(cache, key):
+    """Bounds and AOI a cached point cloud was saved for, read from its meta.json once per process; None if evicted."""
+    with _aoi_index_lock:
+        indexed = _aoi_index.get(key)
+    if indexed is None:
+        try:
+            with open(os.path.join(cache.entry_dir(key), META_FILE)) as f:
+                aoi = shapely.from_wkt(json.load(f)['aoi'])
+        except (OSError, ValueError, KeyError):
+            return None  # Evicted meanwhile
+        shapely.prepare(aoi)
+        indexed = (aoi.bounds, aoi)
+        with _aoi_index_lock:
+            _aoi_index[key] = indexed
+    return indexed
+
+
+def _covers_bounds(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def checkout_pointcloud(cache, key, work_dir):
+    """
+    Links (or copies) the point cloud of cache entry key into work_dir, so it stays readable even if
+    the entry is evicted while the DEMs are written. Returns its path, or None if the entry is gone.
+    """
+    pc_filename = os.path.join(work_dir, f'{POINTCLOUD_FILE}.laz')
+    try:
+        link_file(os.path.join(cache.entry_dir(key), f'{POINTCLOUD_FILE}.laz'), pc_filename)
+    except FileNotFoundError:
+        return None
+    return pc_filename
+
+
+def find_cached_pointcloud(cache, params, AOI_EPSG3857, work_dir):
+    """
+    Finds a cached point cloud holding every point of the AOI: the one saved for this exact AOI or,
+    failing that, the smallest one saved with the same parameters for an AOI covering it. The point
+    cloud is checked out into work_dir with checkout_pointcloud.
+
+    Saved AOIs are kept in a per-process index, so each meta.json is parsed once, and only the AOIs
+    whose bounds contain the AOI's bounds are tested for covering it.
+
+    Returns:
+        pc_filename (str or None): Path of the point cloud in work_dir
+        exact (bool): True if it was saved for this exact AOI, so it needs no cropping
+    """
+    key = pointcloud_key(params, AOI_EPSG3857)
+    if cache.lookup(key, count=False):
+        pc_filename = checkout_pointcloud(cache, key, work_dir)
+        if pc_filename:
+            cache.record(True)
+            return pc_filename, True
+
+    params_prefix = key.split('_')[0] + '_'
+    keys = cache.keys(params_prefix)
+    with _aoi_index_lock:
+        for evicted in set(indexed_key for indexed_key in _aoi_index if indexed_key.startswith(params_prefix)) - set(keys):
+            del _aoi_index[evicted]
+
+    bounds = AOI_EPSG3857.bounds
+    covering = []
+    for other_key in keys:
+        indexed = _cached_aoi(cache, other_key)
+        if indexed is not None and _covers_bounds(indexed[0], bounds) and indexed[1].covers(AOI_EPSG3857):
+            covering.append((indexed[1].area, other_key))
+    for _, other_key in sorted(covering):  # The smallest one leaves the fewest points to crop away
+        pc_filename = checkout_pointcloud(cache, other_key, work_dir)
+        if pc_filename:
+            cache.touch(other_key)
+            cache.record(True)
+            return pc_filename, False
+    cache.record(False)
+    return None, False
+
+
+def generate_DSM_DTM(AOI_EPSG3857_wkt, usgs_3dep_datasets, pc_resolution, dem_resolution, dsm_outName, dtm_outName,
+                     filterNoise=True, reclassify=False, outCRS=3857, gridMethod='idw', dem_outExt='tif',
+                     driver="GTiff", ept_root=EPT_ROOT, cache=None):
+    """
+    Writes the DSM and DTM of an AOI, reading its points from the local point cloud cache when a
+    previous run already fetched them and from the EPT source otherwise. A fresh read saves the
+    filtered points to the cache as LAZ for later runs over the same or a smaller AOI.
+    Every pipeline is linear, so PDAL streams it in chunks; only reclassify, whose SMRF ground filter
+    needs every point at once, runs the read in memory.
+
+    Returns:
+        cached (bool): True if the points came from the cache
+    """
+    cache = cache or get_pointcloud_cache()
+    AOI_EPSG3857 = shapely.from_wkt(AOI_EPSG3857_wkt)
+    params = pointcloud_params(usgs_3dep_datasets, pc_resolution, filterNoise, reclassify, outCRS, ept_root)
+    dem_options = dict(gridMethod=gridMethod, dsm_outName=dsm_outName, dtm_outName=dtm_outName,
+                       dem_outExt=dem_outExt, driver=driver)
+
+    # A cached point cloud is checked out next to the DEMs
+    pc_filename, exact = find_cached_pointcloud(cache, params, AOI_EPSG3857, os.path.dirname(dsm_outName) or '.')
+    if pc_filename:
+        print(f"Reading the point cloud from the local cache ({pc_filename})...")
+        for pipeline in make_DSM_DTM_pipelines_from_file(
+                pc_filename, dem_resolution, extent_epsg3857=None if exact else AOI_EPSG3857_wkt, **dem_options):
+            execute_pipeline(pipeline)
+        return True
+
+    with cache.store(pointcloud_key(params, AOI_EPSG3857)) as entry_dir:
+        # One streamed read of the source into the cache, then the DSM and DTM are streamed from the local file
+        pc_outName = os.path.join(entry_dir, POINTCLOUD_FILE)
+        execute_pipeline(build_pdal_pipeline(
+            AOI_EPSG3857_wkt,
+            usgs_3dep_datasets,
+            pc_resolution,
+            filterNoise=filterNoise,
+            reclassify=reclassify,
+            savePointCloud=True,
+            outCRS=outCRS,
+            pc_outName=pc_outName,
+            pc_outType='laz',
+            ept_root=ept_root
+        ))
+        for pipeline in make_DSM_DTM_pipelines_from_file(f'{pc_outName}.laz', dem_resolution, **dem_options):
+            execute_pipeline(pipeline)
+        with open(os.path.join(entry_dir, META_FILE), 'w') as f:
+            json.dump({'aoi': AOI_EPSG3857_wkt, **params}, f)
+    return False
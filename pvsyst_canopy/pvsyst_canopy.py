@@ -12,17 +12,25 @@ import numpy as np
 import os
 from osgeo import gdal
 import pdal
-import pyproj
-from pyproj import Transformer
-import requests
 import rasterio
 from shapely.geometry import shape, Point, Polygon
 from shapely.ops import transform
-import xarray as xr
 import rioxarray as rio
-from rasterio.warp import calculate_default_transform, reproject, Resampling
-import csv
+from rasterio.warp import calculate_default_transform, Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
 import logging
+from contextlib import ExitStack
+from utils.point_formats import write_points
+from utils.crs_cache import get_transformer
+
+
+# Root of the USGS 3DEP Entwine Point Tile datasets; TERRAINXACT_EPT_ROOT may point to a local copy instead
+EPT_ROOT = os.environ.get('TERRAINXACT_EPT_ROOT', 'https://s3-us-west-2.amazonaws.com/usgs-lidar-public')
+WINDOW_PIXELS = int(os.environ.get('TERRAINXACT_WINDOW_PIXELS', 1 << 20))  # Pixels read per raster window
+WARP_THREADS = os.environ.get('TERRAINXACT_WARP_THREADS', 'ALL_CPUS')  # GDAL warper threads
+CANOPY_MEMORY_BYTES = int(os.environ.get('TERRAINXACT_CANOPY_MEMORY_BYTES', 256 * 1024 ** 2))  # Peak working memory of the canopy model
+CANOPY_BYTES_PER_PIXEL = 96  # Working bytes per pixel of a canopy window: both inputs, the mask and the points with their CSV text
 
 
 # Set the logging level for rasterio to WARNING to suppress debug messages
@@ -43,10 +51,8 @@ def proj_to_3857(poly, orig_crs):
         user_poly_proj4326 (shapely polygon): User AOI in EPSG 4326
         user_poly_proj3857 (shapely polygon): User AOI in EPSG 3857
     """
-    wgs84 = pyproj.CRS("EPSG:4326")
-    web_mercator = pyproj.CRS("EPSG:3857")
-    project_gcs = pyproj.Transformer.from_crs(orig_crs, wgs84, always_xy=True).transform
-    project_wm = pyproj.Transformer.from_crs(orig_crs, web_mercator, always_xy=True).transform
+    project_gcs = get_transformer(orig_crs, "EPSG:4326", always_xy=True).transform
+    project_wm = get_transformer(orig_crs, "EPSG:3857", always_xy=True).transform
     user_poly_proj4326 = transform(project_gcs, poly)
     user_poly_proj3857 = transform(project_wm, poly)
     return(user_poly_proj4326, user_poly_proj3857)
@@ -63,9 +69,7 @@ def gcs_to_proj(poly):
     Returns:
         user_poly_proj3857 (shapely polygon): User AOI in EPSG 3857
     """
-    wgs84 = pyproj.CRS("EPSG:4326")
-    web_mercator = pyproj.CRS("EPSG:3857")
-    project = pyproj.Transformer.from_crs(wgs84, web_mercator, always_xy=True).transform
+    project = get_transformer("EPSG:4326", "EPSG:3857", always_xy=True).transform
     user_poly_proj3857 = transform(project, poly)
     return(user_poly_proj3857)
 
@@ -141,7 +145,7 @@ def downsample_dem(dem):
 
 def build_pdal_pipeline(extent_epsg3857, usgs_3dep_dataset_names, pc_resolution, filterNoise=False,
                         reclassify=False, savePointCloud=True, outCRS=3857, pc_outName='filter_test', 
-                        pc_outType='laz'):
+                        pc_outType='laz', ept_root=EPT_ROOT):
     """
     Build pdal pipeline for requesting, processing, and saving point cloud data. Each processing step is a 'stage' 
     in the final pdal pipeline. Each stage is appended to the 'pointcloud_pipeline' object to produce the final pipeline.
@@ -150,7 +154,7 @@ def build_pdal_pipeline(extent_epsg3857, usgs_3dep_dataset_names, pc_resolution,
     # Basic pipeline which only accesses the 3DEP data
     readers = []
     for name in usgs_3dep_dataset_names:
-        url = f"https://s3-us-west-2.amazonaws.com/usgs-lidar-public/{name}/ept.json"
+        url = f"{ept_root}/{name}/ept.json"
         reader = {
             "type": "readers.ept",
             "filename": str(url),
@@ -194,20 +198,7 @@ def build_pdal_pipeline(extent_epsg3857, usgs_3dep_dataset_names, pc_resolution,
     pointcloud_pipeline['pipeline'].append(reprojection_stage)
     
     if savePointCloud:
-        if pc_outType == 'las':
-            savePC_stage = {
-                "type": "writers.las",
-                "filename": f"{pc_outName}.{pc_outType}",
-            }
-        elif pc_outType == 'laz':    
-            savePC_stage = {
-                "type": "writers.las",
-                "compression": "laszip",
-                "filename": f"{pc_outName}.{pc_outType}",
-            }
-        else:
-            raise Exception("pc_outType must be 'las' or 'laz'.")
-        pointcloud_pipeline['pipeline'].append(savePC_stage)
+        pointcloud_pipeline['pipeline'].append(point_cloud_writer_stage(pc_outName, pc_outType))
         
     return pointcloud_pipeline
 
@@ -215,7 +206,7 @@ def build_pdal_pipeline(extent_epsg3857, usgs_3dep_dataset_names, pc_resolution,
 def make_DEM_pipeline(extent_epsg3857, usgs_3dep_dataset_name, pc_resolution, dem_resolution,
                       filterNoise=True, reclassify=False, savePointCloud=False, outCRS=3857,
                       pc_outName='filter_test', pc_outType='laz', demType='dtm', gridMethod='idw', 
-                      dem_outName='dem_test', dem_outExt='tif', driver="GTiff"):
+                      dem_outName='dem_test', dem_outExt='tif', driver="GTiff", ept_root=EPT_ROOT):
     """
     Build pdal pipeline for creating a digital elevation model (DEM) product from the requested point cloud data.
     The user must specify whether a digital terrain model (DTM) or digital surface model (DSM) will be created,
@@ -223,33 +214,14 @@ def make_DEM_pipeline(extent_epsg3857, usgs_3dep_dataset_name, pc_resolution, de
     """
 
     dem_pipeline = build_pdal_pipeline(extent_epsg3857, usgs_3dep_dataset_name, pc_resolution,
-                                       filterNoise, reclassify, savePointCloud, outCRS, pc_outName, pc_outType)
+                                       filterNoise, reclassify, savePointCloud, outCRS, pc_outName, pc_outType,
+                                       ept_root)
     
     if demType == 'dsm':
-        dem_stage = {
-            "type": "writers.gdal",
-            "filename": f"{dem_outName}.{dem_outExt}",
-            "gdaldriver": driver,
-            "nodata": -9999,
-            "output_type": gridMethod,
-            "resolution": float(dem_resolution),
-            "gdalopts": "COMPRESS=LZW,TILED=YES,blockxsize=256,blockysize=256,COPY_SRC_OVERVIEWS=YES"
-        }
+        dem_stage = dem_writer_stage(f"{dem_outName}.{dem_outExt}", dem_resolution, gridMethod, driver)
     elif demType == 'dtm':
-        groundfilter_stage = {
-            "type": "filters.range",
-            "limits": "Classification[2:2]"
-        }
-        dem_pipeline['pipeline'].append(groundfilter_stage)
-        dem_stage = {
-            "type": "writers.gdal",
-            "filename": f"{dem_outName}.{dem_outExt}",
-            "gdaldriver": driver,
-            "nodata": -9999,
-            "output_type": gridMethod,
-            "resolution": float(dem_resolution),
-            "gdalopts": "COMPRESS=LZW,TILED=YES,blockxsize=256,blockysize=256,COPY_SRC_OVERVIEWS=YES"
-        }
+        dem_pipeline['pipeline'].append(ground_filter_stage())
+        dem_stage = dem_writer_stage(f"{dem_outName}.{dem_outExt}", dem_resolution, gridMethod, driver)
     else:
         raise Exception("demType must be 'dsm' or 'dtm'.")
         
@@ -258,27 +230,82 @@ def make_DEM_pipeline(extent_epsg3857, usgs_3dep_dataset_name, pc_resolution, de
     return dem_pipeline
 
 
-def get_3DEP_geojson(url='https://raw.githubusercontent.com/hobuinc/usgs-lidar/master/boundaries/resources.geojson'):
-    """
-    Downloads, processes, and projects 3DEP dataset polygons from a specified URL.
-    """
-    r = requests.get(url)
-    with open('resources.geojson', 'w') as f:
-        f.write(r.content.decode("utf-8"))
+def point_cloud_writer_stage(pc_outName, pc_outType='laz'):
+    """PDAL writers.las stage saving the point cloud as LAS or LAZ."""
+    if pc_outType == 'las':
+        return {
+            "type": "writers.las",
+            "filename": f"{pc_outName}.{pc_outType}",
+        }
+    elif pc_outType == 'laz':
+        return {
+            "type": "writers.las",
+            "compression": "laszip",
+            "filename": f"{pc_outName}.{pc_outType}",
+        }
+    else:
+        raise Exception("pc_outType must be 'las' or 'laz'.")
 
-    with open('resources.geojson', 'r') as f:
-        geojsons_3DEP = json.load(f)
 
-    df = gpd.read_file('resources.geojson')
-    names = df['name']
-    urls = df['url']
-    num_points = df['count']
+def ground_filter_stage():
+    """PDAL stage keeping only ground-classified points, used for DTMs."""
+    return {
+        "type": "filters.range",
+        "limits": "Classification[2:2]"
+    }
+
 
-    projected_geoms = [gcs_to_proj(geometry) for geometry in df['geometry']]
-    geometries_GCS = df['geometry']
-    geometries_EPSG3857 = gpd.GeoSeries(projected_geoms)
+def dem_writer_stage(filename, dem_resolution, gridMethod='idw', driver="GTiff"):
+    """PDAL writers.gdal stage gridding the incoming points into a DEM raster."""
+    return {
+        "type": "writers.gdal",
+        "filename": filename,
+        "gdaldriver": driver,
+        "nodata": -9999,
+        "output_type": gridMethod,
+        "resolution": float(dem_resolution),
+        "gdalopts": "COMPRESS=LZW,TILED=YES,blockxsize=256,blockysize=256,COPY_SRC_OVERVIEWS=YES"
+    }
 
-    return geojsons_3DEP, names, urls, num_points, geometries_GCS, geometries_EPSG3857
+
+def make_DSM_DTM_pipelines_from_file(pc_filename, dem_resolution, extent_epsg3857=None, gridMethod='idw',
+                                     dsm_outName='dsm_test', dtm_outName='dtm_test', dem_outExt='tif', driver="GTiff"):
+    """
+    Build the pdal pipelines writing the DSM and the DTM from a point cloud saved by build_pdal_pipeline.
+    The file already holds filtered, reprojected points; if extent_epsg3857 is given the points are
+    cropped to it first, for reusing a point cloud saved for a larger AOI.
+    Each pipeline is linear, so both stream the local file in chunks; reading it twice costs less
+    than one pipeline branching into both writers, which PDAL cannot stream and runs with every point
+    in memory.
+    """
+    def read_stages():
+        stages = [{"type": "readers.las", "filename": pc_filename}]
+        if extent_epsg3857 is not None:
+            stages.append({
+                "type": "filters.crop",
+                "polygon": str(extent_epsg3857),
+                "a_srs": "EPSG:3857"
+            })
+        return stages
+
+    dsm_stages = read_stages() + [dem_writer_stage(f"{dsm_outName}.{dem_outExt}", dem_resolution, gridMethod, driver)]
+    dtm_stages = read_stages() + [ground_filter_stage(),
+                                  dem_writer_stage(f"{dtm_outName}.{dem_outExt}", dem_resolution, gridMethod, driver)]
+    return [{"pipeline": dsm_stages}, {"pipeline": dtm_stages}]
+
+
+def execute_pipeline(pipeline, chunk_size=1000000):
+    """
+    Executes a pipeline dict, streaming it in chunks of chunk_size points when every stage supports
+    streaming and falling back to standard execution, with a warning, otherwise.
+    """
+    stages = pipeline['pipeline']
+    pipeline = pdal.Pipeline(json.dumps(pipeline))
+    if pipeline.streamable:
+        return pipeline.execute_streaming(chunk_size=chunk_size)
+    logging.warning("PDAL pipeline (%s) is not streamable; executing it with every point in memory",
+                    ', '.join(stage['type'] for stage in stages))
+    return pipeline.execute()
 
 
 def get_utm_zone(dsm_file):
@@ -288,7 +315,7 @@ def get_utm_zone(dsm_file):
     with rasterio.open(dsm_file) as src:
         original_crs = src.crs
         if not original_crs.is_geographic:
-            transformer = pyproj.Transformer.from_crs(original_crs, pyproj.CRS.from_epsg(4326), always_xy=True)
+            transformer = get_transformer(original_crs, "EPSG:4326", always_xy=True)
             lon, lat = transformer.transform(*src.xy(src.height // 2, src.width // 2, offset='center'))
         else:
             lon, lat = src.xy(src.height // 2, src.width // 2, offset='center')
@@ -301,81 +328,117 @@ def get_utm_zone(dsm_file):
         return epsg_code
 
 
-def reproject_and_extract_xyz(input_tif, output_tif, output_csv):
+def reproject_and_extract_xyz(input_tif, output_tif, output_points, window_pixels=WINDOW_PIXELS):
     """
-    Reprojects a raster file from EPSG:3857 to the appropriate UTM CRS, extracts X, Y, Z points, and saves them to a CSV file.
+    Reprojects a raster file from EPSG:3857 to the appropriate UTM CRS, extracts X, Y, Z points, and saves them to
+    output_points in the format its extension names (CSV, NPY, Parquet or LAZ).
+
+    The raster is warped through a WarpedVRT and read in windows of about window_pixels pixels, so only one
+    window is in memory at a time; the warp itself runs on WARP_THREADS threads. The reprojected raster is
+    written to output_tif window by window, or not at all if output_tif is None.
     """
+    utm_crs = get_utm_zone(input_tif)
     with rasterio.open(input_tif) as src:
-        utm_crs = get_utm_zone(input_tif)
         transform, width, height = calculate_default_transform(src.crs, utm_crs, src.width, src.height, *src.bounds)
-
-        kwargs = src.meta.copy()
-        kwargs.update({'crs': utm_crs, 'transform': transform, 'width': width, 'height': height})
-
-        with rasterio.open(output_tif, 'w', **kwargs) as dst:
-            for i in range(1, src.count + 1):
-                reproject(
-                    source=rasterio.band(src, i),
-                    destination=rasterio.band(dst, i),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=utm_crs,
-                    resampling=Resampling.nearest
-                )
-
-    with rasterio.open(output_tif) as dataset:
-        band = dataset.read(1)
-        xs, ys = np.meshgrid(np.arange(dataset.width), np.arange(dataset.height))
-        xs, ys = rasterio.transform.xy(dataset.transform, ys, xs)
-        zs = band.flatten()
-
-        xs, ys = np.array(xs).flatten(), np.array(ys).flatten()
-
-    with open(output_csv, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['X', 'Y', 'Z'])
-        for x, y, z in zip(xs, ys, zs):
-            if z != dataset.nodata:
-                writer.writerow([f"{x:.3f}", f"{y:.3f}", f"{z:.3f}"])
-
-
-def generate_canopy_model(dsm_path, dtm_path, output_raster_path, output_csv_path):
+        # A near-exact transformer keeps the warped pixels the same whatever the window size
+        with WarpedVRT(src, crs=utm_crs, transform=transform, width=width, height=height,
+                       resampling=Resampling.nearest, tolerance=1e-6, warp_extras={'NUM_THREADS': WARP_THREADS}) as vrt:
+            kwargs = src.meta.copy()
+            kwargs.update({'crs': utm_crs, 'transform': transform, 'width': width, 'height': height})
+            dst = rasterio.open(output_tif, 'w', **kwargs) if output_tif else None
+            try:
+                write_points(_warped_points(vrt, dst, window_pixels), output_points, srs=utm_crs,
+                             csv_row="{:.3f},{:.3f},{:.3f}\n")
+            finally:
+                if dst is not None:
+                    dst.close()
+
+
+def _warped_points(vrt, dst, window_pixels):
     """
-    Generates a canopy height model (CHM) with elevated terrain values and exports the results
-    as both a raster file and a CSV file with x, y, z coordinates.
+    Yields (xs, ys, zs) arrays of the valid pixels of the first band of a WarpedVRT, one window of whole rows
+    at a time, at pixel centers. Every window read is also written to dst if given.
     """
-    dsm = rio.open_rasterio(dsm_path, masked=True)
-    dtm = rio.open_rasterio(dtm_path, masked=True)
+    block_rows = vrt.block_shapes[0][0]
+    rows_per_window = max(block_rows, (window_pixels // max(vrt.width, 1)) // block_rows * block_rows)
+    t = vrt.transform
+    col_centers = np.arange(vrt.width, dtype=np.float64) + 0.5
+
+    for row_off in range(0, vrt.height, rows_per_window):
+        window = Window(0, row_off, vrt.width, min(rows_per_window, vrt.height - row_off))
+        values = vrt.read(window=window)
+        if dst is not None:
+            dst.write(values, window=window)
+        band = values[0]
+        valid = band != vrt.nodata if vrt.nodata is not None else np.ones(band.shape, dtype=bool)
+        rows, cols = np.nonzero(valid)
+        x, y = col_centers[cols], rows + (row_off + 0.5)
+        yield t.c + x * t.a + y * t.b, t.f + x * t.d + y * t.e, band[valid]
+
+
+def generate_canopy_model(dsm_path, dtm_path, output_raster_path, output_csv_path, output_points_path=None,
+                          memory_bytes=CANOPY_MEMORY_BYTES):
+    """
+    Generates a canopy height model (CHM) with elevated terrain values and exports the results
+    as both a raster file and a CSV file with x, y, z coordinates for PVsyst. The points are also
+    written to output_points_path, in the format its extension names, if given.
 
-    if dsm.shape != dtm.shape:
-        if dsm.shape > dtm.shape:
-            dsm = dsm.rio.reproject_match(dtm)
+    The DSM and DTM are walked in aligned windows of whole rows sized to stay within memory_bytes, so
+    the peak memory does not grow with the AOI (GDAL's block cache comes on top, bounded by GDAL_CACHEMAX).
+    If their shapes differ, the larger one is resampled onto the grid of the smaller one through a
+    WarpedVRT as it is read.
+    """
+    with ExitStack() as stack:
+        dsm = stack.enter_context(rasterio.open(dsm_path))
+        dtm = stack.enter_context(rasterio.open(dtm_path))
+        if dsm.shape != dtm.shape:
+            if dsm.shape > dtm.shape:
+                dsm = stack.enter_context(WarpedVRT(dsm, crs=dtm.crs, transform=dtm.transform, width=dtm.width,
+                                                    height=dtm.height, resampling=Resampling.nearest))
+            else:
+                dtm = stack.enter_context(WarpedVRT(dtm, crs=dsm.crs, transform=dsm.transform, width=dsm.width,
+                                                    height=dsm.height, resampling=Resampling.nearest))
+
+        dtype = np.result_type(dsm.dtypes[0], dtm.dtypes[0], np.float32)
+        dst = stack.enter_context(rasterio.open(output_raster_path, 'w', driver='GTiff', width=dtm.width,
+                                                height=dtm.height, count=1, dtype=dtype, crs=dtm.crs,
+                                                transform=dtm.transform, nodata=np.nan))
+        csv_file = stack.enter_context(open(output_csv_path, 'w', newline=''))
+        rows_per_window = max(1, memory_bytes // (CANOPY_BYTES_PER_PIXEL * max(dtm.width, 1)))
+        t = dtm.transform
+        col_centers = np.arange(dtm.width, dtype=np.float64) + 0.5
+
+        def canopy_points():
+            for row_off in range(0, dtm.height, rows_per_window):
+                window = Window(0, row_off, dtm.width, min(rows_per_window, dtm.height - row_off))
+                canopy, elevated = _elevated_canopy(dsm, dtm, window, dtype)
+                dst.write(canopy, 1, window=window)
+
+                rows, cols = np.nonzero(elevated)
+                x, y = col_centers[cols], rows + (row_off + 0.5)
+                xs, ys, zs = t.c + x * t.a + y * t.b, t.f + x * t.d + y * t.e, canopy[elevated]
+                pd.DataFrame({'X': xs, 'Y': ys, 'Z': zs}).to_csv(csv_file, header=row_off == 0, index=False)
+                yield xs, ys, zs
+
+        if output_points_path:
+            write_points(canopy_points(), output_points_path, srs=dtm.crs.to_wkt() if dtm.crs else None)
         else:
-            dtm = dtm.rio.reproject_match(dsm)
-
-    dsm = dsm.assign_coords({"x": dtm.x, "y": dtm.y})
-    chm = np.where(dsm - dtm < 0, 0, dsm - dtm)
-    chm_elevated = np.where(chm > 0, chm + dtm, np.nan)
-
-    chm_elevated_da = xr.DataArray(
-        chm_elevated,
-        coords={"y": dtm.y, "x": dtm.x},
-        dims=("band", "y", "x"),
-        name="canopy_height"
-    )
+            for _ in canopy_points():
+                pass
 
-    chm_elevated_da.rio.set_nodata(np.nan, inplace=True)
-    chm_elevated_da.rio.to_raster(output_raster_path)
 
-    x_coords, y_coords = np.meshgrid(chm_elevated_da.x.values, chm_elevated_da.y.values)
-    z_values = chm_elevated_da.values.flatten()
-
-    x_flat, y_flat = x_coords.flatten(), y_coords.flatten()
-    valid_mask = ~np.isnan(z_values)
-
-    df = pd.DataFrame({'X': x_flat[valid_mask], 'Y': y_flat[valid_mask], 'Z': z_values[valid_mask]})
-    df.to_csv(output_csv_path, index=False)
+def _elevated_canopy(dsm, dtm, window, dtype):
+    """
+    Reads one window of the DSM and DTM and computes, in the DSM buffer, the DSM where it stands above
+    the DTM and NaN elsewhere (including nodata). Returns the canopy and the mask of its valid pixels.
+    """
+    canopy = dsm.read(1, window=window, masked=True).astype(dtype).filled(np.nan)
+    terrain = dtm.read(1, window=window, masked=True).astype(dtype).filled(np.nan)
+    canopy -= terrain
+    elevated = canopy > 0
+    np.add(canopy, terrain, out=canopy, where=elevated)
+    canopy[~elevated] = np.nan
+    return canopy, elevated
 
 
 def geojson_to_shapely(geojson_data):
@@ -408,5 +471,5 @@ def transform_to_epsg3857(geometry):
     Returns:
     shapely.geometry.base.BaseGeometry: The geometry transformed to EPSG:3857.
     """
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+    transformer = get_transformer("EPSG:4326", "EPSG:3857", always_xy=True)
     return transform(transformer.transform, geometry)
@@ -0,0 +1,97 @@
+import os
+import time
+import uuid
+import shutil
+from pvsyst_canopy.pvsyst_canopy import reproject_and_extract_xyz, generate_canopy_model
+from pvsyst_canopy.pointcloud_cache import generate_DSM_DTM
+from utils.temp_file_handler import create_temp_dir, clean_up_temp_dir
+from utils.point_formats import POINT_EXTENSIONS
+
+# Age at which the outputs of earlier runs for the same AOI name are removed
+RESULT_TTL_SECONDS = int(os.environ.get('TERRAINXACT_SHADING_RESULT_TTL_SECONDS', 24 * 3600))
+
+
+def run_shading_aoi(AOI_EPSG3857_wkt, usgs_3dep_datasets, file_prefix, output_folder, pointcloud_resolution=2.0,
+                    dem_resolution=2.0, points_format='csv'):
+    """
+    Runs the LiDAR -> DSM/DTM -> UTM points -> canopy model chain for one AOI.
+
+    Intermediate rasters and point clouds are written to a temporary directory owned by this AOI, so
+    several AOIs can run side by side in separate processes without touching each other's files.
+    Only the outputs are moved to output_folder, into a directory of its own under one named after
+    file_prefix, so concurrent runs for the same KML never overwrite each other's outputs.
+
+    The DSM and DTM points are written as points_format (csv, npy, parquet or laz). The canopy points
+    are always written as the PVsyst CSV, and also as points_format if that is a binary format.
+
+    Returns:
+        result_dir (str): Directory holding the AOI's outputs
+    """
+    work_dir = create_temp_dir()
+    try:
+        # One read of the point cloud, from the local cache when possible, feeds both the DSM and the DTM
+        print(f"Generating DSM and DTM for {file_prefix}...")
+        generate_DSM_DTM(
+            AOI_EPSG3857_wkt,
+            usgs_3dep_datasets,
+            pointcloud_resolution,
+            dem_resolution,
+            dsm_outName=os.path.join(work_dir, f'{file_prefix}_test_dsm'),
+            dtm_outName=os.path.join(work_dir, f'{file_prefix}_test_dtm'),
+            filterNoise=True,
+            reclassify=False,
+            outCRS=3857,
+            gridMethod='idw'
+        )
+
+        print(f"Reprojecting DSM and DTM to UTM and extracting XYZ points for {file_prefix}...")
+        output_dsm = os.path.join(work_dir, f'{file_prefix}_reprojected_dsm_utm.tif')
+        output_dtm = os.path.join(work_dir, f'{file_prefix}_reprojected_dtm_utm.tif')
+        extension = POINT_EXTENSIONS[points_format]
+        point_files = [f'{file_prefix}_points_dsm_utm{extension}', f'{file_prefix}_points_dtm_utm{extension}']
+        if points_format != 'csv':
+            point_files.append(f'{file_prefix}_canopy_heights{extension}')
+        reproject_and_extract_xyz(os.path.join(work_dir, f'{file_prefix}_test_dsm.tif'), output_dsm,
+                                  os.path.join(work_dir, point_files[0]))
+        reproject_and_extract_xyz(os.path.join(work_dir, f'{file_prefix}_test_dtm.tif'), output_dtm,
+                                  os.path.join(work_dir, point_files[1]))
+
+        print(f"Generating Canopy Model for {file_prefix}...")
+        generate_canopy_model(
+            dsm_path=output_dsm,
+            dtm_path=output_dtm,
+            output_raster_path=os.path.join(work_dir, f'{file_prefix}_canopy_height_elevated_only.tif'),
+            output_csv_path=os.path.join(work_dir, f'{file_prefix}_canopy_heights_for_pvsyst.csv'),
+            output_points_path=os.path.join(work_dir, point_files[2]) if len(point_files) > 2 else None
+        )
+
+        # The outputs are kept in a directory per AOI and zipped while they are downloaded
+        print(f"Saving output files for {file_prefix}...")
+        purge_expired_results(os.path.join(output_folder, file_prefix))
+        result_dir = os.path.join(output_folder, file_prefix, uuid.uuid4().hex)
+        os.makedirs(result_dir)
+        for file in sorted(os.listdir(work_dir)):
+            # The point cloud read from 3DEP is left out, but LAZ point exports are kept
+            if file in point_files or ('test_dtm' not in file and 'test_dsm' not in file and not file.endswith('.laz')):
+                shutil.move(os.path.join(work_dir, file), os.path.join(result_dir, file))
+
+        print(f"Process for {file_prefix} completed successfully.")
+        return result_dir
+
+    finally:
+        clean_up_temp_dir(work_dir)
+
+
+def purge_expired_results(prefix_dir, ttl_seconds=RESULT_TTL_SECONDS):
+    """Removes the result directories under prefix_dir that are older than ttl_seconds."""
+    if not os.path.isdir(prefix_dir):
+        return
+    now = time.time()
+    for run_id in os.listdir(prefix_dir):
+        run_dir = os.path.join(prefix_dir, run_id)
+        try:
+            expired = now - os.path.getmtime(run_dir) > ttl_seconds
+        except OSError:
+            continue  # Removed by another run meanwhile
+        if expired:
+            shutil.rmtree(run_dir, ignore_errors=True)
@@ -140,25 +140,56 @@ $('#add-polygon').on('click', function () {
 
     // Process files handling
     $('#process-file').on('click', function () {
-        $.ajax({
-            url: '/shading/process',
-            type: 'POST',
-            contentType: 'application/json',
-            data: JSON.stringify({ filenames: window.filenames }), // Send all filenames
-            success: function (response) {
-                // Handle multiple zip file downloads
-                response.zip_files.forEach(function (zipFileUrl) {
-                    const a = document.createElement('a');
-                    a.href = zipFileUrl;
-                    a.download = zipFileUrl.split('/').pop(); // Extract zip filename
-                    document.body.appendChild(a);
-                    a.click();
-                    document.body.removeChild(a);
+        // The server streams one JSON line per AOI as it finishes; download each zip as soon as it arrives
+        function handleResult(line) {
+            if (!line.trim()) {
+                return;
+            }
+            const result = JSON.parse(line);
+            if (result.error) {
+                console.error('Error processing ' + result.name + ': ' + result.error);
+                return;
+            }
+            const a = document.createElement('a');
+            a.href = result.zip_file;
+            a.download = result.zip_file.split('/').pop(); // Extract zip filename
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+        }
+
+        fetch('/shading/process', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                filenames: window.filenames, // Send all filenames
+                points_format: document.getElementById('points-format').value
+            })
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            function read() {
+                return reader.read().then(function ({ done, value }) {
+                    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.forEach(handleResult);
+                    if (done) {
+                        handleResult(buffer);
+                        return;
+                    }
+                    return read();
                 });
-            },
-            error: function () {
-                alert('Error processing the files.');
             }
+            return read();
+        }).catch(function () {
+            alert('Error processing the files.');
+        }).finally(function () {
+            $('#progress-circle').hide();
         });
     });
 });
@@ -0,0 +1,83 @@
+import shapely
+from osgeo import ogr
+from terrain_processing.terrain_processing import create_contour_layer
+
+BUDGET_ITERATIONS = 16  # Bisection steps when searching for the tolerance that meets a vertex budget
+
+
+def simplify_lines(lines, tolerance):
+    """
+    Douglas-Peucker simplifies an array of contour lines as one collection, so the topology between
+    lines is preserved as well as within them: simplified contours never cross each other.
+    Returns the simplified lines in the same order.
+    """
+    if tolerance <= 0 or len(lines) == 0:
+        return lines
+    simplified = shapely.simplify(shapely.multilinestrings(lines), tolerance, preserve_topology=True)
+    return shapely.get_parts(simplified)
+
+
+def budget_tolerance(lines, vertex_budget, iterations=BUDGET_ITERATIONS):
+    """
+    Finds by bisection the smallest tolerance whose simplified lines have at most vertex_budget vertices.
+
+    The search simplifies each line on its own, which is about ten times faster than the
+    topology-preserving pass and keeps nearly the same vertices, so the budget is a close target
+    rather than a hard limit. Lines cannot drop below their end points either.
+    """
+    if shapely.get_num_coordinates(lines).sum() <= vertex_budget:
+        return 0.0
+    xmin, ymin, xmax, ymax = shapely.total_bounds(lines)
+    low, high = 0.0, max(xmax - xmin, ymax - ymin)
+    for _ in range(iterations):
+        tolerance = (low + high) / 2
+        if shapely.get_num_coordinates(shapely.simplify(lines, tolerance, preserve_topology=False)).sum() <= vertex_budget:
+            high = tolerance
+        else:
+            low = tolerance
+    return high
+
+
+def simplify_contour_dataset(contour_ds, input_ds, tolerance=None, vertex_budget=None, output_path='contours',
+                             driver='Memory'):
+    """
+    Simplifies the ID/elev/class contour layer of contour_ds into a new dataset with the same schema, with
+    either a tolerance in map units or the tolerance that brings the total vertex count within
+    vertex_budget. input_ds is the contoured raster, for the projection.
+
+    Returns:
+        simplified_ds: The new contour dataset
+        report (dict): Tolerance used, and vertices and geometry (WKB) bytes before and after
+    """
+    layer = contour_ds.GetLayer(0)
+    ids, elevs, classes, wkbs = [], [], [], []
+    for feature in layer:
+        ids.append(feature.GetField("ID"))
+        elevs.append(feature.GetField("elev"))
+        classes.append(feature.GetField("class"))
+        wkbs.append(bytes(feature.GetGeometryRef().ExportToIsoWkb()))
+    lines = shapely.from_wkb(wkbs)
+
+    if vertex_budget:
+        tolerance = budget_tolerance(lines, vertex_budget)
+    simplified = simplify_lines(lines, tolerance or 0)
+
+    simplified_ds, simplified_layer = create_contour_layer(input_ds, output_path, driver)
+    layer_defn = simplified_layer.GetLayerDefn()
+    simplified_wkbs = shapely.to_wkb(simplified, output_dimension=3)
+    for feature_id, elev, class_name, wkb in zip(ids, elevs, classes, simplified_wkbs):
+        feature = ogr.Feature(layer_defn)
+        feature.SetField("ID", feature_id)
+        feature.SetField("elev", elev)
+        feature.SetField("class", class_name)
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(wkb))
+        simplified_layer.CreateFeature(feature)
+
+    report = {
+        'tolerance': tolerance or 0,
+        'vertices_in': int(shapely.get_num_coordinates(lines).sum()),
+        'vertices_out': int(shapely.get_num_coordinates(simplified).sum()),
+        'bytes_in': sum(len(wkb) for wkb in wkbs),
+        'bytes_out': sum(len(wkb) for wkb in simplified_wkbs),
+    }
+    return simplified_ds, report
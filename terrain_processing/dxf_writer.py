@@ -0,0 +1,283 @@
+import io
+import numpy as np
+import ezdxf
+
+POLYFACE_MAX_FACES = 10922  # Keeps every polyface below the 32767 vertex index limit of group codes 71-74
+CHUNK_SIZE = 6 * POLYFACE_MAX_FACES  # Entities formatted per write when streaming from arrays
+HANDLE_RESERVE = 0x10000000  # Handles set aside for streamed entities
+BYLAYER = 256
+
+DXF_FORMATS = ('ascii', 'binary')
+
+_SECTION_START = "  0\nSECTION\n  2\nENTITIES\n"
+_SECTION_END = "  0\nENDSEC\n"
+_BINARY_SECTION_START = b"\x00\x00SECTION\x00\x02\x00ENTITIES\x00"
+_BINARY_SECTION_END = b"\x00\x00ENDSEC\x00"
+
+_HANDLE_CODES = (5, 330)  # Written from integer columns as hex strings
+
+
+def _binary_type(code):
+    """Value type a group code is stored as in a binary DXF (R13 and later)."""
+    if 10 <= code <= 59 or 110 <= code <= 149 or 210 <= code <= 239 or 460 <= code <= 469 or 1010 <= code <= 1059:
+        return '<f8'
+    if 60 <= code <= 79 or 170 <= code <= 179 or 270 <= code <= 289 or 370 <= code <= 389 or 400 <= code <= 409 \
+            or 1060 <= code <= 1070:
+        return '<i2'
+    if 90 <= code <= 99 or 420 <= code <= 429 or 440 <= code <= 459 or code == 1071:
+        return '<i4'
+    if 160 <= code <= 169:
+        return '<i8'
+    if 290 <= code <= 299:
+        return 'u1'
+    return 'S'
+
+
+def _ascii_records(fields, count):
+    """
+    Formats count records of fields, a list of (group code, value) where a value is a constant or
+    an array with one value per record, as ASCII DXF text chunks.
+    """
+    template = []
+    columns = []
+    for code, value in fields:
+        if isinstance(value, np.ndarray):
+            template.append(f"{code:>3}\n{{{len(columns)}{':X' if code in _HANDLE_CODES else ''}}}\n")
+            columns.append(value.tolist())
+        else:
+            template.append(f"{code:>3}\n{str(value).replace('{', '{{').replace('}', '}}')}\n")
+    template = ''.join(template)
+    if not columns:
+        return [template.format()] * count
+    return map(template.format, *columns)
+
+
+def _binary_records(fields, count):
+    """
+    Packs count records of fields, as _ascii_records takes them, into binary DXF bytes. Records
+    are laid out as a NumPy structured array, split where the length of a string column changes.
+    """
+    values = []
+    lengths = []
+    for code, value in fields:
+        value_type = _binary_type(code)
+        if value_type != 'S':
+            values.append((code, value_type, value))
+            continue
+        if isinstance(value, np.ndarray):
+            value = np.char.mod('%X', value) if code in _HANDLE_CODES else value.astype(str)
+            value = np.char.encode(value, 'utf-8')
+            lengths.append(np.char.str_len(value))
+        else:
+            value = str(value).encode('utf-8')
+        values.append((code, 'S', value))
+
+    # Handles grow in length now and then; every run of records with equal string lengths is one array
+    breaks = [0, count]
+    if lengths:
+        changes = np.flatnonzero(np.any(np.diff(np.stack(lengths), axis=1) != 0, axis=0)) + 1
+        breaks = [0, *changes.tolist(), count]
+
+    chunks = []
+    for start, stop in zip(breaks[:-1], breaks[1:]):
+        dtype = []
+        for i, (code, value_type, value) in enumerate(values):
+            if value_type == 'S':
+                size = len(value[start]) if isinstance(value, np.ndarray) else len(value)
+                value_type = f'S{size + 1}'  # Null-terminated
+            dtype += [(f'c{i}', '<i2'), (f'v{i}', value_type)]
+        records = np.zeros(stop - start, dtype=dtype)
+        for i, (code, value_type, value) in enumerate(values):
+            records[f'c{i}'] = code
+            records[f'v{i}'] = value[start:stop] if isinstance(value, np.ndarray) else value
+        chunks.append(records.tobytes())
+    return chunks
+
+
+class DXFStreamWriter:
+    """
+    Writes a DXF file entity by entity straight from NumPy arrays.
+
+    The header, tables, blocks and objects come from an empty ezdxf document, so the file opens
+    in ezdxf and AutoCAD like any other R2010 drawing, but entities are formatted in chunks and
+    written directly to disk instead of being held as ezdxf objects. Memory use depends on the
+    chunk size only, not on the number of entities written.
+
+    With binary=True the file is a binary DXF: group codes and numbers are packed from the arrays
+    as they are, which is smaller and faster to write and to read than formatting them as text.
+
+    Usage:
+        with DXFStreamWriter(path, layers={'3D Mesh': 7}) as writer:
+            writer.add_3dfaces(vertices, colors, layer='3D Mesh')
+    """
+
+    def __init__(self, output_file, layers=None, dxfversion='R2010', binary=False):
+        self.output_file = output_file
+        self.binary = binary
+        doc = ezdxf.new(dxfversion=dxfversion)
+        for name, color in (layers or {}).items():
+            if color is None:
+                doc.layers.add(name)
+            else:
+                doc.layers.add(name, color=color)
+
+        # Reserve a block of handles for the streamed entities; $HANDSEED is written above it
+        self._next_handle = int(doc.entitydb.handles.next(), 16)
+        self._last_handle = self._next_handle + HANDLE_RESERVE
+        doc.entitydb.handles.reset("%X" % self._last_handle)
+        self._owner = doc.modelspace().layout_key
+
+        if binary:
+            stream = io.BytesIO()
+            doc.write(stream, fmt='bin')
+            data = stream.getvalue()
+            split_at = data.index(_BINARY_SECTION_START) + len(_BINARY_SECTION_START)
+            self._head = data[:split_at]
+            self._tail = data[data.index(_BINARY_SECTION_END, split_at):]
+            self._records = _binary_records
+        else:
+            stream = io.StringIO()
+            doc.write(stream)
+            text = stream.getvalue()
+            split_at = text.index(_SECTION_START) + len(_SECTION_START)
+            self._head = text[:split_at]
+            self._tail = text[text.index(_SECTION_END, split_at):]
+            self._records = _ascii_records
+        self._file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        if self.binary:
+            self._file = open(self.output_file, 'wb')
+        else:
+            self._file = open(self.output_file, 'w', encoding='utf-8', newline='\n')
+        self._file.write(self._head)
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self._tail)
+            self._file.close()
+            self._file = None
+
+    def _write(self, fields, count=1):
+        self._file.writelines(self._records(fields, count))
+
+    def _handles(self, count):
+        start = self._next_handle
+        self._next_handle += count
+        if self._next_handle > self._last_handle:
+            raise ValueError("Too many entities for a single streamed DXF file.")
+        return np.arange(start, start + count, dtype=np.int64)
+
+    def _entity_head(self, dxftype, layer, subclass, handles, owner=None, colors=None):
+        """Group codes every entity starts with; colors is an ACI color, or an array of one per entity."""
+        fields = [(0, dxftype), (5, handles), (330, owner or self._owner), (100, 'AcDbEntity'), (8, layer)]
+        if colors is not None and not (np.isscalar(colors) and colors == BYLAYER):
+            fields.append((62, colors))
+        fields.append((100, subclass))
+        return fields
+
+    def _seqend(self, owner, layer):
+        self._write([(0, 'SEQEND'), (5, self._handles(1)), (330, owner), (100, 'AcDbEntity'), (8, layer)])
+
+    def add_points(self, points, layer='0'):
+        """Writes POINT entities from an (N,3) array of x, y, z."""
+        points = np.asarray(points, dtype=np.float64)
+        for start in range(0, len(points), CHUNK_SIZE):
+            chunk = points[start:start + CHUNK_SIZE]
+            self._write(self._entity_head('POINT', layer, 'AcDbPoint', self._handles(len(chunk))) +
+                        [(10, chunk[:, 0]), (20, chunk[:, 1]), (30, chunk[:, 2])], len(chunk))
+
+    def add_3dfaces(self, vertices, colors=None, layer='0', invisible_edges=0):
+        """Writes triangular 3DFACE entities from an (N,3,3) vertex array with optional per-face ACI colors."""
+        vertices = np.asarray(vertices, dtype=np.float64)
+        colors = None if colors is None else np.asarray(colors)
+        for start in range(0, len(vertices), CHUNK_SIZE):
+            chunk = vertices[start:start + CHUNK_SIZE].reshape(-1, 9)
+            fields = self._entity_head('3DFACE', layer, 'AcDbFace', self._handles(len(chunk)),
+                                       colors=None if colors is None else colors[start:start + CHUNK_SIZE])
+            for corner, column in ((0, 0), (1, 3), (2, 6), (3, 6)):  # Triangle: 4th corner repeats the 3rd
+                fields += [(10 + corner, chunk[:, column]), (20 + corner, chunk[:, column + 1]),
+                           (30 + corner, chunk[:, column + 2])]
+            self._write(fields + [(70, invisible_edges)], len(chunk))
+
+    def add_lwpolyline(self, coordinates, layer='0', closed=False, elevation=None, color=None):
+        """Writes one LWPOLYLINE from an (N,2) array of x, y at an optional constant elevation."""
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        fields = self._entity_head('LWPOLYLINE', layer, 'AcDbPolyline', self._handles(1), colors=color)
+        fields += [(90, len(coordinates)), (70, 1 if closed else 0)]
+        if elevation is not None:
+            fields.append((38, float(elevation)))
+        self._write(fields)
+        self._write([(10, coordinates[:, 0]), (20, coordinates[:, 1])], len(coordinates))
+
+    def add_polyline3d(self, coordinates, layer='0', closed=False, color=None):
+        """Writes one 3D POLYLINE from an (N,3) array of x, y, z."""
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        polyline = self._handles(1)
+        self._write(self._entity_head('POLYLINE', layer, 'AcDb3dPolyline', polyline, colors=color) +
+                    [(66, 1), (10, 0.0), (20, 0.0), (30, 0.0), (70, 9 if closed else 8)])
+        owner = f'{polyline[0]:X}'
+        self._write(self._entity_head('VERTEX', layer, 'AcDbVertex', self._handles(len(coordinates)), owner) +
+                    [(100, 'AcDb3dPolylineVertex'), (10, coordinates[:, 0]), (20, coordinates[:, 1]),
+                     (30, coordinates[:, 2]), (70, 32)], len(coordinates))
+        self._seqend(owner, layer)
+
+    def add_polyface(self, points, faces, colors=None, layer='0', invisible_edges=False):
+        """
+        Writes a triangle mesh as compact POLYFACE entities, sharing vertices between faces.
+        The mesh is split into several polyfaces so each stays within the DXF vertex index limit.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        faces = np.asarray(faces)
+        colors = None if colors is None else np.asarray(colors)
+        sign = -1 if invisible_edges else 1  # A negative index hides the edge starting at that vertex
+
+        for start in range(0, len(faces), POLYFACE_MAX_FACES):
+            chunk = faces[start:start + POLYFACE_MAX_FACES]
+            used, local = np.unique(chunk, return_inverse=True)
+            local = (local.reshape(chunk.shape) + 1) * sign
+            polyline = self._handles(1)
+            self._write(self._entity_head('POLYLINE', layer, 'AcDbPolyFaceMesh', polyline) +
+                        [(66, 1), (10, 0.0), (20, 0.0), (30, 0.0), (70, 64), (71, len(used)), (72, len(chunk))])
+
+            owner = f'{polyline[0]:X}'
+            coords = points[used]
+            self._write(self._entity_head('VERTEX', layer, 'AcDbVertex', self._handles(len(used)), owner) +
+                        [(100, 'AcDbPolyFaceMeshVertex'), (10, coords[:, 0]), (20, coords[:, 1]),
+                         (30, coords[:, 2]), (70, 192)], len(used))
+            self._write(self._entity_head('VERTEX', layer, 'AcDbFaceRecord', self._handles(len(chunk)), owner,
+                                          colors=None if colors is None else colors[start:start + POLYFACE_MAX_FACES]) +
+                        [(10, 0.0), (20, 0.0), (30, 0.0), (70, 128),
+                         (71, local[:, 0]), (72, local[:, 1]), (73, local[:, 2])], len(chunk))
+            self._seqend(owner, layer)
+
+    def add_mesh(self, points, faces, colors=None, layer='0'):
+        """
+        Writes a triangle mesh as R2010 MESH entities, the most compact form: vertices are shared
+        and faces are plain index lists. MESH has no per-face color, so one entity is written per color.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        faces = np.asarray(faces)
+        if colors is None:
+            groups = [(None, faces)]
+        else:
+            colors = np.asarray(colors)
+            groups = [(color, faces[colors == color]) for color in np.unique(colors).tolist()]
+
+        for color, group in groups:
+            used, local = np.unique(group, return_inverse=True)
+            local = local.reshape(group.shape)
+            coords = points[used]
+            self._write(self._entity_head('MESH', layer, 'AcDbSubDMesh', self._handles(1), colors=color) +
+                        [(71, 2), (72, 0), (91, 0), (92, len(used))])
+            self._write([(10, coords[:, 0]), (20, coords[:, 1]), (30, coords[:, 2])], len(used))
+            self._write([(93, 4 * len(group))])
+            self._write([(90, 3), (90, local[:, 0]), (90, local[:, 1]), (90, local[:, 2])], len(group))
+            self._write([(94, 0), (95, 0), (90, 0)])
@@ -0,0 +1,247 @@
+import os
+import time
+import shutil
+from functools import partial
+from utils.temp_file_handler import create_temp_dir, create_output_dir, clean_up_temp_dir, get_first_word
+from utils.manual_logger import write_log
+from utils.stage_graph import Stage, run_stage_graph
+from utils.point_formats import read_points, POINT_EXTENSIONS
+from utils.job_manager import JOB_WORKERS
+from terrain_processing.terrain_processing import (create_dxf, create_mesh, create_dxf_mesh, create_adaptive_mesh,
+                                                   SLOPE_CLASS_BREAKS, SLOPE_CLASS_COLORS)
+from terrain_processing.pipeline import TerrainPipeline
+from terrain_processing.stage_cache import get_stage_cache, cached_build
+
+# Contour processes per job; by default the CPUs are shared between the jobs running at the same time
+JOB_CONTOUR_WORKERS = int(os.environ.get('TERRAINXACT_CONTOUR_WORKERS', max(1, (os.cpu_count() or 1) // JOB_WORKERS)))
+
+
+def build_points_dxf(points_path, boundaries, dxf_path, binary=False):
+    """Process stage: writes the 3D points DXF, with the boundary, from the memory-mapped points file."""
+    create_dxf(read_points(points_path), dxf_path, boundaries, binary)
+    return dxf_path
+
+
+def build_mesh_dxf(points_path, valid_mask, boundaries, path, key=None, mesh_tolerance=None, binary=False):
+    """
+    Process stage: meshes the memory-mapped points file on the clipped raster's pixel grid and writes
+    the mesh DXF with the boundary, or restores it from the stage cache entry key. Returns the path,
+    whether it was a cache hit and the adaptive mesh report (None without mesh_tolerance).
+    """
+    def build(out_path):
+        points_meters = read_points(points_path)
+        mesh_report = None
+        if mesh_tolerance:
+            simplices, mesh_report = create_adaptive_mesh(points_meters, valid_mask, mesh_tolerance)
+        else:
+            simplices = create_mesh(points_meters, valid_mask)
+        slope_stats = create_dxf_mesh(points_meters, simplices, out_path, boundaries=boundaries, binary=binary)
+        return {'mesh': mesh_report, 'slopes': slope_stats}
+
+    hit, report = cached_build(get_stage_cache(), key, path, build)
+    mesh_report = report['mesh']
+    if mesh_report:
+        write_log(f"Adaptive mesh with {mesh_tolerance} map unit tolerance: "
+                  f"vertices {mesh_report['vertices_in']} -> {mesh_report['vertices_out']} "
+                  f"({100 * (1 - mesh_report['vertices_out'] / max(mesh_report['vertices_in'], 1)):.1f}% fewer), "
+                  f"faces {mesh_report['faces_in']} -> {mesh_report['faces_out']} "
+                  f"({100 * (1 - mesh_report['faces_out'] / max(mesh_report['faces_in'], 1)):.1f}% fewer), "
+                  f"max deviation {mesh_report['max_deviation']:.3f}")
+    for slope_class in report['slopes']:
+        write_log(f"Slope {slope_class['min_slope']}-{slope_class['max_slope']} deg (color {slope_class['color']}): "
+                  f"{slope_class['faces']} faces, {slope_class['area']:.1f} m2")
+    return path, hit, mesh_report
+
+
+def _mesh_contour_stages(pipeline, output_options, output_dir, base_filename, mesh_tolerance, points_format):
+    """
+    The stage graph of a request. Stages reading the clipped raster share the pipeline and run on
+    threads; the mesh and points DXF are pure-Python/numpy work holding the GIL, so they run in
+    worker processes and exchange file paths. Every DXF is written with the boundary already in it.
+    The points reach the DXF stages as a .npy file they memory-map; the CSV is only written for PVsyst.
+    """
+    exports_points = 'points_binary' in output_options
+    wants_points = bool({'points_dxf_meters', 'mesh_dxf'} & set(output_options)) or \
+        (exports_points and points_format == 'npy')
+
+    def load_boundaries():
+        # A KML that can't be read leaves the boundary out of the DXFs instead of failing them
+        try:
+            return pipeline.boundaries
+        except Exception as e:
+            write_log(f"Error processing KML data: {str(e)}")
+            return None
+
+    def save_contours(clipped_path):
+        # Both outputs read the same OGR Memory dataset, which is not safe to read from two threads at once
+        paths = {}
+        if 'contours_shp' in output_options:
+            try:
+                paths['shp'] = pipeline.save_contours_shapefile()
+                write_log(f"Contour shapefile created at: {paths['shp']}")
+            except Exception as e:
+                write_log(f"Error generating contours: {str(e)}")
+        if 'contours_dxf' in output_options:
+            try:
+                paths['dxf'] = pipeline.save_contours_dxf()
+                write_log(f"Contour DXF with the boundary created at: {paths['dxf']}")
+            except Exception as e:
+                write_log(f"Error writing the contour DXF: {str(e)}")
+        return paths
+
+    stages = [
+        Stage('clip', lambda: pipeline.clipped_path),
+        Stage('boundary', pipeline.save_boundary_dxf),
+    ]
+    if {'points_dxf_meters', 'mesh_dxf'} & set(output_options):
+        stages.append(Stage('boundaries', load_boundaries))
+    if 'clipped_dem' in output_options:
+        stages.append(Stage('clipped_dem', lambda clipped_path: pipeline.save_clipped_dem(), deps=['clip']))
+    if {'contours_shp', 'contours_dxf'} & set(output_options):
+        stages.append(Stage('contours', save_contours, deps=['clip']))
+    if wants_points:
+        stages.append(Stage('points', lambda clipped_path: pipeline.save_points('npy'), deps=['clip']))
+    if 'pvsyst_csv' in output_options:
+        stages.append(Stage('points_csv', lambda clipped_path: pipeline.save_points('csv'), deps=['clip']))
+    if exports_points and points_format != 'npy':
+        stages.append(Stage('points_export', lambda clipped_path: pipeline.save_points(points_format), deps=['clip']))
+    if 'points_dxf_meters' in output_options:
+        stages.append(Stage('points_dxf',
+                            partial(build_points_dxf,
+                                    dxf_path=os.path.join(output_dir, f"{base_filename}_3D_points_merged.dxf"),
+                                    binary=pipeline.binary_dxf),
+                            deps=['points', 'boundaries'], executor='process'))
+    if 'mesh_dxf' in output_options:
+        stages.append(Stage('mask', lambda clipped_path: pipeline.valid_mask(), deps=['clip']))
+        # The key is computed here because the worker process has no pipeline to hash the inputs with
+        mesh_key = pipeline.stage_key('mesh_dxf', mesh_tolerance, SLOPE_CLASS_BREAKS, SLOPE_CLASS_COLORS,
+                                      pipeline.binary_dxf)
+        stages.append(Stage('mesh',
+                            partial(build_mesh_dxf,
+                                    path=os.path.join(output_dir, f"{base_filename}_Generated_Mesh_merged.dxf"),
+                                    key=mesh_key, mesh_tolerance=mesh_tolerance, binary=pipeline.binary_dxf),
+                            deps=['points', 'mask', 'boundaries'], executor='process'))
+    return stages
+
+
+def run_mesh_contour_job(dem_file_path, kml_file_path, output_options, mesh_tolerance=None, contour_interval=1,
+                         major_interval=None, contour_tolerance=None, contour_vertex_budget=None, dxf_format='ascii',
+                         points_format='npy', result_dir=None, progress=None):
+    """
+    Runs the clip, contour, points, mesh and boundary stages for one DEM/KML pair and moves the outputs
+    the user selected into result_dir. Stages run as soon as the ones they depend on have finished,
+    so independent outputs are produced concurrently. progress(stage, percent) is called as each
+    stage starts. Contours are drawn every contour_interval, with every major_interval (by default
+    every fifth contour) classed as major, and simplified to contour_tolerance (map units) or to about
+    contour_vertex_budget vertices when either is given. dxf_format 'binary' writes every DXF as
+    binary DXF. The 'points_binary' output exports the points as points_format (npy, parquet or laz).
+    The uploaded DEM and KML are removed when the job finishes. Returns the job summary: the contour
+    simplification and adaptive mesh reports when those were applied, the wall time and bytes written
+    of every stage, the stage cache hits and the stages that failed.
+    """
+    temp_dir = create_temp_dir()
+    output_dir = create_output_dir(temp_dir)
+    write_log(f"Temporary directory created at: {temp_dir}")
+    write_log(f"Output directory created at: {output_dir}")
+
+    base_filename = get_first_word(os.path.basename(kml_file_path))
+    # Stage outputs are reused from earlier runs on the same DEM and KML where possible
+    pipeline = TerrainPipeline(dem_file_path, kml_file_path, output_dir, cache=get_stage_cache(),
+                               contour_interval=contour_interval, major_interval=major_interval,
+                               contour_tolerance=contour_tolerance, contour_vertex_budget=contour_vertex_budget,
+                               binary_dxf=dxf_format == 'binary', contour_workers=JOB_CONTOUR_WORKERS)
+
+    try:
+        stages = _mesh_contour_stages(pipeline, output_options, output_dir, base_filename, mesh_tolerance,
+                                      points_format)
+        finished = []
+        started = {}
+        stage_seconds = {}
+
+        def on_start(stage):
+            write_log(f"Mesh/contour job stage started: {stage}")
+            started[stage] = time.perf_counter()
+            if progress is not None:
+                progress(stage, 100.0 * len(finished) / (len(stages) + 1))
+
+        def on_finish(stage, error):
+            finished.append(stage)
+            stage_seconds[stage] = time.perf_counter() - started.get(stage, time.perf_counter())
+            if error is not None:
+                write_log(f"Mesh/contour job stage {stage} failed: {str(error)}")
+
+        write_log(f"Running {len(stages)} stages for dem_path: {dem_file_path} and kml_path: {kml_file_path}")
+        outputs, errors = run_stage_graph(stages, on_start=on_start, on_finish=on_finish)
+        if 'mesh' in outputs:
+            pipeline.record_cache('mesh_dxf', outputs['mesh'][1])
+
+        summary = {}
+        contour_report = pipeline.contour_report
+        if contour_report:
+            write_log(f"Contours simplified with {contour_report['tolerance']:.3f} tolerance: "
+                      f"vertices {contour_report['vertices_in']} -> {contour_report['vertices_out']} "
+                      f"({100 * (1 - contour_report['vertices_out'] / max(contour_report['vertices_in'], 1)):.1f}% fewer), "
+                      f"geometry bytes {contour_report['bytes_in']} -> {contour_report['bytes_out']} "
+                      f"({100 * (1 - contour_report['bytes_out'] / max(contour_report['bytes_in'], 1)):.1f}% fewer)")
+            summary['contour_simplification'] = contour_report
+        if 'mesh' in outputs and outputs['mesh'][2]:
+            summary['adaptive_mesh'] = outputs['mesh'][2]
+
+        # The DXF stages run in worker processes, outside the pipeline, so they are timed from the stage graph
+        stage_metrics = list(pipeline.metrics)
+        dxf_outputs = {'points_dxf': outputs.get('points_dxf'), 'mesh': outputs['mesh'][0] if 'mesh' in outputs else None}
+        for stage, path in dxf_outputs.items():
+            if path:
+                stage_metrics.append({'stage': stage, 'seconds': stage_seconds[stage],
+                                      'bytes_written': os.path.getsize(path)})
+        for metric in stage_metrics:
+            write_log(f"Stage {metric['stage']}: {metric['seconds']:.2f} s, {metric['bytes_written']} bytes written to disk")
+        summary['stage_metrics'] = [dict(metric, seconds=round(metric['seconds'], 3)) for metric in stage_metrics]
+
+        if progress is not None:
+            progress('results', 100.0 * len(stages) / (len(stages) + 1))
+        contour_paths = outputs.get('contours', {})
+        results = []
+        if 'clipped_dem' in outputs:
+            results.append((outputs['clipped_dem'], f"{base_filename}_clipped_dem.tif"))
+        if 'shp' in contour_paths:
+            results.append((contour_paths['shp'], f"{base_filename}_shapefile.shp"))
+        if 'points_csv' in outputs:
+            results.append((outputs['points_csv'], f"{base_filename}_pvsyst_input.csv"))
+        points_export = 'points' if points_format == 'npy' else 'points_export'
+        if 'points_binary' in output_options and points_export in outputs:
+            results.append((outputs[points_export], f"{base_filename}_points{POINT_EXTENSIONS[points_format]}"))
+        if 'dxf' in contour_paths:
+            results.append((contour_paths['dxf'], f"{base_filename}_contours_merged.dxf"))
+        if 'boundary' in outputs:
+            results.append((outputs['boundary'], "boundary.dxf"))
+        if 'points_dxf' in outputs:
+            results.append((outputs['points_dxf'], os.path.basename(outputs['points_dxf'])))
+        if 'mesh' in outputs:
+            results.append((outputs['mesh'][0], os.path.basename(outputs['mesh'][0])))
+
+        # Outputs are moved, not copied, into the result directory; they are zipped while being downloaded
+        for path, name in results:
+            try:
+                write_log(f"Adding {name} to the job results")
+                shutil.move(path, os.path.join(result_dir, name))
+            except Exception as e:
+                write_log(f"Error adding {name} to the job results: {str(e)}")
+        write_log(f"Job results saved in: {result_dir}")
+
+        cache_hits = sum(1 for outcome in pipeline.cache_report.values() if outcome == 'hit')
+        cache_misses = len(pipeline.cache_report) - cache_hits
+        write_log(f"Stage cache: {cache_hits} hits, {cache_misses} misses "
+                  f"({', '.join(f'{stage} {outcome}' for stage, outcome in pipeline.cache_report.items())})")
+        summary['stage_cache'] = {'hits': cache_hits, 'misses': cache_misses, 'stages': pipeline.cache_report}
+        summary['failed_stages'] = sorted(errors)
+        return summary
+
+    finally:
+        pipeline.close()
+        # Only this job's directories are removed; other jobs may be running in parallel
+        clean_up_temp_dir(temp_dir)
+        write_log("Cleaned up the job's temporary directories and files.")
+        # Remove uploaded files
+        os.remove(dem_file_path)
+        os.remove(kml_file_path)
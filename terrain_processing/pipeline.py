@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from osgeo import gdal
+from utils.temp_file_handler import get_first_word
+from utils.kml_utils import get_kml_data, transform_kml_data
+from utils.point_formats import POINT_EXTENSIONS
+from terrain_processing.terrain_processing import (warp_clip, contours_to_dxf, data_to_dxf, write_raster_points,
+                                                   read_valid_mask)
+from terrain_processing.tiled_contours import tiled_contour_dataset, CONTOUR_WORKERS
+from terrain_processing.contour_simplify import simplify_contour_dataset
+from terrain_processing.stage_cache import stage_key, file_digest, cached_build
+
+
+class TerrainPipeline:
+    """
+    In-process clip -> contours -> points pipeline for one DEM and KML.
+
+    The clipped DEM and the contour layer stay in memory (/vsimem/ and an OGR Memory dataset) and are
+    handed between stages as open datasets, so nothing is serialized to disk unless it is an output
+    the user asked for. Every stage records its wall time and the bytes it wrote to disk in metrics.
+
+    With a stage cache (a DiskCache), every stage output is stored under a hash of the DEM and KML
+    contents and the stage parameters, and a later run with the same inputs links it from the cache
+    instead of recomputing it. cache_report records whether each stage was a hit or a miss.
+
+    Stages may run on different threads: the clip and contours are computed once under a lock and
+    every thread reads the clipped raster through its own GDAL handle.
+
+    Contours are simplified before they are saved if contour_tolerance (map units) or
+    contour_vertex_budget is given; contour_report then holds the vertex and byte reduction, also when
+    the contour outputs come from the cache.
+    DXF outputs are written as binary DXF if binary_dxf. Large rasters are contoured tile by tile in
+    contour_workers processes.
+    """
+
+    def __init__(self, dem_path, kml_path, output_dir, cache=None, contour_interval=1, major_interval=None,
+                 contour_tolerance=None, contour_vertex_budget=None, binary_dxf=False, contour_workers=CONTOUR_WORKERS):
+        self.dem_path = dem_path
+        self.kml_path = kml_path
+        self.output_dir = output_dir
+        self.base_filename = get_first_word(kml_path)
+        self.cache = cache
+        self.contour_interval = contour_interval
+        self.major_interval = major_interval
+        self.contour_tolerance = contour_tolerance
+        self.contour_vertex_budget = contour_vertex_budget
+        self._contour_report = None
+        self.binary_dxf = binary_dxf
+        self.contour_workers = contour_workers
+        self.metrics = []
+        self.cache_report = {}
+        self.stage_reports = {}
+        self._input_digests = None
+        self._vsimem_dir = f'/vsimem/terrainxact_{uuid.uuid4().hex}'
+        self._clipped_path = None
+        self._contour_ds = None
+        self._boundaries = None
+        self._lock = threading.RLock()
+        self._contour_lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def _stage(self, name, *output_paths):
+        start = time.perf_counter()
+        yield
+        bytes_written = sum(os.path.getsize(path) for path in output_paths if os.path.exists(path))
+        self.metrics.append({'stage': name, 'seconds': time.perf_counter() - start, 'bytes_written': bytes_written})
+        logging.debug("Stage %s took %.2f s and wrote %d bytes", name, self.metrics[-1]['seconds'], bytes_written)
+
+    def output_path(self, suffix):
+        return os.path.join(self.output_dir, f'{self.base_filename}_{suffix}')
+
+    def stage_key(self, stage, *params):
+        """Cache key of a stage run on this pipeline's DEM and KML with the given parameters, or None without a cache."""
+        if self.cache is None:
+            return None
+        if self._input_digests is None:
+            with self._lock:
+                if self._input_digests is None:
+                    self._input_digests = (file_digest(self.dem_path), file_digest(self.kml_path))
+        return stage_key(stage, *self._input_digests, *params)
+
+    def cached_file(self, stage, params, path, build):
+        """
+        Produces the file at path (with any sibling files, e.g. of a shapefile) by calling build(path),
+        or links it from the stage cache if a previous run already built it from the same DEM, KML and params.
+        A report returned by build is cached with the file and recorded in stage_reports either way.
+        """
+        hit, report = cached_build(self.cache, self.stage_key(stage, *params), path, build)
+        self.record_cache(stage, hit)
+        if report is not None:
+            self.stage_reports[stage] = report
+        return path
+
+    def record_cache(self, stage, hit):
+        if self.cache is not None:
+            self.cache_report[stage] = 'hit' if hit else 'miss'
+
+    def _clip_to(self, path):
+        clipped_ds = warp_clip(self.dem_path, self.kml_path, path)
+        clipped_ds = None  # Flush the clipped raster
+
+    @property
+    def clipped_path(self):
+        """Path of the clipped DEM, clipping it on first use."""
+        if self._clipped_path is None:
+            with self._lock:
+                if self._clipped_path is None:
+                    with self._stage('clip'):
+                        if self.cache is None:
+                            path = f'{self._vsimem_dir}/{self.base_filename}_clipped_dem.tif'
+                            self._clip_to(path)
+                        else:
+                            # Cached clips are stored on disk; the rest of the run reads it from there
+                            path = self.cached_file('clip', (), self.output_path('clipped_dem.tif'), self._clip_to)
+                    self._clipped_path = path
+        return self._clipped_path
+
+    @property
+    def clipped_dataset(self):
+        """The clipped DEM, opened separately for each thread."""
+        clipped_ds = getattr(self._local, 'clipped_ds', None)
+        if clipped_ds is None:
+            clipped_ds = self._local.clipped_ds = gdal.Open(self.clipped_path, gdal.GA_ReadOnly)
+        return clipped_ds
+
+    @property
+    def contour_dataset(self):
+        if self._contour_ds is None:
+            clipped_ds = self.clipped_dataset
+            with self._contour_lock:
+                if self._contour_ds is None:
+                    with self._stage('contours'):
+                        contour_ds = tiled_contour_dataset(clipped_ds, interval=self.contour_interval,
+                                                           major_interval=self.major_interval,
+                                                           workers=self.contour_workers)
+                    if self.contour_tolerance or self.contour_vertex_budget:
+                        with self._stage('simplify_contours'):
+                            contour_ds, self._contour_report = simplify_contour_dataset(
+                                contour_ds, clipped_ds, self.contour_tolerance, self.contour_vertex_budget)
+                    self._contour_ds = contour_ds
+        return self._contour_ds
+
+    @property
+    def contour_report(self):
+        """Simplification report of the contours, restored from a cached contour output if they were not computed."""
+        if self._contour_report is None:
+            for stage in ('contours_shp', 'contours_dxf'):
+                if stage in self.stage_reports:
+                    return self.stage_reports[stage]
+        return self._contour_report
+
+    def save_clipped_dem(self):
+        path = self.output_path('clipped_dem.tif')
+        clipped_ds = self.clipped_dataset
+        if self.cache is not None:
+            return path  # Linked from the cache when the clip was loaded
+        with self._stage('save_clipped_dem', path):
+            copy_ds = gdal.GetDriverByName('GTiff').CreateCopy(path, clipped_ds)
+            copy_ds = None
+        return path
+
+    @property
+    def contour_params(self):
+        return self.contour_interval, self.major_interval, self.contour_tolerance, self.contour_vertex_budget
+
+    def _write_contours_shapefile(self, path):
+        shp_ds = gdal.VectorTranslate(path, self.contour_dataset, format='ESRI Shapefile')
+        shp_ds = None
+        return self._contour_report
+
+    def save_contours_shapefile(self):
+        path = self.output_path('shapefile.shp')
+        with self._stage('save_contours_shapefile', path):
+            self.cached_file('contours_shp', self.contour_params, path, self._write_contours_shapefile)
+        return path
+
+    def save_contours_dxf(self):
+        """Writes the contours and the boundary into one DXF, the boundary left out if the KML can't be read."""
+        path = self.output_path('contours.dxf')
+
+        def write_dxf(out):
+            try:
+                boundaries = self.boundaries
+            except Exception as e:
+                logging.error("Writing the contour DXF without the boundary: %s", e)
+                boundaries = None
+            contours_to_dxf(self.contour_dataset, out, boundaries, self.binary_dxf)
+            return self._contour_report
+
+        with self._stage('save_contours_dxf', path):
+            self.cached_file('contours_dxf', (*self.contour_params, self.binary_dxf), path, write_dxf)
+        return path
+
+    @property
+    def boundaries(self):
+        """The KML polygons in the DEM's coordinate system, read on first use."""
+        if self._boundaries is None:
+            with self._lock:
+                if self._boundaries is None:
+                    self._boundaries = transform_kml_data(get_kml_data(self.kml_path), self.dem_path)
+        return self._boundaries
+
+    def save_boundary_dxf(self):
+        path = os.path.join(self.output_dir, 'boundary.dxf')
+        with self._stage('save_boundary_dxf', path):
+            self.cached_file('boundary', (self.binary_dxf,), path,
+                             lambda out: data_to_dxf(self.boundaries, out, self.binary_dxf))
+        return path
+
+    def save_points(self, fmt='npy'):
+        """
+        Writes the valid pixels of the clipped raster as points in one of POINT_FORMATS. CSV is the
+        PVsyst input; the binary formats are for other tools, and .npy is what the mesh and points DXF
+        stages memory-map.
+        """
+        path = self.output_path('pvsyst_input.csv' if fmt == 'csv' else f'points{POINT_EXTENSIONS[fmt]}')
+        with self._stage(f'save_points_{fmt}', path):
+            self.cached_file(f'points_{fmt}', (), path, lambda out: write_raster_points(self.clipped_dataset, out, fmt))
+        return path
+
+    def valid_mask(self):
+        return read_valid_mask(self.clipped_dataset)
+
+    def close(self):
+        """Releases the datasets; call once every thread using the pipeline has finished."""
+        self._contour_ds = None
+        self._local = threading.local()
+        for name in gdal.ReadDir(self._vsimem_dir) or []:
+            gdal.Unlink(f'{self._vsimem_dir}/{name}')
+        gdal.Unlink(self._vsimem_dir)
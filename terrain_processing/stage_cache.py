@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+from utils.disk_cache import DiskCache, cache_key, link_file
+
+STAGE_CACHE_FOLDER = os.environ.get('TERRAINXACT_STAGE_CACHE', os.path.join('cache', 'stages'))
+STAGE_CACHE_BYTES = int(os.environ.get('TERRAINXACT_STAGE_CACHE_BYTES', 10 * 1024 ** 3))  # 0 turns the cache off
+STAGE_CACHE_VERSION = 5  # Bump when a stage's output changes so artifacts from older code are not reused
+
+ARTIFACT_NAME = 'artifact'  # Stem of the files inside a cache entry, e.g. artifact.shp, artifact.dbf
+REPORT_NAME = 'report.json'  # What the stage reported about its output (e.g. vertex reductions), kept for hits
+
+_stage_cache = None
+
+
+def get_stage_cache():
+    """Returns the process-wide stage artifact cache, or None if it is turned off."""
+    global _stage_cache
+    if _stage_cache is None and STAGE_CACHE_BYTES > 0:
+        _stage_cache = DiskCache(STAGE_CACHE_FOLDER, STAGE_CACHE_BYTES)
+    return _stage_cache
+
+
+def stage_key(stage, *inputs):
+    """Content address of a stage's output: a hash of the stage name, its input digests or keys and its parameters."""
+    return cache_key(STAGE_CACHE_VERSION, stage, *inputs)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_build(cache, key, path, build):
+    """
+    Produces the file at path by calling build(path), or restores it from cache entry key if an earlier
+    run built it. On a miss build writes into a new cache entry first. Without a cache or key, build
+    simply runs. build may return a JSON-serializable report about its output, which is stored with the
+    entry and read back on a hit. An entry evicted by another process while it is being restored counts
+    as a miss. Returns (hit, report).
+    """
+    if cache is None or key is None:
+        return False, build(path)
+    entry_dir = cache.lookup(key, count=False)
+    if entry_dir is not None:
+        try:
+            report = read_report(entry_dir)
+            restore_artifact(entry_dir, path)
+            cache.record(True)
+            return True, report
+        except FileNotFoundError:
+            pass  # Evicted meanwhile; rebuilt below
+    cache.record(False)
+    with cache.store(key) as tmp_dir:
+        report = build(os.path.join(tmp_dir, ARTIFACT_NAME + os.path.splitext(path)[1]))
+        if report is not None:
+            with open(os.path.join(tmp_dir, REPORT_NAME), 'w') as f:
+                json.dump(report, f)
+    try:
+        restore_artifact(cache.entry_dir(key), path)
+    except FileNotFoundError:
+        # Evicted again before it could be restored; build in place rather than racing the cache
+        report = build(path)
+    return False, report
+
+
+def read_report(entry_dir):
+    """The report stored with a cache entry, or None if its stage reported nothing."""
+    try:
+        with open(os.path.join(entry_dir, REPORT_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def restore_artifact(entry_dir, path):
+    """
+    Places the files of a cache entry at path, keeping their extensions (artifact.shp -> <path stem>.shp).
+    Files are hard-linked when possible and copied otherwise. Raises FileNotFoundError if the entry is
+    evicted meanwhile, after removing the files it had already placed, so no partial shapefile is left.
+    """
+    stem = os.path.splitext(path)[0]
+    restored = []
+    try:
+        for name in os.listdir(entry_dir):
+            if not name.startswith(ARTIFACT_NAME):
+                continue
+            target = stem + name[len(ARTIFACT_NAME):]
+            link_file(os.path.join(entry_dir, name), target)
+            restored.append(target)
+    except FileNotFoundError:
+        for target in restored:
+            os.remove(target)
+        raise
+    return path
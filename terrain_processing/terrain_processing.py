@@ -1,191 +1,348 @@
-import subprocess
-import os
 from osgeo import gdal, ogr, osr
 import numpy as np
 import logging
-import ezdxf
-import csv
+from contextlib import contextmanager
 from scipy.spatial import Delaunay
-from ezdxf.addons import Importer
-from utils.temp_file_handler import get_first_word, create_temp_dir
+from utils.point_formats import write_points, point_coords
+from terrain_processing.dxf_writer import DXFStreamWriter, CHUNK_SIZE
 
 logging.basicConfig(level=logging.DEBUG)
 
 M_TO_FT = 3.28084  # Conversion factor from meters to feet
+WINDOW_PIXELS = 1 << 20  # Pixels read per raster window when streaming points
 
-def clip_raster(dem_path, kml_path):
-    logging.debug("Clipping the raster with dem_path: %s and kml_path: %s", dem_path, kml_path)
-    tmp_dir = create_temp_dir()
-    tmp_output_path = os.path.join(tmp_dir, f'{get_first_word(kml_path)}_clipped_dem.tif')
-    
-    # Delete the existing file if it exists
-    if os.path.exists(tmp_output_path):
-        os.remove(tmp_output_path)
-    
-    subprocess.run(['gdalwarp', '-cutline', kml_path, '-crop_to_cutline', dem_path, tmp_output_path], check=True)
-    with open(tmp_output_path, 'rb') as f:
-        clipped_data = f.read()
-    logging.debug("Clipped raster data length: %d bytes", len(clipped_data))
-    return clipped_data, tmp_dir
-
-def generate_contours(clipped_dem_data, tmp_dir, kml_name, interval=1):
-    tmp_input_path = os.path.join(tmp_dir, f'{get_first_word(kml_name)}_clipped_dem.tif')
-    with open(tmp_input_path, 'wb') as tmp_input:
-        tmp_input.write(clipped_dem_data)
-    input_ds = gdal.Open(tmp_input_path, gdal.GA_Update)
-    raster_band = input_ds.GetRasterBand(1)
-    proj = osr.SpatialReference(wkt=input_ds.GetProjection())
-    dem_nan = raster_band.GetNoDataValue()
+# Mesh face slope classes: upper bounds in degrees and the ACI color of each class, flattest first
+SLOPE_CLASS_BREAKS = (5, 10, 15, 20, 25, 30)
+SLOPE_CLASS_COLORS = (7, 6, 5, 4, 3, 2, 1)  # White, Magenta, Blue, Cyan, Green, Yellow, Red
+MESH_FORMATS = ('3dface', 'polyface', 'mesh')
+ADAPTIVE_SEED_STEP = 32  # Pixel spacing of the initial vertex lattice for adaptive meshing
 
-    tmp_output_path = os.path.join(tmp_dir, f'{get_first_word(kml_name)}_shapefile.shp')
-    contour_ds = ogr.GetDriverByName("ESRI Shapefile").CreateDataSource(tmp_output_path)
-    contour_shp = contour_ds.CreateLayer('contour', proj, geom_type=ogr.wkbLineString25D)
+# Contour classes: DXF layer and ACI color of each; major (index) contours default to every fifth level
+CONTOUR_CLASS_LAYERS = {'minor': 'Contours Minor', 'major': 'Contours Major'}
+CONTOUR_CLASS_COLORS = {'minor': 8, 'major': 1}  # Gray, Red
+MAJOR_CONTOUR_EVERY = 5
+
+def warp_clip(dem_path, kml_path, output_path):
+    """Clips the DEM to the KML outline in-process and returns the open output dataset."""
+    if gdal.VSIStatL(output_path) is not None:
+        gdal.Unlink(output_path)
+    options = gdal.WarpOptions(cutlineDSName=kml_path, cropToCutline=True)
+    output_ds = gdal.Warp(output_path, dem_path, options=options)
+    if output_ds is None:
+        raise RuntimeError(f"Clipping {dem_path} with {kml_path} failed: {gdal.GetLastErrorMsg()}")
+    return output_ds
+
+def create_contour_layer(input_ds, output_path='contours', driver='Memory'):
+    """Creates a vector dataset with an empty ID/elev contour layer in the projection of an open raster."""
+    proj = osr.SpatialReference(wkt=input_ds.GetProjection())
+    contour_ds = gdal.GetDriverByName(driver).Create(output_path, 0, 0, 0, gdal.GDT_Unknown)
+    contour_layer = contour_ds.CreateLayer('contour', proj, geom_type=ogr.wkbLineString25D)
     field_def = ogr.FieldDefn("ID", ogr.OFTInteger)
-    contour_shp.CreateField(field_def)
+    contour_layer.CreateField(field_def)
     field_def = ogr.FieldDefn("elev", ogr.OFTReal)
-    contour_shp.CreateField(field_def)
-
-    gdal.ContourGenerate(raster_band, interval, 0, [], 1, dem_nan, contour_shp, 0, 1)
-    contour_ds = None  # Close the contour dataset
-
-    with open(tmp_output_path, 'rb') as f:
-        contour_data = f.read()
-    logging.debug("Generated contour data length: %d bytes", len(contour_data))
-    return contour_data, tmp_dir
-
-def convert_shapefile_to_dxf(shapefile_data, tmp_dir, kml_name):
-    tmp_input_path = os.path.join(tmp_dir, f'{get_first_word(kml_name)}_shapefile.shp')
-    tmp_output_path = os.path.join(tmp_dir, f'{get_first_word(kml_name)}_contours.dxf')
-    subprocess.run(['ogr2ogr', '-f', 'DXF', '-zfield', 'elev', tmp_output_path, tmp_input_path], check=True)
-    with open(tmp_output_path, 'rb') as f:
-        dxf_data = f.read()
-    logging.debug("Converted DXF data length: %d bytes", len(dxf_data))
-    return dxf_data, tmp_dir
-
-def raster_to_points(clipped_dem_data, tmp_dir, kml_name):
-    tmp_input_path = os.path.join(tmp_dir, f'{get_first_word(kml_name)}_clipped_dem.tif')
-    with open(tmp_input_path, 'wb') as tmp_input:
-        tmp_input.write(clipped_dem_data)
-    input_ds = gdal.Open(tmp_input_path, gdal.GA_Update)
+    contour_layer.CreateField(field_def)
+    field_def = ogr.FieldDefn("class", ogr.OFTString)
+    field_def.SetWidth(5)
+    contour_layer.CreateField(field_def)
+    return contour_ds, contour_layer
+
+def major_interval_for(interval, major_interval=None):
+    """The major contour interval, defaulting to every MAJOR_CONTOUR_EVERY-th contour."""
+    return major_interval or interval * MAJOR_CONTOUR_EVERY
+
+def is_multiple(value, interval, tolerance=1e-6):
+    """
+    True if value is a whole multiple of interval. The remainder is taken in units of interval and
+    compared with tolerance, so values like 0.3 and 0.1 that are not exact in binary still count.
+    """
+    remainder = (value / interval) % 1
+    return min(remainder, 1 - remainder) < tolerance
+
+def contour_class(elev, major_interval):
+    """'major' for a contour on a multiple of major_interval, 'minor' otherwise."""
+    return 'major' if is_multiple(elev, major_interval) else 'minor'
+
+def contour_dataset(input_ds, interval=1, output_path='contours', driver='Memory', major_interval=None):
+    """
+    Contours the first band of an open raster into a new vector dataset with an ID/elev/class contour
+    layer. Minor and major contours come from the same pass and are told apart by their class.
+    """
+    raster_band = input_ds.GetRasterBand(1)
+    dem_nan = raster_band.GetNoDataValue()
+    major_interval = major_interval_for(interval, major_interval)
+
+    contour_ds, contour_layer = create_contour_layer(input_ds, output_path, driver)
+    gdal.ContourGenerate(raster_band, interval, 0, [], 1, dem_nan, contour_layer, 0, 1)
+    for feature in contour_layer:
+        feature.SetField("class", contour_class(feature.GetField("elev"), major_interval))
+        contour_layer.SetFeature(feature)
+    return contour_ds
+
+def contours_to_dxf(contour_ds, dxf_path, boundaries=None, binary=False):
+    """
+    Writes an ID/elev/class contour layer straight to DXF as 3D polylines at their elevation, minor
+    and major contours on their own colored layers, together with the boundary polygons (transformed
+    KML data) if given.
+    """
+    layers = {CONTOUR_CLASS_LAYERS[name]: CONTOUR_CLASS_COLORS[name] for name in CONTOUR_CLASS_LAYERS}
+    contour_layer = contour_ds.GetLayer(0)
+    has_class = contour_layer.GetLayerDefn().GetFieldIndex("class") >= 0
+    with assemble_dxf(dxf_path, layers, boundaries, binary) as writer:
+        for feature in contour_layer:
+            geometry = feature.GetGeometryRef()
+            if geometry is None or geometry.GetPointCount() < 2:
+                continue
+            coordinates = np.array(geometry.GetPoints(), dtype=np.float64)[:, :2]
+            elev = feature.GetField("elev")
+            class_name = (feature.GetField("class") if has_class else None) or 'minor'
+            writer.add_polyline3d(np.column_stack([coordinates, np.full(len(coordinates), elev)]),
+                                  layer=CONTOUR_CLASS_LAYERS[class_name])
+
+def valid_data_mask(values, nodata):
+    """Boolean mask of the pixels in values that are not nodata."""
+    if nodata is None:
+        return np.ones(values.shape, dtype=bool)
+    if np.isnan(nodata):
+        return ~np.isnan(values)
+    return values != nodata
+
+def read_valid_mask(dem):
+    """Reads the valid-pixel mask of the first band of a raster (path or open dataset), in row-major pixel order."""
+    input_ds = gdal.Open(dem, gdal.GA_ReadOnly) if isinstance(dem, str) else dem
     band = input_ds.GetRasterBand(1)
+    return valid_data_mask(band.ReadAsArray(), band.GetNoDataValue())
+
+def iter_raster_points(band, gt, window_pixels=WINDOW_PIXELS):
+    """Yields (xs, ys, zs) arrays of valid pixels, one window of whole rows at a time.
+
+    Windows are aligned to the band's native block height so tiled and striped
+    rasters are each read once per block row.
+    """
     nodata = band.GetNoDataValue()
+    block_rows = band.GetBlockSize()[1] or 1
+    rows_per_window = max(block_rows, (window_pixels // max(band.XSize, 1)) // block_rows * block_rows)
+    cols = np.arange(band.XSize, dtype=np.float64)
+
+    for yoff in range(0, band.YSize, rows_per_window):
+        nrows = min(rows_per_window, band.YSize - yoff)
+        values = band.ReadAsArray(0, yoff, band.XSize, nrows)
+        valid = valid_data_mask(values, nodata)
+        row_idx, col_idx = np.nonzero(valid)
+        x = cols[col_idx]
+        y = (row_idx + yoff).astype(np.float64)
+        xs = gt[0] + x * gt[1] + y * gt[2]
+        ys = gt[3] + x * gt[4] + y * gt[5]
+        yield xs, ys, values[valid]
+
+def write_raster_points(input_ds, points_path, fmt=None):
+    """
+    Writes the valid pixels of the first band of an open raster to points_path as X,Y,Z points, in
+    one of POINT_FORMATS (by default the one the path's extension names).
+    """
+    band = input_ds.GetRasterBand(1)
     gt = input_ds.GetGeoTransform()
+    return write_points(iter_raster_points(band, gt), points_path, fmt, srs=input_ds.GetProjection())
 
-    tmp_output_path = os.path.join(tmp_dir, f'{get_first_word(kml_name)}_pvsyst_input.csv')
-    with open(tmp_output_path, 'w', newline='') as tmp_output:
-        tmp_output.write("X,Y,Z\n")
-        for y in range(band.YSize):
-            for x in range(band.XSize):
-                value = band.ReadAsArray(x, y, 1, 1)[0][0]
-                if value != nodata:
-                    px = gt[0] + x * gt[1] + y * gt[2]
-                    py = gt[3] + x * gt[4] + y * gt[5]
-                    tmp_output.write(f"{px},{py},{value}\n")
-
-    with open(tmp_output_path, 'rb') as f:
-        points_data = f.read()
-    logging.debug("Generated points data length: %d bytes", len(points_data))
-    return points_data, tmp_output_path, tmp_dir
-
-def read_csv(file_path):
-    points_meters = []
-    with open(file_path, newline='') as csvfile:
-        csvreader = csv.DictReader(csvfile)
-        for row in csvreader:
-            x = float(row['X'])
-            y = float(row['Y'])
-            z_meters = float(row['Z'])
-            points_meters.append((x, y, z_meters))
-    return points_meters
-
-def create_dxf(points, output_file):
-    doc = ezdxf.new(dxfversion='R2010')
-    modelspace = doc.modelspace()
-    for point in points:
-        modelspace.add_point(point, dxfattribs={'layer': '3D Points'})
-    doc.saveas(output_file)
-
-def create_mesh(points):
-    coords = np.array([(x, y) for x, y, z in points])
-    tri = Delaunay(coords)
+def create_dxf(points, output_file, boundaries=None, binary=False):
+    """Writes a point array (or (N,3) array) as POINT entities, with the boundary polygons if given."""
+    with assemble_dxf(output_file, {'3D Points': None}, boundaries, binary) as writer:
+        writer.add_points(point_coords(points), layer='3D Points')
+
+def create_grid_mesh(valid_mask):
+    """
+    Triangulates a regular raster grid directly from its pixel topology.
+
+    Vertices are numbered in the row-major order of the valid pixels, which is the order
+    raster_to_points writes them in. Cells with four valid corners give two triangles,
+    cells with three give one, so nodata holes and the clip boundary are never bridged.
+    """
+    index = np.full(valid_mask.shape, -1, dtype=np.int64)
+    index[valid_mask] = np.arange(np.count_nonzero(valid_mask))
+
+    # Corner indices of every cell: a-b on the upper row, c-d on the lower row
+    a = index[:-1, :-1].ravel()
+    b = index[:-1, 1:].ravel()
+    c = index[1:, :-1].ravel()
+    d = index[1:, 1:].ravel()
+    va, vb, vc, vd = a >= 0, b >= 0, c >= 0, d >= 0
+
+    # Split full cells along a-d; a three-corner cell keeps the triangle of its valid corners.
+    # Both triangles of a cell are kept next to each other so neighbouring faces share vertices.
+    first = np.where(va[:, None], np.column_stack((a, b, d)), np.column_stack((b, d, c)))
+    second = np.where(vd[:, None], np.column_stack((a, d, c)), np.column_stack((a, b, c)))
+    first_valid = (va & vb & vd) | (~va & vb & vc & vd)
+    second_valid = (va & vc & vd) | (~vd & va & vb & vc)
+
+    simplices = np.stack((first, second), axis=1)[np.column_stack((first_valid, second_valid))]
+    return simplices.astype(np.int32)
+
+def create_mesh(points, valid_mask=None):
+    """
+    Triangulates the points. When the valid-pixel mask of the raster the points came from is
+    given, the grid topology is used directly; otherwise scattered points fall back to Delaunay.
+    """
+    if valid_mask is not None and np.count_nonzero(valid_mask) == len(points):
+        return create_grid_mesh(valid_mask)
+    tri = Delaunay(point_coords(points)[:, :2])
     return tri.simplices
 
-def calculate_slope(p1, p2, p3):
-    a = np.linalg.norm(np.array(p2) - np.array(p1))
-    b = np.linalg.norm(np.array(p3) - np.array(p2))
-    c = np.linalg.norm(np.array(p1) - np.array(p3))
-    s = (a + b + c) / 2
-    area = np.sqrt(s * (s - a) * (s - b) * (s - c))
-    height = 2 * area / a
-    slope = np.degrees(np.arctan(height / a))
-    return slope
-
-def slope_to_color(slope):
-    if slope > 30:
-        return 1  # Red
-    elif slope > 25:
-        return 2  # Yellow
-    elif slope > 20:
-        return 3  # Green
-    elif slope > 15:
-        return 4  # Cyan
-    elif slope > 10:
-        return 5  # Blue
-    elif slope > 5:
-        return 6  # Magenta
-    else:
-        return 7  # White
-
-def create_dxf_mesh(points, simplices, output_file):
-    doc = ezdxf.new(dxfversion='R2010')
-    modelspace = doc.modelspace()
-    for simplex in simplices:
-        pts = [points[i] for i in simplex]
-        slope = calculate_slope(pts[0], pts[1], pts[2])
-        color = slope_to_color(slope)
-        
-        face = modelspace.add_3dface([
-            (pts[0][0], pts[0][1], pts[0][2]),
-            (pts[1][0], pts[1][1], pts[1][2]),
-            (pts[2][0], pts[2][1], pts[2][2]),
-            (pts[2][0], pts[2][1], pts[2][2])  # Duplicate the last point for triangles
-        ], dxfattribs={'layer': '3D Mesh', 'color': color})
-        face.dxf.invisible_edges = 1 + 2 + 4  # Make all edges invisible
-    doc.saveas(output_file)
-
-def data_to_dxf(transformed_data, dxf_path):
-    doc = ezdxf.new()
-    msp = doc.modelspace()
+def create_adaptive_mesh(points, valid_mask, tolerance):
+    """
+    Error-bounded TIN simplification of a gridded DEM by greedy insertion.
+
+    Starting from the outline of the valid region and a coarse lattice, the worst-fitting pixel of
+    every triangle whose vertical error exceeds the tolerance (map units) is inserted and the selection
+    re-triangulated, until every pixel lies within the tolerance of the TIN. Outline pixels are always
+    kept so the clip boundary and nodata holes are exact; triangles over nodata are dropped.
+
+    Returns simplices indexing into points, like create_mesh, and a report of the reduction achieved.
+    """
+    if np.count_nonzero(valid_mask) != len(points):
+        raise ValueError("valid_mask must mark exactly one pixel per point.")
+    z = point_coords(points)[:, 2]
+    rows, cols = np.nonzero(valid_mask)
+    grid = np.column_stack((cols, rows)).astype(np.float64)
+
+    padded = np.pad(valid_mask, 1)
+    interior = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+    selected = ~interior[valid_mask]
+    selected |= (rows % ADAPTIVE_SEED_STEP == 0) & (cols % ADAPTIVE_SEED_STEP == 0)
+
+    while True:
+        vertex_ids = np.flatnonzero(selected)
+        tri = Delaunay(grid[vertex_ids])
+        simplices = vertex_ids[tri.simplices]
+        centroids = np.rint(grid[simplices].mean(axis=1)).astype(np.int64)
+        keep = valid_mask[centroids[:, 1], centroids[:, 0]]
+
+        # Barycentric interpolation of every pixel on the current TIN
+        containing = tri.find_simplex(grid)
+        transform = tri.transform[containing]
+        bary = np.einsum('ijk,ik->ij', transform[:, :2], grid - transform[:, 2])
+        weights = np.column_stack((bary, 1 - bary.sum(axis=1)))
+        interpolated = np.einsum('ij,ij->i', weights, z[simplices[containing]])
+        error = np.abs(z - interpolated)
+        error[(containing < 0) | ~keep[containing]] = np.inf
+        error[selected] = 0
 
+        candidates = np.flatnonzero(error > tolerance)
+        if len(candidates) == 0:
+            break
+        # Insert the worst pixel of each offending triangle
+        order = np.lexsort((error[candidates], containing[candidates]))
+        ranked = candidates[order]
+        last_of_triangle = np.append(np.diff(containing[ranked]) != 0, True)
+        selected[ranked[last_of_triangle]] = True
+
+    simplices = simplices[keep]
+    corner_counts = (valid_mask[:-1, :-1].astype(np.int8) + valid_mask[:-1, 1:] + valid_mask[1:, :-1] + valid_mask[1:, 1:])
+    grid_faces = 2 * int(np.count_nonzero(corner_counts == 4)) + int(np.count_nonzero(corner_counts == 3))
+    report = {
+        'vertices_in': len(z),
+        'vertices_out': len(np.unique(simplices)),
+        'faces_in': grid_faces,
+        'faces_out': len(simplices),
+        'max_deviation': float(error.max()) if len(error) else 0.0,
+    }
+    return simplices, report
+
+def calculate_face_slopes(vertices):
+    """
+    Slope in degrees and surface area of every triangle in an (N,3,3) vertex array.
+    The slope is the angle between each face normal and the vertical.
+    """
+    normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    horizontal = np.hypot(normals[:, 0], normals[:, 1])
+    slopes = np.degrees(np.arctan2(horizontal, np.abs(normals[:, 2])))
+    areas = 0.5 * np.hypot(horizontal, normals[:, 2])
+    return slopes, areas
+
+def classify_slopes(slopes, areas, breaks=SLOPE_CLASS_BREAKS, colors=SLOPE_CLASS_COLORS):
+    """
+    Maps slopes to ACI colors with one digitize against the class breaks (upper bounds inclusive)
+    and returns the per-face colors with per-class face counts and areas.
+    """
+    if len(colors) != len(breaks) + 1:
+        raise ValueError("colors must have one more entry than breaks.")
+    classes = np.digitize(slopes, breaks, right=True)
+    face_colors = np.asarray(colors)[classes]
+    counts = np.bincount(classes, minlength=len(colors))
+    class_areas = np.bincount(classes, weights=areas, minlength=len(colors))
+    bounds = [0.0, *breaks, 90.0]
+    stats = [
+        {
+            'color': colors[i],
+            'min_slope': bounds[i],
+            'max_slope': bounds[i + 1],
+            'faces': int(counts[i]),
+            'area': float(class_areas[i]),
+        }
+        for i in range(len(colors))
+    ]
+    return face_colors, stats
+
+def create_dxf_mesh(points, simplices, output_file, slope_breaks=SLOPE_CLASS_BREAKS, slope_colors=SLOPE_CLASS_COLORS,
+                    mesh_format='3dface', boundaries=None, binary=False):
+    """
+    Streams the mesh to a DXF file, colored by face slope, and returns the per-class slope statistics.
+    mesh_format '3dface' writes one 3DFACE per triangle; 'polyface' and 'mesh' write compact POLYFACE
+    or R2010 MESH entities that share vertices between faces. The boundary polygons are written into
+    the same file if given. binary writes a binary DXF.
+    """
+    if mesh_format not in MESH_FORMATS:
+        raise ValueError(f"mesh_format must be one of {MESH_FORMATS}.")
+    points = point_coords(points)
+    stats = None
+
+    with assemble_dxf(output_file, {'3D Mesh': None}, boundaries, binary) as writer:
+        for start in range(0, len(simplices), CHUNK_SIZE):
+            faces = simplices[start:start + CHUNK_SIZE]
+            vertices = points[faces]
+            slopes, areas = calculate_face_slopes(vertices)
+            face_colors, chunk_stats = classify_slopes(slopes, areas, slope_breaks, slope_colors)
+            stats = merge_slope_stats(stats, chunk_stats)
+            if mesh_format == 'polyface':
+                writer.add_polyface(points, faces, face_colors, layer='3D Mesh', invisible_edges=True)
+            elif mesh_format == 'mesh':
+                writer.add_mesh(points, faces, face_colors, layer='3D Mesh')
+            else:
+                writer.add_3dfaces(vertices, face_colors, layer='3D Mesh', invisible_edges=1 + 2 + 4)  # All edges invisible
+
+    if stats is None:
+        _, stats = classify_slopes(np.empty(0), np.empty(0), slope_breaks, slope_colors)
+    return stats
+
+def merge_slope_stats(total, chunk):
+    """Adds the face counts and areas of one chunk's slope statistics to the running totals."""
+    if total is None:
+        return chunk
+    for total_class, chunk_class in zip(total, chunk):
+        total_class['faces'] += chunk_class['faces']
+        total_class['area'] += chunk_class['area']
+    return total
+
+def write_boundaries(writer, transformed_data, layer='Boundaries'):
+    """Writes the transformed KML polygons to an open DXFStreamWriter as closed polylines."""
     for attributes, coordinates in transformed_data:
         if coordinates:
             points = coordinates + [coordinates[0]]  # Close the polygon
-            msp.add_lwpolyline(points, dxfattribs={'layer': 'Boundaries'})
-
-    doc.saveas(dxf_path)
-
-def merge(source, target):
-    logging.info("Starting the merge process.")
-    try:
-        importer = Importer(source, target)
-        logging.info("Importer created successfully.")
-        importer.import_modelspace()
-        logging.info("Modelspace entities imported successfully.")
-        importer.finalize()
-        logging.info("All resources and dependencies imported successfully.")
-    except Exception as e:
-        logging.error("Failed to merge DXF files: {}".format(e), exc_info=True)
-
-def merge_dxf_files(base_path, merge_path, output_path):
-    try:
-        base_dxf = ezdxf.readfile(base_path)
-        logging.info("Base file {} read successfully.".format(base_path))
-
-        merge_dxf = ezdxf.readfile(merge_path)
-        logging.info("Merge file {} read successfully.".format(merge_path))
-
-        merge(merge_dxf, base_dxf)
-        base_dxf.saveas(output_path)
-        logging.info("Merged file saved successfully as {}.".format(output_path))
-    except Exception as e:
-        logging.error("Error processing DXF files: {}".format(e), exc_info=True)
+            writer.add_lwpolyline(points, layer=layer)
+
+def data_to_dxf(transformed_data, dxf_path, binary=False):
+    with DXFStreamWriter(dxf_path, layers={'Boundaries': None}, binary=binary) as writer:
+        write_boundaries(writer, transformed_data)
+
+@contextmanager
+def assemble_dxf(output_file, layers, boundaries=None, binary=False):
+    """
+    Opens a DXFStreamWriter for one output document with the given layers, as binary DXF if binary.
+    If boundaries (transformed KML data) are given, the Boundaries layer is added and the polygons
+    are written in before the file is closed, so the output needs no merging afterwards.
+    """
+    layers = dict(layers)
+    if boundaries is not None:
+        layers['Boundaries'] = None
+    with DXFStreamWriter(output_file, layers=layers, binary=binary) as writer:
+        yield writer
+        if boundaries is not None:
+            write_boundaries(writer, boundaries)
@@ -0,0 +1,177 @@
+import os
+from collections import defaultdict
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+import shapely
+from osgeo import gdal, ogr
+from utils.process_pool import spawn_pool
+from terrain_processing.terrain_processing import (contour_dataset, create_contour_layer, contour_class,
+                                                   major_interval_for)
+
+CONTOUR_TILE_PIXELS = int(os.environ.get('TERRAINXACT_CONTOUR_TILE_PIXELS', 2048))  # Cells per tile side
+CONTOUR_WORKERS = os.cpu_count() or 1  # Contour processes per raster unless the caller gives its share of the CPUs
+
+
+def contour_windows(xsize, ysize, tile_pixels=CONTOUR_TILE_PIXELS):
+    """
+    Splits a raster into tiles for contouring.
+
+    Contours run between pixel centers, so neighbouring tiles share one row or column of pixels and
+    each tile owns the cells between its first and last pixel centers. Sides on a tile seam are
+    clipped at the shared pixel centers; sides on the raster edge are left open so the lines GDAL
+    draws out to the edge of the outer pixels are kept.
+
+    Returns:
+        list of (xoff, yoff, width, height, bounds), bounds being (xmin, ymin, xmax, ymax) in pixel
+        coordinates of the whole raster
+    """
+    windows = []
+    for y0 in range(0, max(ysize - 1, 1), tile_pixels):
+        y1 = min(y0 + tile_pixels, ysize - 1)
+        for x0 in range(0, max(xsize - 1, 1), tile_pixels):
+            x1 = min(x0 + tile_pixels, xsize - 1)
+            bounds = (x0 + 0.5 if x0 > 0 else -1.0,
+                      y0 + 0.5 if y0 > 0 else -1.0,
+                      x1 + 0.5 if x1 < xsize - 1 else xsize + 1.0,
+                      y1 + 0.5 if y1 < ysize - 1 else ysize + 1.0)
+            windows.append((x0, y0, x1 - x0 + 1, y1 - y0 + 1, bounds))
+    return windows
+
+
+def clip_to_tile(elev, coords, bounds, seams):
+    """
+    Clips one contour line (pixel coordinates) to the cells a tile owns.
+
+    Returns:
+        list of (elev, coords, on_seam), on_seam telling whether the piece ends on a tile seam and
+        has to be joined with the piece continuing in the neighbouring tile
+    """
+    xmin, ymin, xmax, ymax = bounds
+    if coords[:, 0].min() >= xmin and coords[:, 0].max() <= xmax and \
+            coords[:, 1].min() >= ymin and coords[:, 1].max() <= ymax:
+        parts = [coords]
+    else:
+        clipped = shapely.clip_by_rect(shapely.linestrings(coords), xmin, ymin, xmax, ymax)
+        parts = [shapely.get_coordinates(part) for part in shapely.get_parts(clipped)
+                 if shapely.get_type_id(part) == 1 and len(shapely.get_coordinates(part)) > 1]
+
+    pieces = []
+    for part in parts:
+        ends = part[[0, -1]]
+        on_seam = bool(np.isin(ends[:, 0], seams[0]).any() or np.isin(ends[:, 1], seams[1]).any())
+        pieces.append((elev, part, on_seam))
+    return pieces
+
+
+def contour_tile(values, xoff, yoff, bounds, interval, nodata, data_type):
+    """
+    Contours one tile of a raster band, given as an array.
+
+    The tile is contoured without a geotransform, so line coordinates are pixel coordinates and a
+    seam vertex computed by two neighbouring tiles is the same float in both once the tile offset is
+    added. Returns the clipped line pieces, as clip_to_tile does.
+    """
+    rows, cols = values.shape
+    tile_ds = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, data_type)
+    band = tile_ds.GetRasterBand(1)
+    band.WriteArray(values)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+
+    vector_ds = ogr.GetDriverByName('Memory').CreateDataSource('tile')
+    layer = vector_ds.CreateLayer('contour', geom_type=ogr.wkbLineString)
+    layer.CreateField(ogr.FieldDefn("elev", ogr.OFTReal))
+    gdal.ContourGenerate(band, interval, 0, [], nodata is not None, nodata or 0, layer, -1, 0)
+
+    xmin, ymin, xmax, ymax = bounds
+    seams = ([edge for edge in (xmin, xmax) if edge % 1 == 0.5], [edge for edge in (ymin, ymax) if edge % 1 == 0.5])
+    pieces = []
+    for feature in layer:
+        coords = np.array(feature.GetGeometryRef().GetPoints(), dtype=np.float64)[:, :2]
+        if len(coords) < 2:
+            continue
+        coords += (xoff, yoff)
+        pieces.extend(clip_to_tile(feature.GetField(0), coords, bounds, seams))
+    return pieces
+
+
+def stitch_pieces(pieces):
+    """
+    Joins line pieces that end on a tile seam into continuous lines, level by level.
+    Pieces are joined head to tail only, so every line keeps the direction GDAL gave it.
+
+    Returns:
+        list of (elev, coords) sorted by elevation
+    """
+    lines = []
+    seam_pieces = defaultdict(list)
+    for elev, coords, on_seam in pieces:
+        if on_seam:
+            seam_pieces[elev].append(coords)
+        else:
+            lines.append((elev, coords))
+
+    for elev, parts in seam_pieces.items():
+        merged = shapely.line_merge(shapely.multilinestrings([shapely.linestrings(c) for c in parts]), directed=True)
+        lines.extend((elev, shapely.get_coordinates(line)) for line in shapely.get_parts(merged))
+    lines.sort(key=lambda line: line[0])
+    return lines
+
+
+def _contour_pieces(band, windows, interval, workers):
+    """Contours every window of a band, in a process pool with at most two tiles per worker in flight."""
+    nodata = band.GetNoDataValue()
+
+    def tile_args(window):
+        xoff, yoff, width, height, bounds = window
+        return band.ReadAsArray(xoff, yoff, width, height), xoff, yoff, bounds, interval, nodata, band.DataType
+
+    if workers <= 1:
+        for window in windows:
+            yield from contour_tile(*tile_args(window))
+        return
+
+    with spawn_pool(workers) as pool:
+        running = set()
+        for window in windows:
+            if len(running) >= 2 * workers:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield from future.result()
+            running.add(pool.submit(contour_tile, *tile_args(window)))
+        for future in running:
+            yield from future.result()
+
+
+def tiled_contour_dataset(input_ds, interval=1, output_path='contours', driver='Memory', major_interval=None,
+                          tile_pixels=CONTOUR_TILE_PIXELS, workers=CONTOUR_WORKERS):
+    """
+    Contours the first band of an open raster like contour_dataset, tile by tile across a process pool.
+
+    Tiles are read one window at a time and contoured in parallel; the pieces are clipped to the
+    cells each tile owns and stitched back into continuous lines across tile seams, then written to
+    the same ID/elev/class layer a single ContourGenerate pass produces. Rasters that fit in one
+    tile are contoured in a single pass.
+    """
+    band = input_ds.GetRasterBand(1)
+    if band.XSize <= tile_pixels + 1 and band.YSize <= tile_pixels + 1:
+        return contour_dataset(input_ds, interval, output_path, driver, major_interval)
+
+    windows = contour_windows(band.XSize, band.YSize, tile_pixels)
+    lines = stitch_pieces(_contour_pieces(band, windows, interval, min(workers, len(windows))))
+
+    major_interval = major_interval_for(interval, major_interval)
+    contour_ds, contour_layer = create_contour_layer(input_ds, output_path, driver)
+    gt = input_ds.GetGeoTransform()
+    layer_defn = contour_layer.GetLayerDefn()
+    for feature_id, (elev, coords) in enumerate(lines):
+        px, py = coords[:, 0], coords[:, 1]
+        xyz = np.column_stack([gt[0] + px * gt[1] + py * gt[2], gt[3] + px * gt[4] + py * gt[5],
+                               np.full(len(coords), elev)])
+        feature = ogr.Feature(layer_defn)
+        feature.SetField("ID", feature_id)
+        feature.SetField("elev", elev)
+        feature.SetField("class", contour_class(elev, major_interval))
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(shapely.to_wkb(shapely.linestrings(xyz))))
+        contour_layer.CreateFeature(feature)
+    return contour_ds
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from terrain_processing.terrain_processing import create_adaptive_mesh, ADAPTIVE_SEED_STEP
+
+
+def surface(valid_mask, fn):
+    rows, cols = np.nonzero(valid_mask)
+    return np.column_stack((cols, rows, fn(cols, rows))).astype(np.float64)
+
+
+def tin_deviation(points, simplices):
+    """Largest vertical distance of any point from the triangle containing it, found by brute force."""
+    xy, z = points[:, :2], points[:, 2]
+    a, b, c = (xy[simplices[:, i]] for i in range(3))
+    det = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+    dx, dy = xy[:, None, 0] - a[None, :, 0], xy[:, None, 1] - a[None, :, 1]
+    u = (dx * (c[:, 1] - a[:, 1]) - dy * (c[:, 0] - a[:, 0])) / det
+    v = (dy * (b[:, 0] - a[:, 0]) - dx * (b[:, 1] - a[:, 1])) / det
+    inside = (u >= -1e-9) & (v >= -1e-9) & (u + v <= 1 + 1e-9)
+    assert inside.any(axis=1).all(), "every pixel must be covered by the TIN"
+    zs = z[simplices]
+    interpolated = zs[:, 0] + u * (zs[:, 1] - zs[:, 0]) + v * (zs[:, 2] - zs[:, 0])
+    return np.where(inside, np.abs(z[:, None] - interpolated), 0).max()
+
+
+@pytest.fixture
+def holed_mask():
+    valid_mask = np.ones((40, 45), dtype=bool)
+    valid_mask[15:19, 20:26] = False  # nodata hole
+    valid_mask[:6, 38:] = False  # notch in the outline
+    return valid_mask
+
+
+@pytest.mark.parametrize('tolerance', [0.05, 0.2, 1.0])
+def test_every_pixel_is_within_the_tolerance(holed_mask, tolerance):
+    points = surface(holed_mask, lambda x, y: 3 * np.sin(x / 6.0) * np.cos(y / 5.0) + 0.1 * x)
+    simplices, report = create_adaptive_mesh(points, holed_mask, tolerance)
+    assert report['max_deviation'] <= tolerance
+    assert tin_deviation(points, simplices) <= tolerance + 1e-9
+
+
+def test_reduction_report_bounds(holed_mask):
+    points = surface(holed_mask, lambda x, y: 3 * np.sin(x / 6.0) * np.cos(y / 5.0))
+    simplices, report = create_adaptive_mesh(points, holed_mask, 0.2)
+    assert report['vertices_in'] == len(points)
+    assert report['vertices_out'] == len(np.unique(simplices)) <= report['vertices_in']
+    assert report['faces_out'] == len(simplices) < report['faces_in']
+    corner_counts = (holed_mask[:-1, :-1].astype(int) + holed_mask[:-1, 1:] + holed_mask[1:, :-1] + holed_mask[1:, 1:])
+    assert report['faces_in'] == 2 * np.count_nonzero(corner_counts == 4) + np.count_nonzero(corner_counts == 3)
+
+
+def test_plane_keeps_only_the_outline_and_seeds(holed_mask):
+    points = surface(holed_mask, lambda x, y: 0.5 * x - 0.25 * y)
+    simplices, report = create_adaptive_mesh(points, holed_mask, 0.01)
+    rows, cols = np.nonzero(holed_mask)
+    padded = np.pad(holed_mask, 1)
+    interior = (padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:])[holed_mask]
+    seeds = (rows % ADAPTIVE_SEED_STEP == 0) & (cols % ADAPTIVE_SEED_STEP == 0)
+    assert set(np.unique(simplices)) == set(np.flatnonzero(~interior | seeds))
+    assert report['max_deviation'] == pytest.approx(0, abs=1e-9)
+
+
+def test_no_triangle_covers_nodata(holed_mask):
+    points = surface(holed_mask, lambda x, y: 0.0 * x)
+    simplices, _ = create_adaptive_mesh(points, holed_mask, 0.1)
+    centroids = np.rint(points[simplices, :2].mean(axis=1)).astype(int)
+    assert holed_mask[centroids[:, 1], centroids[:, 0]].all()
+
+
+def test_points_must_match_the_mask(holed_mask):
+    points = surface(holed_mask, lambda x, y: 0.0 * x)
+    with pytest.raises(ValueError):
+        create_adaptive_mesh(points[:-1], holed_mask, 0.1)
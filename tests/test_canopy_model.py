@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pdal')
+pytest.importorskip('geopandas')
+rasterio = pytest.importorskip('rasterio')
+
+from rasterio.transform import from_origin
+from pvsyst_canopy.pvsyst_canopy import generate_canopy_model, CANOPY_BYTES_PER_PIXEL
+from utils.point_formats import read_points
+
+NODATA = -9999.0
+TRANSFORM = from_origin(280000.0, 4150000.0, 2.0, 2.0)
+
+
+def write_raster(path, values, transform=TRANSFORM):
+    with rasterio.open(path, 'w', driver='GTiff', width=values.shape[1], height=values.shape[0], count=1,
+                       dtype='float32', crs='EPSG:32618', transform=transform, nodata=NODATA) as dst:
+        dst.write(values.astype(np.float32), 1)
+
+
+@pytest.fixture
+def surfaces(tmp_path):
+    """A DTM, and a DSM with trees, bare ground, a pixel below the terrain and nodata in either raster."""
+    rng = np.random.default_rng(1)
+    dtm = 100 + 0.01 * np.arange(50)[None, :] + np.zeros((40, 50))
+    dsm = dtm + np.where(rng.random((40, 50)) < 0.3, rng.uniform(1, 20, (40, 50)), 0)
+    dsm[5, 5] = dtm[5, 5] - 1
+    dsm[10:12, 20:25] = NODATA
+    dtm[30, 40:45] = NODATA
+    dsm_path, dtm_path = str(tmp_path / 'dsm.tif'), str(tmp_path / 'dtm.tif')
+    write_raster(dsm_path, dsm)
+    write_raster(dtm_path, dtm)
+    return dsm_path, dtm_path, dsm.astype(np.float32), dtm.astype(np.float32)
+
+
+def expected_canopy(dsm, dtm):
+    canopy = np.where((dsm > dtm) & (dsm != NODATA) & (dtm != NODATA), dsm, np.nan)
+    rows, cols = np.nonzero(~np.isnan(canopy))
+    xs, ys = rasterio.transform.xy(TRANSFORM, rows, cols, offset='center')
+    return canopy, np.column_stack((xs, ys, canopy[rows, cols]))
+
+
+@pytest.mark.parametrize('rows_per_window', [1, 7, 1000])
+def test_canopy_matches_a_whole_raster_computation(tmp_path, surfaces, rows_per_window):
+    dsm_path, dtm_path, dsm, dtm = surfaces
+    raster_path, csv_path, npy_path = (str(tmp_path / name) for name in ('chm.tif', 'chm.csv', 'chm.npy'))
+    generate_canopy_model(dsm_path, dtm_path, raster_path, csv_path, npy_path,
+                          memory_bytes=rows_per_window * 50 * CANOPY_BYTES_PER_PIXEL)
+
+    canopy, points = expected_canopy(dsm, dtm)
+    with rasterio.open(raster_path) as chm:
+        np.testing.assert_array_equal(chm.read(1), canopy)
+    npy_points = read_points(npy_path)
+    np.testing.assert_allclose(np.column_stack((npy_points['x'], npy_points['y'], npy_points['z'])), points)
+    with open(csv_path) as f:
+        assert f.readline() == "X,Y,Z\n"
+        assert sum(1 for _ in f) == len(points)  # One header, whatever the number of windows
+    csv_points = read_points(csv_path)
+    np.testing.assert_allclose(np.column_stack((csv_points['x'], csv_points['y'], csv_points['z'])), points)
+
+
+def test_larger_dsm_is_resampled_onto_the_dtm_grid(tmp_path, surfaces):
+    dsm_path, dtm_path, dsm, dtm = surfaces
+    fine_dsm = np.repeat(np.repeat(dsm, 2, axis=0), 2, axis=1)
+    fine_path = str(tmp_path / 'dsm_fine.tif')
+    write_raster(fine_path, fine_dsm, from_origin(280000.0, 4150000.0, 1.0, 1.0))
+    raster_path = str(tmp_path / 'chm.tif')
+    generate_canopy_model(fine_path, dtm_path, raster_path, str(tmp_path / 'chm.csv'))
+
+    with rasterio.open(raster_path) as chm:
+        assert chm.shape == dtm.shape
+        np.testing.assert_array_equal(chm.read(1), expected_canopy(dsm, dtm)[0])
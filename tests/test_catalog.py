@@ -0,0 +1,87 @@
+import json
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('requests')
+
+import shapely
+from shapely.geometry import box
+from pvsyst_canopy import catalog as catalog_module
+from pvsyst_canopy.catalog import load_catalog
+from utils.crs_cache import get_transformer
+
+# Dataset boundaries in EPSG:4326: a grid of 1 degree squares over the eastern US
+BOUNDARIES = [(f'USGS_LPC_{i}_{j}', (-80 + i, 35 + j, -79 + i, 36 + j)) for i in range(6) for j in range(4)]
+
+
+def write_boundaries(path, boundaries=BOUNDARIES):
+    features = [{'type': 'Feature',
+                 'properties': {'name': name, 'url': f'https://example.com/{name}/ept.json', 'count': 1000000},
+                 'geometry': box(*bounds).__geo_interface__}
+                for name, bounds in boundaries]
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+
+def aoi_3857(*bounds):
+    transformer = get_transformer("EPSG:4326", "EPSG:3857", always_xy=True)
+    return shapely.transform(box(*bounds), lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / 'resources.geojson')
+    write_boundaries(path)
+    return path
+
+
+@pytest.mark.parametrize('bounds', [(-77.5, 36.5, -77.4, 36.6), (-78.1, 35.9, -77.9, 36.1), (-90, 10, -89, 11),
+                                    (-81, 34, -73, 40)])
+def test_tree_query_matches_a_scan_of_every_boundary(tmp_path, source, bounds):
+    catalog = load_catalog(source, str(tmp_path / 'cache'), 3600)
+    aoi = aoi_3857(*bounds)
+    expected = [name for name, geometry in zip(catalog.names, catalog.geometries) if geometry.intersects(aoi)]
+    names, num_pts_est = catalog.find_datasets(aoi)
+    assert names == expected
+    assert num_pts_est == sum(int(aoi.area / geometry.area * 1000000)
+                              for name, geometry in zip(catalog.names, catalog.geometries) if name in expected)
+
+
+def test_corner_aoi_finds_the_four_datasets_around_it(tmp_path, source):
+    catalog = load_catalog(source, str(tmp_path / 'cache'), 3600)
+    names, _ = catalog.find_datasets(aoi_3857(-78.1, 35.9, -77.9, 36.1))
+    assert names == ['USGS_LPC_1_0', 'USGS_LPC_1_1', 'USGS_LPC_2_0', 'USGS_LPC_2_1']
+    assert catalog.find_datasets(aoi_3857(-90, 10, -89, 11)) == ([], 0)
+
+
+def test_cached_catalog_is_read_without_parsing(tmp_path, source, monkeypatch):
+    cache = str(tmp_path / 'cache')
+    first = load_catalog(source, cache, 3600)
+
+    def fail(content):
+        raise AssertionError("the source should not be parsed again")
+
+    monkeypatch.setattr(catalog_module, 'parse_boundaries', fail)
+    second = load_catalog(source, cache, 3600)
+    assert second.names.tolist() == first.names.tolist()
+    assert shapely.equals(second.geometries, first.geometries).all()
+    # Expired but unchanged: revalidated by modification time and still not parsed
+    assert len(load_catalog(source, cache, 0)) == len(BOUNDARIES)
+
+
+def test_changed_source_is_parsed_again(tmp_path, source):
+    cache = str(tmp_path / 'cache')
+    load_catalog(source, cache, 0)
+    write_boundaries(source, BOUNDARIES[:3])
+    os.utime(source, ns=(1, 1))  # A different modification time, even on coarse-grained file systems
+    assert len(load_catalog(source, cache, 0)) == 3
+
+
+def test_unreachable_source_falls_back_to_the_cache(tmp_path, source):
+    cache = str(tmp_path / 'cache')
+    load_catalog(source, cache, 0)
+    os.remove(source)
+    assert len(load_catalog(source, cache, 0)) == len(BOUNDARIES)
+    with pytest.raises(OSError):
+        load_catalog(source, str(tmp_path / 'empty_cache'), 0)
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip('osgeo')
+
+from terrain_processing.terrain_processing import is_multiple, contour_class, major_interval_for
+
+
+@pytest.mark.parametrize('value, interval', [(10, 5), (0, 5), (-15, 5), (7.5, 2.5), (0.3, 0.1), (1.2, 0.4), (2, 2)])
+def test_multiples(value, interval):
+    assert is_multiple(value, interval)
+
+
+@pytest.mark.parametrize('value, interval', [(5, 2), (0.35, 0.1), (2.5, 5), (1, 3), (10.001, 5)])
+def test_not_multiples(value, interval):
+    assert not is_multiple(value, interval)
+
+
+def test_contour_class():
+    assert contour_class(25.0, 5) == 'major'
+    assert contour_class(0.6000000000000001, 0.2) == 'major'
+    assert contour_class(26.0, 5) == 'minor'
+    assert major_interval_for(0.5) == 2.5
+    assert major_interval_for(0.5, 2) == 2
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+import shapely
+from terrain_processing.contour_simplify import simplify_lines, budget_tolerance, BUDGET_ITERATIONS
+
+
+def wavy_lines(count=8, length=400):
+    """Parallel noisy contour-like lines one unit apart."""
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 100, length)
+    return shapely.linestrings([np.column_stack((x, i + 0.3 * np.sin(x / 3 + i) + 0.05 * rng.standard_normal(length)))
+                                for i in range(count)])
+
+
+def vertices(lines, tolerance):
+    return int(shapely.get_num_coordinates(shapely.simplify(lines, tolerance, preserve_topology=False)).sum())
+
+
+def test_budget_already_met_needs_no_simplification():
+    lines = wavy_lines()
+    assert budget_tolerance(lines, int(shapely.get_num_coordinates(lines).sum())) == 0.0
+
+
+@pytest.mark.parametrize('vertex_budget', [100, 500, 1500])
+def test_bisection_finds_the_smallest_tolerance_within_the_budget(vertex_budget):
+    lines = wavy_lines()
+    tolerance = budget_tolerance(lines, vertex_budget)
+    assert vertices(lines, tolerance) <= vertex_budget
+    # The bisection ends one step above a tolerance that still exceeds the budget
+    xmin, ymin, xmax, ymax = shapely.total_bounds(lines)
+    step = max(xmax - xmin, ymax - ymin) / 2 ** BUDGET_ITERATIONS
+    assert vertices(lines, tolerance - step) > vertex_budget
+
+
+def test_smaller_budgets_need_larger_tolerances():
+    lines = wavy_lines()
+    tolerances = [budget_tolerance(lines, budget) for budget in (2000, 800, 300, 50)]
+    assert tolerances == sorted(tolerances)
+
+
+def test_budget_below_the_end_points_keeps_the_end_points():
+    lines = wavy_lines()
+    tolerance = budget_tolerance(lines, 1)
+    assert vertices(lines, tolerance) == 2 * len(lines)
+
+
+def test_simplified_contours_keep_their_order_and_never_cross():
+    lines = wavy_lines()
+    simplified = simplify_lines(lines, 0.6)
+    assert len(simplified) == len(lines)
+    assert shapely.get_num_coordinates(simplified).sum() < shapely.get_num_coordinates(lines).sum()
+    np.testing.assert_allclose([line.coords[0][1] for line in simplified], [line.coords[0][1] for line in lines])
+    for i in range(len(simplified)):
+        for j in range(i + 1, len(simplified)):
+            assert not simplified[i].intersects(simplified[j])
+
+
+def test_zero_tolerance_returns_the_lines():
+    lines = wavy_lines()
+    assert simplify_lines(lines, 0) is lines
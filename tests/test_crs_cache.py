@@ -0,0 +1,43 @@
+import pytest
+from pyproj import CRS
+from utils import crs_cache
+from utils.crs_cache import get_crs, get_transformer, clear_crs_cache, _crs_key
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_crs_cache()
+    yield
+    clear_crs_cache()
+
+
+def test_crs_keys_are_normalised():
+    assert _crs_key(4326) == 'EPSG:4326'
+    assert _crs_key('epsg:4326') == 'EPSG:4326'
+    assert _crs_key(CRS.from_epsg(4326)) == CRS.from_epsg(4326).to_wkt()
+    wkt = CRS.from_epsg(32633).to_wkt()
+    assert _crs_key(wkt) == wkt  # Long definitions are case-sensitive and kept as they are
+
+
+def test_equivalent_inputs_share_one_crs():
+    assert get_crs(4326) is get_crs('epsg:4326') is get_crs('EPSG:4326')
+    assert get_crs(4326) == CRS.from_epsg(4326)
+
+
+def test_transformers_are_shared_per_direction_and_axis_order():
+    transformer = get_transformer('EPSG:4326', 'EPSG:3857', always_xy=True)
+    assert get_transformer(4326, 'epsg:3857', always_xy=True) is transformer
+    assert get_transformer('EPSG:4326', 'EPSG:3857') is not transformer
+    assert get_transformer('EPSG:3857', 'EPSG:4326', always_xy=True) is not transformer
+    x, y = transformer.transform(0.0, 0.0)
+    assert abs(x) < 1e-6 and abs(y) < 1e-6
+
+
+def test_cache_is_bounded_and_least_recently_used(monkeypatch):
+    monkeypatch.setattr(crs_cache, 'CRS_CACHE_SIZE', 2)
+    first = get_crs(4326)
+    get_crs(3857)
+    get_crs(4326)  # 3857 is now the least recently used
+    get_crs(32633)
+    assert list(crs_cache._crs_cache) == ['EPSG:4326', 'EPSG:32633']
+    assert get_crs(4326) is first
@@ -0,0 +1,82 @@
+import os
+import threading
+import pytest
+from utils.disk_cache import DiskCache, cache_key
+
+
+def store(cache, key, data):
+    with cache.store(key) as tmp_dir:
+        with open(os.path.join(tmp_dir, 'data'), 'wb') as f:
+            f.write(data)
+    return cache.entry_dir(key)
+
+
+def age(cache, key, seconds_ago):
+    timestamp = os.path.getmtime(cache.entry_dir(key)) - seconds_ago
+    os.utime(cache.entry_dir(key), (timestamp, timestamp))
+
+
+def test_cache_key_is_stable_and_order_independent_for_dicts():
+    assert cache_key('stage', {'a': 1, 'b': 2}) == cache_key('stage', {'b': 2, 'a': 1})
+    assert cache_key('stage', 1) != cache_key('stage', 2)
+
+
+def test_lookup_counts_hits_and_misses(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20)
+    assert cache.lookup('k') is None
+    store(cache, 'k', b'x')
+    assert cache.lookup('k') == cache.entry_dir('k')
+    assert cache.lookup('other', count=False) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (1, 1, 1, 1)
+
+
+def test_failed_store_leaves_no_entry(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20)
+    with pytest.raises(RuntimeError):
+        with cache.store('k') as tmp_dir:
+            open(os.path.join(tmp_dir, 'data'), 'wb').close()
+            raise RuntimeError
+    assert cache.lookup('k') is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), 25)
+    store(cache, 'a', b'0' * 10)
+    store(cache, 'b', b'0' * 10)
+    age(cache, 'a', 20)
+    age(cache, 'b', 10)
+    cache.lookup('a')  # a is now the most recently used
+    store(cache, 'c', b'0' * 10)
+    assert sorted(cache.keys()) == ['a', 'c']
+    assert sorted(os.listdir(str(tmp_path))) == ['a', 'c']  # Evicted entries leave no renamed directory behind
+
+
+def test_new_entry_is_kept_even_if_larger_than_the_cache(tmp_path):
+    cache = DiskCache(str(tmp_path), 5)
+    store(cache, 'a', b'0' * 4)
+    store(cache, 'big', b'0' * 10)
+    assert cache.keys() == ['big']
+
+
+def test_store_race_keeps_the_first_finished_entry(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20)
+    with cache.store('k') as tmp_dir:
+        with open(os.path.join(tmp_dir, 'data'), 'wb') as f:
+            f.write(b'second')
+        # Another writer finishes the same entry while this one is still writing
+        other = threading.Thread(target=store, args=(cache, 'k', b'first'))
+        other.start()
+        other.join()
+    with open(os.path.join(cache.entry_dir('k'), 'data'), 'rb') as f:
+        assert f.read() == b'first'
+    assert os.listdir(str(tmp_path)) == ['k']
+
+
+def test_keys_skip_partial_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20)
+    store(cache, 'done', b'x')
+    with cache.store('partial'):
+        assert cache.keys() == ['done']
+        assert cache.lookup('partial') is None
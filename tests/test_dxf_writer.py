@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+import ezdxf
+from terrain_processing.dxf_writer import DXFStreamWriter, POLYFACE_MAX_FACES
+
+DXF_FORMATS = [False, True]  # ASCII, binary
+
+
+def read_back(path):
+    """Reads a DXF with ezdxf and checks that its audit finds no errors."""
+    doc = ezdxf.readfile(path)
+    auditor = doc.audit()
+    assert not auditor.has_errors, [error.message for error in auditor.errors]
+    return doc
+
+
+def grid_mesh(size):
+    """Points and triangles of a size x size vertex grid with a gentle slope."""
+    ys, xs = np.mgrid[0:size, 0:size]
+    points = np.column_stack((xs.ravel(), ys.ravel(), 0.1 * xs.ravel() + 0.05 * ys.ravel())).astype(np.float64)
+    index = np.arange(size * size).reshape(size, size)
+    a, b, c, d = index[:-1, :-1].ravel(), index[:-1, 1:].ravel(), index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    faces = np.concatenate((np.column_stack((a, b, c)), np.column_stack((b, d, c))))
+    return points, faces
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_points(tmp_path, binary):
+    path = str(tmp_path / 'points.dxf')
+    points = np.random.default_rng(0).uniform(0, 100, (500, 3))
+    with DXFStreamWriter(path, layers={'Points': 3}, binary=binary) as writer:
+        writer.add_points(points, layer='Points')
+    doc = read_back(path)
+    entities = doc.modelspace().query('POINT')
+    assert len(entities) == len(points)
+    assert {entity.dxf.layer for entity in entities} == {'Points'}
+    assert doc.layers.get('Points').color == 3
+    np.testing.assert_allclose([tuple(entity.dxf.location) for entity in entities], points)
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_3dfaces_with_colors(tmp_path, binary):
+    path = str(tmp_path / 'faces.dxf')
+    points, faces = grid_mesh(5)
+    colors = np.arange(len(faces)) % 7 + 1
+    with DXFStreamWriter(path, layers={'3D Mesh': None}, binary=binary) as writer:
+        writer.add_3dfaces(points[faces], colors, layer='3D Mesh', invisible_edges=7)
+    entities = read_back(path).modelspace().query('3DFACE')
+    assert len(entities) == len(faces)
+    assert [entity.dxf.color for entity in entities] == colors.tolist()
+    first = entities[0]
+    np.testing.assert_allclose([first.dxf.vtx0, first.dxf.vtx1, first.dxf.vtx2], points[faces[0]])
+    assert tuple(first.dxf.vtx3) == tuple(first.dxf.vtx2)
+    assert first.dxf.invisible_edges == 7
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_polyface_is_split_below_the_vertex_index_limit(tmp_path, binary):
+    path = str(tmp_path / 'polyface.dxf')
+    points, faces = grid_mesh(76)  # 11250 faces: two polyfaces
+    assert len(faces) > POLYFACE_MAX_FACES
+    colors = np.where(np.arange(len(faces)) % 2 == 0, 1, 5)
+    with DXFStreamWriter(path, layers={'3D Mesh': None}, binary=binary) as writer:
+        writer.add_polyface(points, faces, colors, layer='3D Mesh', invisible_edges=True)
+    polyfaces = read_back(path).modelspace().query('POLYLINE')
+    assert len(polyfaces) == 2 and all(polyface.is_poly_face_mesh for polyface in polyfaces)
+    read_faces = [face for polyface in polyfaces for face in polyface.faces()]
+    assert len(read_faces) == len(faces)
+    # Every face ends with its face record, which carries the color; the corners come first
+    np.testing.assert_allclose([vertex.dxf.location for vertex in read_faces[0][:3]], points[faces[0]])
+    assert [face[-1].dxf.color for face in read_faces[:4]] == colors[:4].tolist()
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_mesh_is_one_entity_per_color(tmp_path, binary):
+    path = str(tmp_path / 'mesh.dxf')
+    points, faces = grid_mesh(6)
+    colors = np.where(np.arange(len(faces)) < 10, 2, 4)
+    with DXFStreamWriter(path, layers={'3D Mesh': None}, binary=binary) as writer:
+        writer.add_mesh(points, faces, colors, layer='3D Mesh')
+    meshes = read_back(path).modelspace().query('MESH')
+    assert sorted(mesh.dxf.color for mesh in meshes) == [2, 4]
+    assert sum(len(mesh.faces) for mesh in meshes) == len(faces)
+    for mesh in meshes:
+        assert all(len(face) == 3 for face in mesh.faces)
+        vertices = np.asarray(mesh.vertices)
+        assert np.all(np.isin(vertices[:, 0], points[:, 0]))
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_polylines(tmp_path, binary):
+    path = str(tmp_path / 'polylines.dxf')
+    line = np.array([[0, 0, 10], [5, 0, 10], [5, 5, 10.5]], dtype=np.float64)
+    with DXFStreamWriter(path, layers={'Contours Major': 1, 'Boundaries': None}, binary=binary) as writer:
+        writer.add_polyline3d(line, layer='Contours Major', color=1)
+        writer.add_lwpolyline(line[:, :2], layer='Boundaries', closed=True, elevation=2.5)
+    msp = read_back(path).modelspace()
+    polyline = msp.query('POLYLINE').first
+    assert polyline.is_3d_polyline and polyline.dxf.color == 1
+    np.testing.assert_allclose(list(polyline.points()), line)
+    lwpolyline = msp.query('LWPOLYLINE').first
+    assert lwpolyline.closed and lwpolyline.dxf.elevation == 2.5
+    np.testing.assert_allclose(lwpolyline.get_points('xy'), line[:, :2])
+
+
+def test_binary_dxf_is_smaller_than_ascii(tmp_path):
+    points = np.random.default_rng(0).uniform(0, 1000, (5000, 3))
+    sizes = []
+    for binary in DXF_FORMATS:
+        path = tmp_path / f'points_{binary}.dxf'
+        with DXFStreamWriter(str(path), binary=binary) as writer:
+            writer.add_points(points)
+        sizes.append(path.stat().st_size)
+    assert sizes[1] < sizes[0]
+    assert open(tmp_path / 'points_True.dxf', 'rb').read(22) == b'AutoCAD Binary DXF\r\n\x1a\x00'
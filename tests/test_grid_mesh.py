@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from terrain_processing.terrain_processing import create_grid_mesh, create_mesh
+
+
+def pixel_coords(valid_mask):
+    """Column/row of every valid pixel, in the row-major order the points are written in."""
+    rows, cols = np.nonzero(valid_mask)
+    return np.column_stack((cols, rows)).astype(np.float64)
+
+
+def triangle_areas(coords, simplices):
+    a, b, c = (coords[simplices[:, i]] for i in range(3))
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+@pytest.fixture
+def holed_mask():
+    valid_mask = np.ones((6, 7), dtype=bool)
+    valid_mask[2, 3] = False  # A one-pixel nodata hole
+    valid_mask[4:, :2] = False  # A notch in the outline
+    return valid_mask
+
+
+def test_full_grid_gives_two_triangles_per_cell():
+    valid_mask = np.ones((4, 5), dtype=bool)
+    simplices = create_grid_mesh(valid_mask)
+    assert len(simplices) == 2 * 3 * 4
+    assert np.allclose(triangle_areas(pixel_coords(valid_mask), simplices), 0.5)
+
+
+def test_nodata_holes_are_not_bridged(holed_mask):
+    simplices = create_grid_mesh(holed_mask)
+    coords = pixel_coords(holed_mask)
+    assert simplices.min() >= 0 and simplices.max() < len(coords)
+
+    # Every triangle stays within one grid cell, so none spans the hole or the notch
+    corners = coords[simplices]
+    assert np.all(corners.max(axis=1) - corners.min(axis=1) <= 1)
+    assert np.allclose(triangle_areas(coords, simplices), 0.5)
+
+    corner_counts = (holed_mask[:-1, :-1].astype(int) + holed_mask[:-1, 1:] + holed_mask[1:, :-1] + holed_mask[1:, 1:])
+    assert len(simplices) == 2 * np.count_nonzero(corner_counts == 4) + np.count_nonzero(corner_counts == 3)
+    # No triangle is emitted twice
+    assert len(np.unique(np.sort(simplices, axis=1), axis=0)) == len(simplices)
+
+
+def test_three_corner_cells_keep_the_triangle_of_their_valid_corners():
+    for missing in [(0, 0), (0, 1), (1, 0), (1, 1)]:
+        valid_mask = np.ones((2, 2), dtype=bool)
+        valid_mask[missing] = False
+        simplices = create_grid_mesh(valid_mask)
+        assert len(simplices) == 1
+        assert sorted(simplices[0]) == [0, 1, 2]
+
+
+def test_create_mesh_uses_the_grid_topology(holed_mask):
+    coords = pixel_coords(holed_mask)
+    points = np.column_stack((coords, np.zeros(len(coords))))
+    np.testing.assert_array_equal(create_mesh(points, holed_mask), create_grid_mesh(holed_mask))
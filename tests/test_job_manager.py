@@ -0,0 +1,38 @@
+import json
+import os
+import time
+import pytest
+from utils.job_manager import JobManager, QueueFullError, STATUS_FILE
+
+
+def sleep_job(seconds, result_dir, progress):
+    time.sleep(seconds)
+
+
+def test_submit_refuses_jobs_beyond_workers_and_queue(tmp_path):
+    manager = JobManager(str(tmp_path), workers=1, queue_depth=1)
+    try:
+        manager.submit(sleep_job, 2)
+        manager.submit(sleep_job, 2)
+        with pytest.raises(QueueFullError):
+            manager.submit(sleep_job, 2)
+        assert len(os.listdir(tmp_path)) == 2  # The refused job leaves no directory behind
+    finally:
+        manager._pool.shutdown(cancel_futures=True)
+
+
+def write_job(jobs_folder, job_id, state, age):
+    job_dir = os.path.join(jobs_folder, job_id)
+    os.makedirs(job_dir)
+    with open(os.path.join(job_dir, STATUS_FILE), 'w') as f:
+        json.dump({'state': state, 'updated': time.time() - age}, f)
+
+
+def test_purge_expired_removes_only_old_finished_jobs(tmp_path):
+    manager = JobManager(str(tmp_path), ttl_seconds=60)
+    write_job(str(tmp_path), 'aa', 'done', 120)
+    write_job(str(tmp_path), 'bb', 'failed', 120)
+    write_job(str(tmp_path), 'cc', 'done', 10)
+    write_job(str(tmp_path), 'dd', 'running', 120)  # Still running, however old its last update
+    manager.purge_expired()
+    assert sorted(os.listdir(tmp_path)) == ['cc', 'dd']
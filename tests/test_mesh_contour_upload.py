@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('osgeo')
+flask = pytest.importorskip('flask')
+
+from blueprints import creating_mesh_contour
+from utils.job_manager import QueueFullError
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(creating_mesh_contour, 'UPLOAD_FOLDER', str(tmp_path))
+    for file_id in ('dem', 'kml'):
+        (tmp_path / file_id).write_bytes(b'upload')
+    return tmp_path
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.register_blueprint(creating_mesh_contour.mesh_contour_bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('form', [
+    {'contour_interval': '0'},
+    {'contour_interval': '-1'},
+    {'contour_interval': '2', 'major_interval': '5'},
+    {'dxf_format': 'r12'},
+    {'points_format': 'csv'},
+])
+def test_rejected_request_removes_uploads(client, uploads, form):
+    response = client.post('/mesh_contour/upload', data={'dem_file_id': 'dem', 'kml_file_id': 'kml', **form})
+    assert response.status_code == 400
+    assert list(uploads.iterdir()) == []
+
+
+def test_full_queue_removes_uploads(client, uploads, monkeypatch):
+    def full(*args, **kwargs):
+        raise QueueFullError("The processing queue is full, please try again later.")
+
+    monkeypatch.setattr(creating_mesh_contour.job_manager, 'submit', full)
+    response = client.post('/mesh_contour/upload', data={'dem_file_id': 'dem', 'kml_file_id': 'kml'})
+    assert response.status_code == 503
+    assert list(uploads.iterdir()) == []
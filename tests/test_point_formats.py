@@ -0,0 +1,136 @@
+import sys
+import numpy as np
+import pytest
+from utils import point_formats
+from utils.point_formats import (POINT_DTYPE, NPY_HEADER_BYTES, point_array, point_coords, point_format_for,
+                                 write_points, read_points, read_points_csv)
+
+
+def chunks(coords, size):
+    for start in range(0, len(coords), size):
+        chunk = coords[start:start + size]
+        yield chunk[:, 0], chunk[:, 1], chunk[:, 2]
+
+
+@pytest.fixture
+def coords():
+    rng = np.random.default_rng(0)
+    return np.round(rng.uniform(-1000, 1000, (1000, 3)), 3)
+
+
+def test_point_array_views_coordinate_arrays_without_copying(coords):
+    points = point_array(coords)
+    assert points.dtype == POINT_DTYPE and points.shape == (len(coords),)
+    assert np.shares_memory(points, coords)
+    assert point_array(points) is points
+    assert np.shares_memory(point_coords(points), coords)
+    assert point_coords(points).shape == coords.shape
+
+
+def test_point_array_converts_tuples():
+    points = point_array([(1, 2, 3), (4, 5, 6)])
+    assert points['z'].tolist() == [3.0, 6.0]
+
+
+def test_point_format_for_reads_the_extension():
+    assert point_format_for('a/points.NPY') == 'npy'
+    assert point_format_for('pvsyst_input.csv') == 'csv'
+    with pytest.raises(ValueError):
+        point_format_for('points.txt')
+
+
+def test_npy_is_streamed_with_a_fixed_header(tmp_path, coords):
+    path = str(tmp_path / 'points.npy')
+    assert write_points(chunks(coords, 300), path) == len(coords)
+    with open(path, 'rb') as f:
+        assert np.lib.format.read_magic(f) == (1, 0)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        assert f.tell() == NPY_HEADER_BYTES
+    assert (shape, fortran_order, dtype) == ((len(coords), 3), False, np.dtype('<f8'))
+    np.testing.assert_array_equal(np.load(path), coords)
+
+
+def test_npy_without_points_is_a_valid_empty_array(tmp_path):
+    path = str(tmp_path / 'points.npy')
+    assert write_points(iter(()), path) == 0
+    assert np.load(path).shape == (0, 3)
+
+
+def test_read_points_memory_maps_npy(tmp_path, coords):
+    path = str(tmp_path / 'points.npy')
+    write_points(chunks(coords, 300), path)
+    points = read_points(path)
+    assert points.dtype == POINT_DTYPE
+    assert isinstance(points.base, np.memmap) or isinstance(points.base.base, np.memmap)
+    np.testing.assert_array_equal(point_coords(points), coords)
+
+
+def test_csv_round_trip(tmp_path, coords):
+    path = str(tmp_path / 'pvsyst_input.csv')
+    assert write_points(chunks(coords, 300), path) == len(coords)
+    with open(path) as f:
+        assert f.readline() == 'X,Y,Z\n'
+    np.testing.assert_array_equal(point_coords(read_points(path)), coords)
+
+
+def test_csv_columns_are_found_by_header(tmp_path):
+    path = tmp_path / 'points.csv'
+    path.write_text('Z,X,Y\n3,1,2\n6,4,5\n')
+    np.testing.assert_array_equal(point_coords(read_points_csv(str(path))), [[1, 2, 3], [4, 5, 6]])
+
+
+def test_csv_row_format(tmp_path):
+    path = str(tmp_path / 'points.csv')
+    write_points(chunks(np.array([[1.23456, 2.0, 3.5]]), 1), path, csv_row="{:.2f},{:.2f},{:.2f}\n")
+    with open(path) as f:
+        assert f.read() == 'X,Y,Z\n1.23,2.00,3.50\n'
+
+
+def test_parquet_round_trip(tmp_path, coords):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'points.parquet')
+    assert write_points(chunks(coords, 300), path) == len(coords)
+    np.testing.assert_array_equal(point_coords(read_points(path)), coords)
+
+
+def test_laz_round_trip(tmp_path, coords):
+    pytest.importorskip('pdal')
+    path = str(tmp_path / 'points.laz')
+    assert write_points(chunks(coords, 300), path, srs='EPSG:32633') == len(coords)
+    np.testing.assert_allclose(point_coords(read_points(path)), coords, atol=1e-3)
+
+
+def test_laz_is_streamed_chunk_by_chunk_with_laspy(tmp_path, coords):
+    laspy = pytest.importorskip('laspy')
+    path = str(tmp_path / 'points.laz')
+    assert write_points(chunks(coords + [500000, 4500000, 0], 300), path, srs='EPSG:32633') == len(coords)
+    las = laspy.read(path)
+    assert las.header.point_count == len(coords)
+    assert las.header.parse_crs().to_epsg() == 32633
+    np.testing.assert_allclose(np.column_stack((las.x, las.y, las.z)), coords + [500000, 4500000, 0], atol=1e-3)
+
+
+def test_laz_offsets_skip_empty_leading_chunks(tmp_path):
+    laspy = pytest.importorskip('laspy')
+    empty = np.empty(0)
+    xs = np.array([500000.123, 509999.5])
+    ys = np.array([4000000.25, 4999999.999])  # About 5e9 mm: beyond int32 against a zero offset
+    zs = np.array([120.5, 130.25])
+    path = str(tmp_path / 'canopy.laz')
+    assert write_points(iter([(empty, empty, empty), (xs, ys, zs), (empty, empty, empty)]), path,
+                        srs='EPSG:32618') == 2
+    las = laspy.read(path)
+    assert las.header.offsets.tolist() == [500000.0, 4000000.0, 120.0]
+    np.testing.assert_allclose(np.column_stack((las.x, las.y, las.z)), np.column_stack((xs, ys, zs)), atol=1e-3)
+
+
+def test_laz_without_laspy_is_limited_in_size(tmp_path, coords, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'laspy', None)  # import laspy raises ImportError
+    monkeypatch.setattr(point_formats, 'LAZ_MAX_POINTS', 500)
+    with pytest.raises(ValueError, match='500 points'):
+        write_points(chunks(coords, 300), str(tmp_path / 'points.laz'))
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_points(iter(()), str(tmp_path / 'points.npy'), fmt='las')
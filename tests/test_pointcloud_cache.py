@@ -0,0 +1,117 @@
+import os
+import json
+import shutil
+import numpy as np
+import pytest
+
+pdal = pytest.importorskip('pdal')
+pytest.importorskip('osgeo')
+
+import shapely
+from shapely.geometry import box
+from utils.disk_cache import DiskCache
+from pvsyst_canopy import pointcloud_cache
+from pvsyst_canopy.pointcloud_cache import (generate_DSM_DTM, find_cached_pointcloud, pointcloud_params,
+                                            POINTCLOUD_FILE)
+
+DATASET = 'LOCAL_SITE'
+EXTENT = 100.0  # The local point cloud spans 0..100 m in EPSG:3857
+
+
+@pytest.fixture
+def ept_root(tmp_path):
+    """A one-node Entwine Point Tile dataset of a flat site with a 5 m high block on it."""
+    root = tmp_path / 'ept'
+    dataset = root / DATASET
+    (dataset / 'ept-data').mkdir(parents=True)
+    (dataset / 'ept-hierarchy').mkdir()
+
+    ys, xs = np.mgrid[0.5:EXTENT:1.0, 0.5:EXTENT:1.0]
+    block = (xs > 40) & (xs < 60) & (ys > 40) & (ys < 60)
+    points = np.zeros(xs.size, dtype=[('X', '<f8'), ('Y', '<f8'), ('Z', '<f8'), ('Classification', 'u1')])
+    points['X'], points['Y'] = xs.ravel(), ys.ravel()
+    points['Z'] = np.where(block.ravel(), 15.0, 10.0)
+    points['Classification'] = np.where(block.ravel(), 6, 2)
+    pdal.Writer.las(filename=str(dataset / 'ept-data' / '0-0-0-0.laz'), compression=True, a_srs='EPSG:3857',
+                    scale_x=0.01, scale_y=0.01, scale_z=0.01, offset_x=0, offset_y=0, offset_z=0) \
+        .pipeline(points).execute()
+
+    schema = [{'name': name, 'type': 'signed', 'size': 4, 'scale': 0.01, 'offset': 0} for name in 'XYZ']
+    schema.append({'name': 'Classification', 'type': 'unsigned', 'size': 1})
+    (dataset / 'ept.json').write_text(json.dumps({
+        'bounds': [0, 0, -40, EXTENT, EXTENT, 60],
+        'boundsConforming': [0, 0, 10, EXTENT, EXTENT, 15],
+        'dataType': 'laszip',
+        'hierarchyType': 'json',
+        'points': len(points),
+        'schema': schema,
+        'span': 128,
+        'srs': {'authority': 'EPSG', 'horizontal': '3857'},
+        'version': '1.0.0',
+    }))
+    (dataset / 'ept-hierarchy' / '0-0-0-0.json').write_text(json.dumps({'0-0-0-0': len(points)}))
+    return str(root)
+
+
+def run(tmp_path, ept_root, cache, aoi, name):
+    work_dir = tmp_path / name
+    work_dir.mkdir()
+    cached = generate_DSM_DTM(aoi.wkt, [DATASET], 1.0, 2.0, str(work_dir / 'dsm'), str(work_dir / 'dtm'),
+                              filterNoise=True, ept_root=ept_root, cache=cache)
+    assert (work_dir / 'dsm.tif').exists() and (work_dir / 'dtm.tif').exists()
+    return cached, work_dir
+
+
+def test_point_clouds_are_reused_for_the_same_and_covered_aois(tmp_path, ept_root):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 30)
+    site = box(10, 10, 90, 90)
+    assert run(tmp_path, ept_root, cache, site, 'fetch')[0] is False
+    assert len(cache.keys()) == 1
+
+    cached, work_dir = run(tmp_path, ept_root, cache, site, 'same')
+    assert cached is True
+    assert (work_dir / f'{POINTCLOUD_FILE}.laz').exists()
+
+    cached, work_dir = run(tmp_path, ept_root, cache, box(30, 30, 70, 70), 'covered')
+    assert cached is True
+    assert len(cache.keys()) == 1
+
+    assert run(tmp_path, ept_root, cache, box(0, 0, 95, 50), 'outside')[0] is False
+    assert len(cache.keys()) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_checked_out_point_cloud_survives_eviction(tmp_path, ept_root):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 30)
+    site = box(10, 10, 90, 90)
+    run(tmp_path, ept_root, cache, site, 'fetch')
+    params = pointcloud_params([DATASET], 1.0, True, False, 3857, ept_root)
+
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    pc_filename, exact = find_cached_pointcloud(cache, params, box(20, 20, 80, 80), str(work_dir))
+    assert not exact and os.path.dirname(pc_filename) == str(work_dir)
+    for key in cache.keys():
+        shutil.rmtree(cache.entry_dir(key))  # Evicted by another process
+    pipeline = pdal.Reader.las(filename=pc_filename).pipeline()
+    assert pipeline.execute() > 0
+
+    assert find_cached_pointcloud(cache, params, box(20, 20, 80, 80), str(work_dir)) == (None, False)
+    assert not any(key.startswith(pointcloud_cache.pointcloud_key(params, site)[:33])
+                   for key in pointcloud_cache._aoi_index)
+
+
+def test_covering_lookup_parses_each_meta_once(tmp_path, ept_root, monkeypatch):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 30)
+    run(tmp_path, ept_root, cache, box(10, 10, 90, 90), 'fetch')
+    params = pointcloud_params([DATASET], 1.0, True, False, 3857, ept_root)
+    parsed = []
+    from_wkt = shapely.from_wkt
+    monkeypatch.setattr(shapely, 'from_wkt', lambda wkt: parsed.append(wkt) or from_wkt(wkt))
+    pointcloud_cache._aoi_index.clear()
+
+    for i in range(3):
+        work_dir = tmp_path / f'work{i}'
+        work_dir.mkdir()
+        assert find_cached_pointcloud(cache, params, box(20 + i, 20, 80, 80), str(work_dir))[0] is not None
+    assert len(parsed) == 1
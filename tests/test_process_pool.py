@@ -0,0 +1,14 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from utils.process_pool import SpawnPool
+
+
+def test_pool_is_replaced_after_a_worker_dies():
+    pool = SpawnPool(1)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+        assert pool.submit(abs, -3).result() == 3
+    finally:
+        pool.shutdown()
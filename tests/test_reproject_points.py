@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pdal')
+pytest.importorskip('geopandas')
+rasterio = pytest.importorskip('rasterio')
+
+from rasterio.transform import from_origin
+from rasterio.warp import reproject, calculate_default_transform, Resampling
+from pvsyst_canopy.pvsyst_canopy import reproject_and_extract_xyz, get_utm_zone
+from utils.point_formats import read_points
+
+NODATA = -9999.0
+
+
+@pytest.fixture
+def dem_3857(tmp_path):
+    """A 2 m DEM in EPSG:3857 near Richmond, VA, with a block of nodata."""
+    rows, cols = np.mgrid[0:60, 0:80]
+    values = (50 + 0.1 * cols + 0.05 * rows).astype(np.float32)
+    values[20:30, 30:45] = NODATA
+    path = str(tmp_path / 'dem.tif')
+    with rasterio.open(path, 'w', driver='GTiff', width=80, height=60, count=1, dtype='float32', crs='EPSG:3857',
+                       transform=from_origin(-8623000.0, 4510000.0, 2.0, 2.0), nodata=NODATA) as dst:
+        dst.write(values, 1)
+    return path
+
+
+def reference_points(path):
+    """Reprojects the whole raster in memory and takes the centers of its valid pixels."""
+    utm_crs = get_utm_zone(path)
+    with rasterio.open(path) as src:
+        transform, width, height = calculate_default_transform(src.crs, utm_crs, src.width, src.height, *src.bounds)
+        warped = np.full((height, width), NODATA, dtype=np.float32)
+        reproject(rasterio.band(src, 1), warped, dst_transform=transform, dst_crs=utm_crs,
+                  resampling=Resampling.nearest, dst_nodata=NODATA, src_nodata=NODATA)
+    rows, cols = np.nonzero(warped != NODATA)
+    xs, ys = rasterio.transform.xy(transform, rows, cols, offset='center')
+    return np.column_stack((xs, ys, warped[rows, cols]))
+
+
+def test_utm_zone_of_the_dem(dem_3857):
+    assert get_utm_zone(dem_3857) == 'EPSG:32618'
+
+
+def extract(tmp_path, dem, window_pixels, name):
+    output_tif = str(tmp_path / f'{name}.tif')
+    points_path = str(tmp_path / f'{name}.npy')
+    reproject_and_extract_xyz(dem, output_tif, points_path, window_pixels=window_pixels)
+    points = read_points(points_path)
+    return output_tif, np.column_stack((points['x'], points['y'], points['z']))
+
+
+def test_points_match_an_in_memory_reprojection(tmp_path, dem_3857):
+    output_tif, points = extract(tmp_path, dem_3857, 1 << 20, 'whole')
+    reference = reference_points(dem_3857)
+    np.testing.assert_allclose(points[:, :2], reference[:, :2], atol=1e-6)
+    # The in-memory warp uses GDAL's approximate transformer, so a pixel centre falling on a source pixel
+    # edge may take the neighbouring value; the surface rises 0.1 per column
+    difference = np.abs(points[:, 2] - reference[:, 2])
+    assert np.count_nonzero(difference > 1e-6) <= len(points) // 1000
+    assert difference.max() <= 0.1 + 1e-4
+
+    with rasterio.open(output_tif) as dst:
+        assert dst.crs.to_string() == 'EPSG:32618'
+        assert np.count_nonzero(dst.read(1) != NODATA) == len(points)
+
+
+def test_window_size_does_not_change_the_points(tmp_path, dem_3857):
+    whole_tif, whole = extract(tmp_path, dem_3857, 1 << 20, 'whole')
+    windowed_tif, windowed = extract(tmp_path, dem_3857, 50, 'windowed')
+    np.testing.assert_array_equal(windowed, whole)
+    with rasterio.open(whole_tif) as a, rasterio.open(windowed_tif) as b:
+        np.testing.assert_array_equal(a.read(), b.read())
+
+
+def test_csv_points_without_the_reprojected_raster(tmp_path, dem_3857):
+    csv_path = str(tmp_path / 'points.csv')
+    reproject_and_extract_xyz(dem_3857, None, csv_path, window_pixels=200)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['dem.tif', 'points.csv']
+    with open(csv_path) as f:
+        assert f.readline() == "X,Y,Z\n"
+        first = f.readline().strip().split(',')
+    assert all(len(value.split('.')[1]) == 3 for value in first)
+    points = read_points(csv_path)
+    _, npy_points = extract(tmp_path, dem_3857, 200, 'npy')
+    np.testing.assert_allclose(np.column_stack((points['x'], points['y'], points['z'])), npy_points, atol=5e-4)
@@ -0,0 +1,66 @@
+import io
+import json
+import os
+import uuid
+import zipfile
+from concurrent.futures import Future
+import pytest
+
+pytest.importorskip('osgeo')
+pytest.importorskip('pdal')
+pytest.importorskip('geopandas')
+flask = pytest.importorskip('flask')
+
+from shapely.geometry import box
+from blueprints import shading_pvsyst
+
+
+class Catalog:
+    def find_datasets(self, AOI_EPSG3857):
+        return (['USGS_LPC_TEST'], 1000) if AOI_EPSG3857.area > 1 else ([], 0)
+
+
+def fake_submit(AOI_EPSG3857_wkt, usgs_3dep_datasets, file_prefix, output_folder, **kwargs):
+    # Stands in for run_shading_aoi: one result directory per run, holding that run's own output
+    run_id = uuid.uuid4().hex
+    result_dir = os.path.join(output_folder, file_prefix, run_id)
+    os.makedirs(result_dir)
+    with open(os.path.join(result_dir, 'run.txt'), 'w') as f:
+        f.write(run_id)
+    future = Future()
+    future.set_result(result_dir)
+    return future
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(shading_pvsyst.shading_bp.config, 'OUTPUT_FOLDER', str(tmp_path))
+    monkeypatch.setattr(shading_pvsyst, 'get_catalog', Catalog)
+    monkeypatch.setattr(shading_pvsyst, 'submit_aoi', fake_submit)
+    app = flask.Flask(__name__)
+    app.register_blueprint(shading_pvsyst.shading_bp)
+    return app.test_client()
+
+
+def process(client, monkeypatch, aois):
+    monkeypatch.setattr(shading_pvsyst, 'collect_aois', lambda filenames, polygons: (aois, []))
+    response = client.post('/shading/process', json={'filenames': []})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_aoi_without_coverage_gets_a_record(client, monkeypatch):
+    results = process(client, monkeypatch, [('sea', box(0, 0, 0.5, 0.5))])
+    assert results == [{"name": "sea", "error": "No 3DEP LiDAR data covers this AOI.", "no_coverage": True}]
+
+
+def test_runs_for_the_same_kml_keep_their_own_outputs(client, monkeypatch):
+    results = process(client, monkeypatch, [('site', box(0, 0, 10, 10))])
+    results += process(client, monkeypatch, [('site', box(0, 0, 10, 10))])
+    assert results[0]['zip_file'] != results[1]['zip_file']
+    run_ids = set()
+    for result in results:
+        assert result['zip_file'].endswith('/site_output_files.zip')
+        with zipfile.ZipFile(io.BytesIO(client.get(result['zip_file']).data)) as zipf:
+            run_ids.add(zipf.read('run.txt'))
+    assert len(run_ids) == 2
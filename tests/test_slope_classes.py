@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from terrain_processing.terrain_processing import (calculate_face_slopes, classify_slopes, SLOPE_CLASS_BREAKS,
+                                                   SLOPE_CLASS_COLORS)
+
+
+def tilted_face(degrees):
+    """A right triangle with unit legs, tilted about the y axis by degrees."""
+    rise = np.tan(np.radians(degrees))
+    return np.array([[0.0, 0.0, 0.0], [1.0, 0.0, rise], [0.0, 1.0, 0.0]])
+
+
+def test_face_slopes_and_areas():
+    vertices = np.stack([tilted_face(0), tilted_face(30), tilted_face(60)])
+    slopes, areas = calculate_face_slopes(vertices)
+    np.testing.assert_allclose(slopes, [0, 30, 60])
+    np.testing.assert_allclose(areas, [0.5, 0.5 / np.cos(np.radians(30)), 0.5 / np.cos(np.radians(60))])
+
+
+def test_vertical_and_flipped_faces():
+    wall = np.array([[[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]])
+    slopes, _ = calculate_face_slopes(wall)
+    np.testing.assert_allclose(slopes, [90])
+    # Winding order does not change the slope
+    slopes, _ = calculate_face_slopes(tilted_face(20)[[0, 2, 1]][None])
+    np.testing.assert_allclose(slopes, [20])
+
+
+def test_breaks_are_inclusive_upper_bounds():
+    slopes = np.array([0.0, 5.0, 5.0001, 10.0, 30.0, 30.0001, 90.0])
+    face_colors, stats = classify_slopes(slopes, np.ones(len(slopes)))
+    np.testing.assert_array_equal(face_colors, [SLOPE_CLASS_COLORS[i] for i in (0, 0, 1, 1, 5, 6, 6)])
+    assert [slope_class['faces'] for slope_class in stats] == [2, 2, 0, 0, 0, 1, 2]
+    assert [(slope_class['min_slope'], slope_class['max_slope']) for slope_class in stats] == \
+        list(zip([0.0, *SLOPE_CLASS_BREAKS], [*SLOPE_CLASS_BREAKS, 90.0]))
+
+
+def test_class_areas_sum_per_class():
+    _, stats = classify_slopes(np.array([1.0, 2.0, 12.0]), np.array([1.5, 2.5, 4.0]))
+    assert stats[0]['area'] == pytest.approx(4.0)
+    assert stats[2]['area'] == pytest.approx(4.0)
+    assert sum(slope_class['area'] for slope_class in stats) == pytest.approx(8.0)
+
+
+def test_colors_must_match_the_breaks():
+    with pytest.raises(ValueError):
+        classify_slopes(np.zeros(1), np.ones(1), breaks=(5, 10), colors=(1, 2))
@@ -0,0 +1,85 @@
+import os
+import shutil
+import pytest
+from utils.disk_cache import DiskCache, link_file
+from terrain_processing import stage_cache
+from terrain_processing.stage_cache import cached_build, restore_artifact
+
+
+def build_shapefile(calls, report=None):
+    def build(path):
+        calls.append(path)
+        stem = os.path.splitext(path)[0]
+        for extension in ('.shp', '.dbf'):
+            with open(stem + extension, 'w') as f:
+                f.write(extension)
+        return report
+    return build
+
+
+def test_miss_builds_into_the_cache_and_hit_restores(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 20)
+    calls = []
+    first = str(tmp_path / 'first.shp')
+    assert cached_build(cache, 'k', first, build_shapefile(calls, {'vertices_out': 3})) == (False, {'vertices_out': 3})
+    second = str(tmp_path / 'second.shp')
+    assert cached_build(cache, 'k', second, build_shapefile(calls)) == (True, {'vertices_out': 3})
+    assert len(calls) == 1
+    assert sorted(os.listdir(str(tmp_path))) == ['cache', 'first.dbf', 'first.shp', 'second.dbf', 'second.shp']
+
+
+def test_stage_without_report(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 20)
+    build = build_shapefile([])
+    assert cached_build(cache, 'k', str(tmp_path / 'a.shp'), build) == (False, None)
+    assert cached_build(cache, 'k', str(tmp_path / 'b.shp'), build) == (True, None)
+
+
+def test_without_cache_build_runs(tmp_path):
+    calls = []
+    path = str(tmp_path / 'a.shp')
+    assert cached_build(None, None, path, build_shapefile(calls, {'a': 1})) == (False, {'a': 1})
+    assert calls == [path]
+
+
+def test_restore_replaces_existing_files(tmp_path):
+    entry = tmp_path / 'entry'
+    entry.mkdir()
+    (entry / 'artifact.dxf').write_text('new')
+    (entry / 'report.json').write_text('{}')
+    target = tmp_path / 'out.dxf'
+    target.write_text('old')
+    restore_artifact(str(entry), str(target))
+    assert target.read_text() == 'new'
+    assert sorted(os.listdir(str(tmp_path))) == ['entry', 'out.dxf']
+
+
+def evict_after_first_link(monkeypatch, cache, key):
+    def link_then_evict(source, target):
+        link_file(source, target)
+        shutil.rmtree(cache.entry_dir(key))
+        monkeypatch.setattr(stage_cache, 'link_file', link_file)
+    monkeypatch.setattr(stage_cache, 'link_file', link_then_evict)
+
+
+def test_restore_removes_partial_files_when_the_entry_is_evicted(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 20)
+    cached_build(cache, 'k', str(tmp_path / 'first.shp'), build_shapefile([]))
+    evict_after_first_link(monkeypatch, cache, 'k')
+    target = tmp_path / 'out' / 'second.shp'
+    target.parent.mkdir()
+    with pytest.raises(FileNotFoundError):
+        restore_artifact(cache.entry_dir('k'), str(target))
+    assert os.listdir(str(target.parent)) == []
+
+
+def test_entry_evicted_during_restore_is_rebuilt(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / 'cache'), 1 << 20)
+    calls = []
+    cached_build(cache, 'k', str(tmp_path / 'first.shp'), build_shapefile(calls, {'a': 1}))
+    evict_after_first_link(monkeypatch, cache, 'k')
+    second = str(tmp_path / 'second.shp')
+    assert cached_build(cache, 'k', second, build_shapefile(calls, {'a': 1})) == (False, {'a': 1})
+    assert len(calls) == 2
+    assert os.path.exists(second) and os.path.exists(str(tmp_path / 'second.dbf'))
+    assert (cache.hits, cache.misses) == (0, 2)
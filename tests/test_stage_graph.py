@@ -0,0 +1,89 @@
+import time
+import pytest
+from utils.stage_graph import Stage, StageGraphError, check_stage_graph, run_stage_graph
+
+
+def add(*values):
+    return sum(values)
+
+
+def fail(*values):
+    raise ValueError("boom")
+
+
+def process_id(*values):
+    import os
+    return os.getpid()
+
+
+def test_results_flow_along_dependencies():
+    stages = [
+        Stage('a', lambda: 1),
+        Stage('b', lambda: 2),
+        Stage('c', add, deps=('a', 'b')),
+        Stage('d', lambda c: c * 10, deps=('c',)),
+    ]
+    results, errors = run_stage_graph(stages)
+    assert results == {'a': 1, 'b': 2, 'c': 3, 'd': 30}
+    assert errors == {}
+
+
+def test_independent_stages_overlap():
+    stages = [Stage(name, lambda: time.sleep(0.3)) for name in 'abc']
+    start = time.perf_counter()
+    run_stage_graph(stages, thread_workers=3)
+    assert time.perf_counter() - start < 0.8
+
+
+def test_failed_dependency_skips_dependents_only():
+    finished = []
+    stages = [
+        Stage('bad', fail),
+        Stage('good', lambda: 1),
+        Stage('child', add, deps=('bad',)),
+        Stage('grandchild', add, deps=('child',)),
+        Stage('sibling', add, deps=('good',)),
+    ]
+    results, errors = run_stage_graph(stages, on_finish=lambda name, error: finished.append((name, error)))
+    assert results == {'good': 1, 'sibling': 1}
+    assert isinstance(errors['bad'], ValueError)
+    assert isinstance(errors['child'], RuntimeError) and 'bad' in str(errors['child'])
+    assert isinstance(errors['grandchild'], RuntimeError) and 'child' in str(errors['grandchild'])
+    assert sorted(name for name, _ in finished) == ['bad', 'child', 'good', 'grandchild', 'sibling']
+
+
+def test_cycle_is_rejected():
+    stages = [Stage('a', add, deps=('c',)), Stage('b', add, deps=('a',)), Stage('c', add, deps=('b',)),
+              Stage('d', lambda: 1)]
+    with pytest.raises(StageGraphError, match='cycle'):
+        check_stage_graph(stages)
+    with pytest.raises(StageGraphError):
+        run_stage_graph(stages)
+
+
+def test_unknown_dependency_and_duplicate_names_are_rejected():
+    with pytest.raises(StageGraphError, match='unknown'):
+        check_stage_graph([Stage('a', add, deps=('missing',))])
+    with pytest.raises(StageGraphError, match='unique'):
+        check_stage_graph([Stage('a', add), Stage('a', add)])
+
+
+def test_unknown_executor_is_rejected():
+    with pytest.raises(ValueError):
+        Stage('a', add, executor='gpu')
+
+
+def test_process_stages_run_in_worker_processes():
+    import os
+    stages = [
+        Stage('a', lambda: 2),
+        Stage('b', add, deps=('a', 'a'), executor='process'),
+        Stage('pid', process_id, executor='process'),
+        Stage('bad', fail, deps=('b',), executor='process'),
+        Stage('after_bad', add, deps=('bad',)),
+    ]
+    results, errors = run_stage_graph(stages, process_workers=1)
+    assert results['b'] == 4
+    assert results['pid'] != os.getpid()
+    assert isinstance(errors['bad'], ValueError)
+    assert isinstance(errors['after_bad'], RuntimeError)
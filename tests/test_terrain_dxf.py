@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from terrain_processing.terrain_processing import (create_dxf, create_dxf_mesh, create_mesh, data_to_dxf,
+                                                   SLOPE_CLASS_COLORS)
+from tests.test_dxf_writer import read_back, DXF_FORMATS
+
+BOUNDARIES = [({'name': 'site'}, [(0.0, 0.0), (4.0, 0.0), (4.0, 4.0), (0.0, 4.0)])]
+
+
+def grid_points(size=5):
+    ys, xs = np.mgrid[0:size, 0:size]
+    return np.column_stack((xs.ravel(), ys.ravel(), 0.2 * xs.ravel())).astype(np.float64)
+
+
+def assert_boundary(doc):
+    boundary = doc.modelspace().query('LWPOLYLINE[layer=="Boundaries"]')
+    assert len(boundary) == 1
+    np.testing.assert_allclose(boundary.first.get_points('xy')[:4], BOUNDARIES[0][1])
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_points_dxf_with_boundary(tmp_path, binary):
+    path = str(tmp_path / 'points.dxf')
+    create_dxf(grid_points(), path, BOUNDARIES, binary)
+    doc = read_back(path)
+    assert len(doc.modelspace().query('POINT')) == 25
+    assert_boundary(doc)
+
+
+@pytest.mark.parametrize('mesh_format', ['3dface', 'polyface', 'mesh'])
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_mesh_dxf_formats_with_boundary(tmp_path, mesh_format, binary):
+    points = grid_points()
+    simplices = create_mesh(points, np.ones((5, 5), dtype=bool))
+    path = str(tmp_path / 'mesh.dxf')
+    stats = create_dxf_mesh(points, simplices, path, mesh_format=mesh_format, boundaries=BOUNDARIES, binary=binary)
+    assert sum(slope_class['faces'] for slope_class in stats) == len(simplices) == 32
+    assert len(stats) == len(SLOPE_CLASS_COLORS)
+    doc = read_back(path)
+    assert len(doc.modelspace().query('*[layer=="3D Mesh"]')) > 0
+    assert_boundary(doc)
+
+
+@pytest.mark.parametrize('binary', DXF_FORMATS)
+def test_boundary_dxf(tmp_path, binary):
+    path = str(tmp_path / 'boundary.dxf')
+    data_to_dxf(BOUNDARIES, path, binary)
+    assert_boundary(read_back(path))
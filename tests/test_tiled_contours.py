@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+import shapely
+from osgeo import gdal, osr
+from terrain_processing.terrain_processing import contour_dataset
+from terrain_processing.tiled_contours import tiled_contour_dataset, contour_windows
+
+NODATA = -9999.0
+
+
+@pytest.fixture
+def hills_ds():
+    """A 70 x 50 raster of two hills in UTM with a hole of nodata, large enough for several 16-pixel tiles."""
+    ys, xs = np.mgrid[0:50, 0:70]
+    values = 20 * np.exp(-((xs - 20) ** 2 + (ys - 25) ** 2) / 200) + 12 * np.exp(-((xs - 50) ** 2 + (ys - 15) ** 2) / 120)
+    values[35:42, 45:55] = NODATA
+    ds = gdal.GetDriverByName('MEM').Create('', 70, 50, 1, gdal.GDT_Float64)
+    ds.SetGeoTransform((500000.0, 2.0, 0.0, 4000100.0, 0.0, -2.0))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32633)
+    ds.SetProjection(srs.ExportToWkt())
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(NODATA)
+    band.WriteArray(values)
+    return ds
+
+
+def contour_levels(contour_ds):
+    """Merged contour geometry and class of every level of a contour dataset."""
+    lines = {}
+    classes = {}
+    for feature in contour_ds.GetLayer(0):
+        elev = feature.GetField('elev')
+        lines.setdefault(elev, []).append(shapely.from_wkb(bytes(feature.GetGeometryRef().ExportToWkb())))
+        classes[elev] = feature.GetField('class')
+    return {elev: shapely.line_merge(shapely.multilinestrings(parts)) for elev, parts in lines.items()}, classes
+
+
+def test_windows_cover_the_raster_with_shared_seams():
+    windows = contour_windows(70, 50, 16)
+    assert len(windows) == 5 * 4
+    assert windows[0][:4] == (0, 0, 17, 17)
+    assert windows[1][:2] == (16, 0)  # The seam column is read by both tiles
+    assert windows[-1][:4] == (64, 48, 6, 2)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_tiled_contours_match_a_single_pass(hills_ds, workers):
+    single, single_classes = contour_levels(contour_dataset(hills_ds, interval=2))
+    tiled, tiled_classes = contour_levels(tiled_contour_dataset(hills_ds, interval=2, tile_pixels=16, workers=workers))
+    assert sorted(tiled) == sorted(single)
+    assert tiled_classes == single_classes
+    for elev, geometry in single.items():
+        assert tiled[elev].length == pytest.approx(geometry.length, rel=1e-9)
+        assert shapely.hausdorff_distance(tiled[elev], geometry) < 1e-6
+
+
+def test_small_rasters_are_contoured_in_one_pass(hills_ds):
+    single, _ = contour_levels(contour_dataset(hills_ds, interval=5))
+    tiled, _ = contour_levels(tiled_contour_dataset(hills_ds, interval=5, tile_pixels=100))
+    assert {elev: geometry.wkb for elev, geometry in tiled.items()} == {elev: geometry.wkb for elev, geometry in single.items()}
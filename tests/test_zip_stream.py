@@ -0,0 +1,38 @@
+import io
+import os
+import zipfile
+import pytest
+from utils.zip_stream import stream_zip, directory_files, zip_response
+
+
+@pytest.fixture
+def files(tmp_path):
+    contents = {'b.txt': b'hello ' * 1000, 'a.bin': os.urandom(5000), 'empty.txt': b''}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    (tmp_path / 'subdir').mkdir()
+    return contents
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_stream_zip_round_trip(tmp_path, files, compression):
+    chunks = list(stream_zip(directory_files(str(tmp_path)), compression=compression, chunk_size=1024))
+    assert len(chunks) > 3  # Yielded as the files are read, not as one archive
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zipf:
+        assert zipf.testzip() is None
+        assert sorted(zipf.namelist()) == sorted(files)
+        for name, data in files.items():
+            assert zipf.read(name) == data
+            assert zipf.getinfo(name).compress_type == compression
+
+
+def test_directory_files_lists_files_sorted(tmp_path, files):
+    assert directory_files(str(tmp_path)) == [(str(tmp_path / name), name) for name in sorted(files)]
+
+
+def test_zip_response_is_an_attachment(tmp_path, files):
+    response = zip_response(directory_files(str(tmp_path)), 'job.zip')
+    assert response.mimetype == 'application/zip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="job.zip"'
+    with zipfile.ZipFile(io.BytesIO(b''.join(response.response))) as zipf:
+        assert zipf.read('b.txt') == files['b.txt']
@@ -0,0 +1,56 @@
+import os
+import threading
+from collections import OrderedDict
+from pyproj import CRS, Transformer
+
+CRS_CACHE_SIZE = int(os.environ.get('TERRAINXACT_CRS_CACHE_SIZE', 64))  # CRSs and transformers kept per process
+
+_crs_cache = OrderedDict()
+_transformer_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _crs_key(crs):
+    """Hashable key of a CRS given as an EPSG code, a string, or a CRS object (pyproj, rasterio)."""
+    if isinstance(crs, int):
+        return f'EPSG:{crs}'
+    if isinstance(crs, str):
+        # 'epsg:4326' and 'EPSG:4326' are the same CRS; longer strings (WKT, PROJ) are kept as they are
+        return crs.upper() if len(crs) < 32 else crs
+    return crs.to_wkt()
+
+
+def _cached(cache, key, build):
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    # Built outside the lock, as it queries the PROJ database; two threads may build the same entry once
+    value = build()
+    with _lock:
+        cache[key] = value
+        while len(cache) > CRS_CACHE_SIZE:
+            cache.popitem(last=False)
+    return value
+
+
+def get_crs(crs):
+    """pyproj CRS of anything pyproj.CRS.from_user_input accepts, built once per process."""
+    return _cached(_crs_cache, _crs_key(crs), lambda: CRS.from_user_input(crs))
+
+
+def get_transformer(source_crs, target_crs, always_xy=False):
+    """
+    Transformer from source_crs to target_crs, shared by every caller in the process and kept in a
+    least-recently-used cache of CRS_CACHE_SIZE entries. pyproj Transformers may be used from any thread.
+    """
+    key = (_crs_key(source_crs), _crs_key(target_crs), always_xy)
+    return _cached(_transformer_cache, key,
+                   lambda: Transformer.from_crs(get_crs(source_crs), get_crs(target_crs), always_xy=always_xy))
+
+
+def clear_crs_cache():
+    """Empties the CRS and transformer caches."""
+    with _lock:
+        _crs_cache.clear()
+        _transformer_cache.clear()
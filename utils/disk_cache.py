@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+def cache_key(*parts):
+    """Hashes JSON-serializable parts (strings, numbers, lists, dicts) into a hex cache key."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded, least-recently-used cache of directories on disk.
+
+    Each entry is a directory named by its key. Entries are built in a temporary directory and renamed
+    into place only when complete, so concurrent processes never see a partial entry and the first
+    finished writer wins. Reading an entry refreshes its modification time, and once the cache grows past
+    max_bytes the entries used longest ago are removed. Hits and misses are counted per process.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.folder, key)
+
+    def lookup(self, key, count=True):
+        """
+        Returns the entry directory for key, or None if it is not cached. Counts a hit or a miss
+        unless count is False, for callers that go on to look elsewhere and call record() themselves.
+        """
+        entry_dir = self.entry_dir(key)
+        found = os.path.isdir(entry_dir)
+        if found:
+            self.touch(key)
+        if count:
+            self.record(found)
+        return entry_dir if found else None
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def touch(self, key):
+        """Marks an entry as recently used."""
+        try:
+            os.utime(self.entry_dir(key))
+        except OSError:
+            pass
+
+    def keys(self, prefix=''):
+        """Keys of the complete entries, optionally only those starting with prefix."""
+        return [name for name in os.listdir(self.folder)
+                if name.startswith(prefix) and '.tmp' not in name and os.path.isdir(os.path.join(self.folder, name))]
+
+    @contextmanager
+    def store(self, key):
+        """
+        Yields a temporary directory to write the entry into; it becomes the entry for key when the
+        block finishes without an exception and is discarded otherwise.
+        """
+        tmp_dir = os.path.join(self.folder, f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        os.makedirs(tmp_dir)
+        try:
+            yield tmp_dir
+            try:
+                os.rename(tmp_dir, self.entry_dir(key))
+            except OSError:
+                # Another process stored the same entry first; keep theirs
+                if not os.path.isdir(self.entry_dir(key)):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries, other than keep, until the cache fits in max_bytes."""
+        entries = []
+        for key in self.keys():
+            if key == keep:
+                continue
+            entry_dir = self.entry_dir(key)
+            try:
+                entries.append((os.path.getmtime(entry_dir), _dir_size(entry_dir), entry_dir))
+            except OSError:
+                continue  # Removed by another process meanwhile
+        total = sum(size for _, size, _ in entries)
+        if keep is not None:
+            total += _dir_size(self.entry_dir(keep))
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Renamed out of the way first, so readers see the whole entry or none of it
+            doomed_dir = f'{entry_dir}.{os.getpid()}.{threading.get_ident()}.evicted.tmp'
+            try:
+                os.rename(entry_dir, doomed_dir)
+            except OSError:
+                pass  # Removed by another process meanwhile
+            else:
+                shutil.rmtree(doomed_dir, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        entries = self.keys()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(_dir_size(self.entry_dir(key)) for key in entries),
+        }
+
+
+def link_file(source, target):
+    """
+    Places source at target, replacing it, as a hard link or as a copy where links are not possible.
+    A linked or copied file outlives the cache entry it came from. Raises FileNotFoundError if source
+    is gone, e.g. evicted by another process.
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from utils.process_pool import SpawnPool
+
+# Job settings, overridable through the environment
+JOBS_FOLDER = os.environ.get('TERRAINXACT_JOBS_FOLDER', 'jobs')
+JOB_WORKERS = int(os.environ.get('TERRAINXACT_JOB_WORKERS', 2))  # Jobs processed at the same time
+JOB_QUEUE_DEPTH = int(os.environ.get('TERRAINXACT_JOB_QUEUE_DEPTH', 8))  # Jobs allowed to wait for a worker
+JOB_TTL_SECONDS = int(os.environ.get('TERRAINXACT_JOB_TTL_SECONDS', 24 * 3600))  # Age at which finished jobs are removed
+
+STATUS_FILE = 'status.json'
+RESULT_DIR = 'result'
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while every worker and queue slot is taken."""
+
+
+class JobProgress:
+    """Picklable progress callback handed to job functions; writes the job's stage and percent to its status file."""
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+
+    def __call__(self, stage, percent):
+        write_status(self.job_dir, state='running', stage=stage, percent=round(percent, 1))
+
+
+def write_status(job_dir, **fields):
+    """Merges fields into the job's status file, replacing it atomically so readers never see a partial file."""
+    status_path = os.path.join(job_dir, STATUS_FILE)
+    status = {}
+    if os.path.exists(status_path):
+        with open(status_path) as f:
+            status = json.load(f)
+    status.update(fields, updated=time.time())
+    tmp_path = f'{status_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, status_path)
+
+
+def _run_job(job_dir, fn, args, kwargs):
+    """Runs one job in a worker process, recording progress, the result files or the error in the job directory."""
+    write_status(job_dir, state='running', stage='starting', percent=0)
+    result_dir = os.path.join(job_dir, RESULT_DIR)
+    os.makedirs(result_dir, exist_ok=True)
+    try:
+        summary = fn(*args, result_dir=result_dir, progress=JobProgress(job_dir), **kwargs)
+    except Exception as e:
+        write_status(job_dir, state='failed', error=str(e))
+        raise
+    # A dict returned by the job (e.g. cache statistics) is published with its status
+    write_status(job_dir, state='done', stage='done', percent=100, **(summary if isinstance(summary, dict) else {}))
+
+
+class JobManager:
+    """
+    Runs long processing jobs in a bounded process pool.
+
+    Each job gets a directory under jobs_folder holding a status file and, once finished, its result
+    files, which are zipped on the fly when downloaded. Status lives on disk so any web worker can answer a status poll or serve the result. At most
+    `workers` jobs run at once and at most `queue_depth` more wait; further submissions are refused
+    with QueueFullError so a burst of large parcels cannot pile up without bound.
+    """
+
+    def __init__(self, jobs_folder=JOBS_FOLDER, workers=JOB_WORKERS, queue_depth=JOB_QUEUE_DEPTH,
+                 ttl_seconds=JOB_TTL_SECONDS):
+        self.jobs_folder = jobs_folder
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.ttl_seconds = ttl_seconds
+        self._pool = SpawnPool(workers)  # Started on the first submit, so importing the app never starts workers
+        self._pending = set()
+        self._lock = threading.Lock()
+        os.makedirs(jobs_folder, exist_ok=True)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn(*args, result_dir=..., progress=..., **kwargs) and returns the new job ID.
+        fn writes the files to hand back to the user into result_dir, named as they should appear in the zip,
+        and may return a dict of extra fields to publish in the job's status.
+        fn must be a module-level function so it can be sent to a worker process.
+        """
+        self.purge_expired()
+        with self._lock:
+            self._pending = {future for future in self._pending if not future.done()}
+            if len(self._pending) >= self.workers + self.queue_depth:
+                raise QueueFullError("The processing queue is full, please try again later.")
+
+            job_id = uuid.uuid4().hex
+            job_dir = self.job_dir(job_id)
+            os.makedirs(job_dir)
+            write_status(job_dir, state='queued', stage='queued', percent=0, created=time.time())
+            future = self._pool.submit(_run_job, job_dir, fn, args, kwargs)
+            future.add_done_callback(lambda f, job_dir=job_dir: self._record_crash(f, job_dir))
+            self._pending.add(future)
+        return job_id
+
+    @staticmethod
+    def _record_crash(future, job_dir):
+        # A worker that dies (e.g. out of memory) never reaches write_status itself
+        if future.exception() is not None and read_status_file(job_dir).get('state') != 'failed':
+            write_status(job_dir, state='failed', error=str(future.exception()))
+
+    def job_dir(self, job_id):
+        if not job_id or any(ch not in '0123456789abcdef' for ch in job_id):
+            raise ValueError("Invalid job ID.")
+        return os.path.join(self.jobs_folder, job_id)
+
+    def status(self, job_id):
+        """Returns the job's status dict, or None if the job does not exist."""
+        job_dir = self.job_dir(job_id)
+        if not os.path.isdir(job_dir):
+            return None
+        return read_status_file(job_dir)
+
+    def result_dir(self, job_id):
+        """Returns the finished job's result directory, or None if it is not ready."""
+        status = self.status(job_id)
+        if not status or status.get('state') != 'done':
+            return None
+        return os.path.join(self.job_dir(job_id), RESULT_DIR)
+
+    def purge_expired(self):
+        """Removes job directories that have not been updated for ttl_seconds."""
+        now = time.time()
+        for job_id in os.listdir(self.jobs_folder):
+            job_dir = os.path.join(self.jobs_folder, job_id)
+            status = read_status_file(job_dir)
+            if status.get('state') in ('done', 'failed') and now - status.get('updated', now) > self.ttl_seconds:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def read_status_file(job_dir):
+    status_path = os.path.join(job_dir, STATUS_FILE)
+    try:
+        with open(status_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -1,6 +1,6 @@
 import xml.etree.ElementTree as ET
 from osgeo import gdal, osr
-from pyproj import Transformer
+from utils.crs_cache import get_transformer
 
 # Function to read coordinates and attributes from KML file
 def get_kml_data(kml_file):
@@ -42,7 +42,7 @@ def transform_kml_data(kml_data, geotiff_path):
     destination_crs = src_proj.GetAuthorityCode(None)  # Extracts the EPSG code
 
     # Create a transformer object
-    transformer = Transformer.from_crs(source_crs, f'EPSG:{destination_crs}')
+    transformer = get_transformer(source_crs, f'EPSG:{destination_crs}')
 
     # Transform the coordinates
     transformed_data = []
@@ -0,0 +1,231 @@
+import os
+import struct
+import numpy as np
+
+POINT_FORMATS = ('csv', 'npy', 'parquet', 'laz')
+BINARY_POINT_FORMATS = ('npy', 'parquet', 'laz')  # CSV is kept for PVsyst; these are for other tools
+POINT_EXTENSIONS = {'csv': '.csv', 'npy': '.npy', 'parquet': '.parquet', 'laz': '.laz'}
+CSV_ROW = "{},{},{}\n"
+NPY_HEADER_BYTES = 128  # Fixed .npy header size, so the point count can be filled in once the points are written
+LAZ_SCALE = 0.001  # LAZ stores coordinates as integers; millimetres keep the 3 decimals of the CSV exports
+# Largest LAZ export written through PDAL, which needs every point in one array; laspy streams any size
+LAZ_MAX_POINTS = int(os.environ.get('TERRAINXACT_LAZ_MAX_POINTS', 20_000_000))
+POINT_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8')])  # 24 bytes per point
+
+
+def point_array(points):
+    """
+    Points as a 1-D POINT_DTYPE array. POINT_DTYPE arrays are returned as they are and C-ordered
+    (N,3) float64 arrays (including memory maps) are viewed without a copy; anything else, e.g. a
+    list of (x, y, z) tuples, is converted once.
+    """
+    if isinstance(points, np.ndarray) and points.dtype == POINT_DTYPE:
+        return points
+    coords = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+    return coords.view(POINT_DTYPE)[:, 0]
+
+
+def point_coords(points):
+    """(N,3) float64 view of the x, y, z of a point array, for vectorized geometry."""
+    return point_array(points).view(np.float64).reshape(-1, 3)
+
+
+def point_format_for(path):
+    """Point format of a path, from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, fmt_extension in POINT_EXTENSIONS.items():
+        if extension == fmt_extension:
+            return fmt
+    raise ValueError(f"Point files must end in one of {', '.join(POINT_EXTENSIONS.values())}.")
+
+
+def write_points_csv(points, csv_file, row=CSV_ROW):
+    """Streams (xs, ys, zs) chunks to an open text file as X,Y,Z rows and returns the number of rows."""
+    count = 0
+    csv_file.write("X,Y,Z\n")
+    for xs, ys, zs in points:
+        # tolist() yields Python scalars, keeping the repr of each value identical to an f-string row
+        csv_file.writelines(map(row.format, xs.tolist(), ys.tolist(), zs.tolist()))
+        count += len(zs)
+    return count
+
+
+def _npy_header(count):
+    """Version 1.0 .npy header of a C-ordered (count, 3) float64 array, padded to NPY_HEADER_BYTES."""
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, 3), }" % count
+    header_len = NPY_HEADER_BYTES - 10
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', header_len) + header.ljust(header_len - 1).encode('latin1') + b'\n'
+
+
+def write_points_npy(points, npy_path):
+    """
+    Streams (xs, ys, zs) chunks to a .npy file holding one (N,3) float64 array. The header is written
+    with a zero count first and rewritten once the number of points is known, so the points are
+    never held in memory all at once.
+    """
+    count = 0
+    with open(npy_path, 'wb') as npy_file:
+        npy_file.write(_npy_header(0))
+        for xs, ys, zs in points:
+            npy_file.write(np.column_stack((xs, ys, zs)).astype('<f8', copy=False).tobytes())
+            count += len(zs)
+        npy_file.seek(0)
+        npy_file.write(_npy_header(count))
+    return count
+
+
+def write_points_parquet(points, parquet_path):
+    """Streams (xs, ys, zs) chunks to a Parquet file with float64 X, Y and Z columns, one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([('X', pa.float64()), ('Y', pa.float64()), ('Z', pa.float64())])
+    count = 0
+    with pq.ParquetWriter(parquet_path, schema, compression='zstd') as writer:
+        for xs, ys, zs in points:
+            writer.write_table(pa.table([np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64),
+                                         np.asarray(zs, dtype=np.float64)], schema=schema))
+            count += len(zs)
+    return count
+
+
+def write_points_laz(points, laz_path, srs=None):
+    """
+    Writes (xs, ys, zs) chunks to a LAZ point cloud at LAZ_SCALE precision, with srs (anything pyproj
+    or PDAL accepts, e.g. WKT or 'EPSG:32633') as its coordinate system.
+
+    With laspy (and its lazrs or laszip backend) installed, each chunk is compressed and written as it
+    arrives. Otherwise the file is written with PDAL, which takes the points as a single array, so
+    exports of more than LAZ_MAX_POINTS points are refused with a ValueError.
+    """
+    try:
+        import laspy
+    except ImportError:
+        return _write_points_laz_pdal(points, laz_path, srs)
+
+    # Empty windows (e.g. no canopy) are dropped, so the offsets come from the first chunk with points
+    chunks = (chunk for chunk in points if len(chunk[2]))
+    first = next(chunks, None)
+    header = laspy.LasHeader(point_format=6, version='1.4')
+    header.scales = np.array([LAZ_SCALE] * 3)
+    # Coordinates are stored as int32 relative to the offsets, which must be known before the first chunk
+    # is written; projected northings of millions of metres would overflow against a zero offset
+    header.offsets = np.zeros(3)
+    if first is not None:
+        header.offsets = np.floor([np.min(column) for column in first])
+    if srs:
+        from utils.crs_cache import get_crs
+        header.add_crs(get_crs(srs))
+
+    count = 0
+    with laspy.open(laz_path, mode='w', header=header, do_compress=True) as writer:
+        for xs, ys, zs in _chain_first(first, chunks):
+            record = laspy.ScaleAwarePointRecord.zeros(len(zs), header=header)
+            record.x, record.y, record.z = xs, ys, zs
+            writer.write_points(record)
+            count += len(zs)
+    return count
+
+
+def _chain_first(first, chunks):
+    """The chunks of an iterator whose first chunk (None if it had none) was already taken."""
+    if first is not None:
+        yield first
+    yield from chunks
+
+
+def _write_points_laz_pdal(points, laz_path, srs=None):
+    """write_points_laz through PDAL, for up to LAZ_MAX_POINTS points gathered into one array."""
+    chunks = []
+    count = 0
+    for xs, ys, zs in points:
+        count += len(zs)
+        if count > LAZ_MAX_POINTS:
+            raise ValueError(f"LAZ exports of more than {LAZ_MAX_POINTS} points need laspy; "
+                             f"install laspy[lazrs] or export npy or parquet instead.")
+        chunks.append((xs, ys, zs))
+
+    array = np.zeros(count, dtype=[('X', '<f8'), ('Y', '<f8'), ('Z', '<f8')])
+    start = 0
+    chunks.reverse()
+    while chunks:
+        xs, ys, zs = chunks.pop()  # Released as they are copied in
+        array['X'][start:start + len(zs)] = xs
+        array['Y'][start:start + len(zs)] = ys
+        array['Z'][start:start + len(zs)] = zs
+        start += len(zs)
+
+    import pdal
+    options = {'filename': laz_path, 'compression': True, 'scale_x': LAZ_SCALE, 'scale_y': LAZ_SCALE,
+               'scale_z': LAZ_SCALE, 'offset_x': 'auto', 'offset_y': 'auto', 'offset_z': 'auto'}
+    if srs:
+        options['a_srs'] = srs
+    pdal.Writer.las(**options).pipeline(array).execute()
+    return count
+
+
+def write_points(points, path, fmt=None, srs=None, csv_row=CSV_ROW):
+    """
+    Writes (xs, ys, zs) chunks of points to path in one of POINT_FORMATS, by default the one its
+    extension names. CSV rows are formatted with csv_row; srs is only stored by LAZ.
+    Returns the number of points written.
+    """
+    fmt = fmt or point_format_for(path)
+    if fmt not in POINT_FORMATS:
+        raise ValueError(f"Point format must be one of {', '.join(POINT_FORMATS)}.")
+    if fmt == 'npy':
+        return write_points_npy(points, path)
+    if fmt == 'parquet':
+        return write_points_parquet(points, path)
+    if fmt == 'laz':
+        return write_points_laz(points, path, srs)
+    with open(path, 'w', newline='') as csv_file:
+        return write_points_csv(points, csv_file, csv_row)
+
+
+def _columns_to_points(columns):
+    """Fills a POINT_DTYPE array from x, y and z column arrays."""
+    points = np.empty(len(columns[0]), dtype=POINT_DTYPE)
+    for name, column in zip(POINT_DTYPE.names, columns):
+        points[name] = column
+    return points
+
+
+def read_points_csv(csv_path):
+    """Reads an X,Y,Z CSV (columns in any order, found by their header) into a POINT_DTYPE array."""
+    with open(csv_path, newline='') as csv_file:
+        header = [name.strip() for name in csv_file.readline().split(',')]
+        usecols = [header.index(name) for name in ('X', 'Y', 'Z')]
+        coords = np.loadtxt(csv_file, delimiter=',', usecols=usecols, dtype=np.float64, ndmin=2)
+    return point_array(coords)
+
+
+def read_points(path, fmt=None):
+    """
+    Reads a point file written by write_points as a POINT_DTYPE array.
+    .npy files are memory-mapped read-only and viewed as points, so they are paged in from disk as
+    they are used rather than copied into memory.
+    """
+    fmt = fmt or point_format_for(path)
+    if fmt == 'npy':
+        return point_array(np.load(path, mmap_mode='r'))
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=['X', 'Y', 'Z'])
+        return _columns_to_points([table.column(name).to_numpy() for name in ('X', 'Y', 'Z')])
+    if fmt == 'laz':
+        try:
+            import laspy
+        except ImportError:
+            laspy = None
+        if laspy is not None:
+            las = laspy.read(path)
+            return _columns_to_points([las.x, las.y, las.z])
+        import pdal
+        pipeline = pdal.Reader.las(filename=path).pipeline()
+        pipeline.execute()
+        array = pipeline.arrays[0]
+        return _columns_to_points([array['X'], array['Y'], array['Z']])
+    if fmt == 'csv':
+        return read_points_csv(path)
+    raise ValueError(f"Point format must be one of {', '.join(POINT_FORMATS)}.")
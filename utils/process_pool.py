@@ -0,0 +1,42 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def spawn_pool(workers):
+    """
+    Process pool whose workers are started with spawn rather than fork, so they begin from a fresh
+    interpreter instead of inheriting the parent's GDAL/PDAL state (open datasets, caches, threads).
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+class SpawnPool:
+    """
+    A spawn_pool shared by the callers of submit. It is created on first use, so importing a module
+    never starts processes, and replaced by a fresh one when a worker dies (e.g. killed for memory)
+    and takes the pool down with it.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._executor is None:
+                self._executor = spawn_pool(self.workers)
+            try:
+                return self._executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                self._executor.shutdown(wait=False)
+                self._executor = spawn_pool(self.workers)
+                return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+                self._executor = None
@@ -0,0 +1,110 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.process_pool import spawn_pool
+
+STAGE_THREADS = int(os.environ.get('TERRAINXACT_STAGE_THREADS', 4))  # Thread stages run at the same time
+STAGE_PROCESSES = int(os.environ.get('TERRAINXACT_STAGE_PROCESSES', 2))  # Process stages run at the same time
+
+EXECUTORS = ('thread', 'process')
+
+
+class Stage:
+    """
+    One step of a stage graph.
+
+    fn is called with the results of the stages named in deps, in that order, once they have all
+    finished. Thread stages share the caller's memory; process stages suit CPU-bound pure-Python work
+    that holds the GIL, and need fn and the dependency results to be picklable (a module-level
+    function, or a functools.partial of one).
+    """
+
+    def __init__(self, name, fn, deps=(), executor='thread'):
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {EXECUTORS}.")
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.executor = executor
+
+
+class StageGraphError(Exception):
+    """Raised for a graph with unknown dependencies or cycles."""
+
+
+def check_stage_graph(stages):
+    """Raises StageGraphError unless every dependency exists and the graph has no cycles."""
+    names = {stage.name for stage in stages}
+    if len(names) != len(stages):
+        raise StageGraphError("Stage names must be unique.")
+    for stage in stages:
+        missing = set(stage.deps) - names
+        if missing:
+            raise StageGraphError(f"Stage {stage.name} depends on unknown stages {sorted(missing)}.")
+    done = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if set(stage.deps) <= done]
+        if not ready:
+            raise StageGraphError(f"Stages {sorted(stage.name for stage in remaining)} form a cycle.")
+        done.update(stage.name for stage in ready)
+        remaining = [stage for stage in remaining if stage.name not in done]
+
+
+def run_stage_graph(stages, thread_workers=STAGE_THREADS, process_workers=STAGE_PROCESSES, on_start=None,
+                    on_finish=None):
+    """
+    Runs a list of Stages, starting each one as soon as its dependencies have finished, so independent
+    stages overlap. Each stage runs on the executor it names. A stage that raises does not stop the
+    others, but the stages depending on it are skipped.
+
+    on_start(name) and on_finish(name, error) are called from this thread as stages start and finish.
+
+    Returns:
+        results (dict): Stage name -> return value, for the stages that succeeded
+        errors (dict): Stage name -> exception, for the stages that failed or were skipped
+    """
+    check_stage_graph(stages)
+    results = {}
+    errors = {}
+    pending = list(stages)
+    running = {}
+
+    use_processes = any(stage.executor == 'process' for stage in stages)
+    threads = ThreadPoolExecutor(max_workers=thread_workers)
+    processes = spawn_pool(process_workers) if use_processes else None  # Only started if a stage needs it
+    try:
+        while pending or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for stage in list(pending):
+                    failed = [dep for dep in stage.deps if dep in errors]
+                    if failed:
+                        pending.remove(stage)
+                        errors[stage.name] = RuntimeError(f"Skipped because {', '.join(failed)} failed.")
+                        if on_finish:
+                            on_finish(stage.name, errors[stage.name])
+                        progressed = True
+                    elif all(dep in results for dep in stage.deps):
+                        pending.remove(stage)
+                        if on_start:
+                            on_start(stage.name)
+                        executor = processes if stage.executor == 'process' else threads
+                        running[executor.submit(stage.fn, *(results[dep] for dep in stage.deps))] = stage.name
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+                if on_finish:
+                    on_finish(name, errors.get(name))
+    finally:
+        threads.shutdown(wait=True)
+        if processes is not None:
+            processes.shutdown(wait=True)
+    return results, errors
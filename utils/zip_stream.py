@@ -0,0 +1,59 @@
+import os
+import zipfile
+from flask import Response
+
+ZIP_CHUNK_SIZE = 1 << 20  # Bytes read from each file at a time
+
+
+class _ChunkSink:
+    """Write-only file object that collects what zipfile writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_zip(files, compression=zipfile.ZIP_STORED, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Generates a zip archive of files, a list of (path, arcname), as a sequence of byte chunks.
+
+    Each file is read from disk chunk_size bytes at a time and its compressed bytes are yielded as
+    soon as zipfile produces them, so memory use does not depend on the size of the files and no
+    zip is written to disk. The sizes and CRCs go in data descriptors, as for any unseekable output.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as zipf:
+        for path, arcname in files:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = compression
+            with open(path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def directory_files(directory):
+    """Lists the files directly inside directory as (path, arcname) pairs, sorted by name."""
+    return [(os.path.join(directory, name), name) for name in sorted(os.listdir(directory))
+            if os.path.isfile(os.path.join(directory, name))]
+
+
+def zip_response(files, download_name):
+    """Flask response streaming a zip of files, a list of (path, arcname), as an attachment."""
+    return Response(stream_zip(files), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})